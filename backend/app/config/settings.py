@@ -7,15 +7,84 @@ load_dotenv()
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Startup Configuration
+# Build API clients during startup so the first request does not pay for them.
+# Processes that only serve meeting/document endpoints can set this to false.
+PRELOAD_CLIENTS = os.getenv("PRELOAD_CLIENTS", "true").lower() == "true"
+# Make a cheap call to each backend at startup to open connections ahead of traffic
+WARM_UP_CLIENTS = os.getenv("WARM_UP_CLIENTS", "false").lower() == "true"
+
+# HTTP Connection Pool Configuration
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+HTTP_KEEPALIVE_EXPIRY = 30  # Seconds an idle connection is kept open
+
 # LM Studio Configuration
-LM_STUDIO_URL = "http://127.0.0.1:1234/v1/chat/completions"
+LM_STUDIO_BASE_URL = os.getenv("LM_STUDIO_BASE_URL", "http://127.0.0.1:1234/v1")
+LM_STUDIO_URL = f"{LM_STUDIO_BASE_URL}/chat/completions"
+LM_STUDIO_MODELS_URL = f"{LM_STUDIO_BASE_URL}/models"
 LM_STUDIO_HEADERS = {
     "Content-Type": "application/json"
 }
 
+# LLM Admission Control
+# Per-backend concurrency and queue limits. LM Studio serves one generation at
+# a time well, so local requests are serialized and only a short queue is kept.
+LLM_ADMISSION = {
+    "local": {
+        "max_concurrency": int(os.getenv("LM_STUDIO_MAX_CONCURRENCY", "1")),
+        "max_queue": int(os.getenv("LM_STUDIO_MAX_QUEUE", "8")),
+        "batch_max_queue": int(os.getenv("LM_STUDIO_BATCH_MAX_QUEUE", "2")),
+        "max_wait": float(os.getenv("LM_STUDIO_MAX_WAIT", "60")),
+    },
+    "openai": {
+        "max_concurrency": int(os.getenv("OPENAI_MAX_CONCURRENCY", "32")),
+        "max_queue": int(os.getenv("OPENAI_MAX_QUEUE", "128")),
+        "batch_max_queue": int(os.getenv("OPENAI_BATCH_MAX_QUEUE", "32")),
+        "max_wait": float(os.getenv("OPENAI_MAX_WAIT", "30")),
+    },
+}
+
+# LLM Backend Health
+CIRCUIT_FAILURE_THRESHOLD = 3  # Consecutive failures before a backend's circuit opens
+CIRCUIT_RESET_TIMEOUT = 10  # Seconds before the first half-open trial call
+CIRCUIT_MAX_RESET_TIMEOUT = 120  # Upper bound for the backoff between trial calls
+LM_STUDIO_CONNECT_TIMEOUT = 2  # Seconds; a local server that doesn't accept connections is down
+HEALTH_MONITOR = os.getenv("HEALTH_MONITOR", "true").lower() == "true"
+HEALTH_CHECK_INTERVAL = int(os.getenv("HEALTH_CHECK_INTERVAL", "30"))
+# Send a one-token completion to LM Studio when idle so it keeps the model loaded
+LM_STUDIO_KEEPALIVE = os.getenv("LM_STUDIO_KEEPALIVE", "true").lower() == "true"
+
+# Model Routing (model_type "auto")
+ROUTING_EWMA_ALPHA = 0.2  # Weight of the newest sample in the latency and error averages
+ROUTING_PRIOR_LATENCY = {"local": 20.0, "openai": 8.0}  # Seconds assumed before any samples
+HEDGE_MIN_SAMPLES = 10  # Samples needed before a backend's p95 is trusted
+HEDGE_DEFAULT_DELAY = 15  # Seconds to wait before hedging while the p95 is unknown
+HEDGE_MIN_DELAY = 1  # Never hedge sooner than this
+
+# Logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" (key=value) or "json"
+LOG_MAX_FIELD_LENGTH = int(os.getenv("LOG_MAX_FIELD_LENGTH", "300"))  # Longer strings are truncated
+LOG_QUEUE_SIZE = 10000  # Records waiting for the writer thread; more are dropped, never blocking a request
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+# Request Tracing
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))  # Most recent traces kept in memory
+
 # Pinecone Configuration
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 INDEX_NAME = os.getenv("INDEX_NAME")
+PINECONE_HOST = os.getenv("PINECONE_HOST")  # Data-plane host override, e.g. Pinecone Local or a stub
+
+# RAG Ingestion Configuration
+RAG_CHUNK_TOKENS = 128  # Most tokens per chunk, about the 500 characters chunks used to be
+RAG_CHUNK_OVERLAP_TOKENS = 16  # Most tokens of whole sentences repeated from the previous chunk
+RAG_BATCH_SIZE = int(os.getenv("RAG_BATCH_SIZE", "100"))  # Chunks embedded and upserted together; bounds memory per upload
+RAG_NAMESPACE = os.getenv("RAG_NAMESPACE", "documents")  # Namespace for uploaded documents, apart from the lecture corpus
+RAG_MANIFEST_PATH = os.getenv("RAG_MANIFEST_PATH", "rag_manifest.json")  # Vector IDs written for each document
+RAG_DELETE_BATCH_SIZE = 1000  # Pinecone's limit on IDs per delete call
 
 # CORS Configuration
 CORS_ORIGINS = [
@@ -28,11 +97,53 @@ CORS_ORIGINS = [
 ]
 
 # Upload Configuration
-UPLOAD_DIR = "uploads"
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")  # Uploaded files are saved here
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Pagination Configuration
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# YouTube Transcript Configuration
+TRANSCRIPT_STORE_SIZE = int(os.getenv("TRANSCRIPT_STORE_SIZE", "200"))  # Videos kept in memory
+TRANSCRIPT_ERROR_TTL = int(os.getenv("TRANSCRIPT_ERROR_TTL", "300"))  # Seconds before a failed fetch is retried
+TRANSCRIPT_WINDOW_SECONDS = int(os.getenv("TRANSCRIPT_WINDOW_SECONDS", "60"))  # Length of the windows a transcript is indexed in
+TRANSCRIPT_FULL_TEXT_CHARS = int(os.getenv("TRANSCRIPT_FULL_TEXT_CHARS", "12000"))  # Shorter transcripts are sent whole
+TRANSCRIPT_CONTEXT_CHARS = int(os.getenv("TRANSCRIPT_CONTEXT_CHARS", "8000"))  # Budget for the windows sent with each question
+TRANSCRIPT_SEMANTIC_WEIGHT = 0.6  # Share of a window's score from embeddings; the rest is lexical (BM25)
+
+# Chat Session Configuration (document and YouTube chats)
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "2000"))  # Budget for the history sent with each turn
+SESSION_SUMMARY_TOKENS = 400  # Longest summary of older turns
+SESSION_STORE_SIZE = int(os.getenv("SESSION_STORE_SIZE", "1000"))  # Sessions kept in memory
+SESSION_TTL = int(os.getenv("SESSION_TTL", "86400"))  # Seconds an idle session is kept
+
+# Meeting Configuration
+MAX_RECURRING_SLOTS = 500  # Upper bound on slots created by one recurrence rule
+
 # In-memory storage
 # In a production environment, this would be a database
 professor_availabilities = []
 meeting_bookings = []
-documents_db = [] 
\ No newline at end of file
+documents_db = []
+
+# YouTube transcripts by video ID, least recently used first (see transcript_service)
+youtube_transcripts = {}
+
+# Chat sessions by ID, least recently used first (see session_service)
+chat_sessions = {}
+
+# Secondary indexes over the in-memory storage, kept in sync by the services.
+# Sorted indexes map each sort order to its items in ascending key order (see pagination.insert_sorted)
+availabilities_by_id = {}
+availabilities_sorted = {}
+availabilities_by_professor = {}  # Professor name -> sorted index
+documents_by_id = {}
+documents_sorted = {}
+documents_by_type = {}  # Document type -> sorted index
+
+# Incremented on every write to a store; used to build response ETags
+store_versions = {"documents": 0, "availabilities": 0, "bookings": 0}
+
+# Response Configuration
+COMPRESSION_MINIMUM_SIZE = 1000  # Bytes; smaller bodies are sent uncompressed 
\ No newline at end of file
@@ -1,16 +1,60 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
-import os
+from fastapi.middleware.gzip import GZipMiddleware
 
 # Import routes
-from .routes import chat_routes, document_routes, meeting_routes
+from .routes import chat_routes, document_routes, meeting_routes, debug_routes
 
 # Import config
-from .config.settings import CORS_ORIGINS, OPENAI_API_KEY
+from .config.settings import CORS_ORIGINS, PRELOAD_CLIENTS, WARM_UP_CLIENTS, INDEX_NAME, HEALTH_MONITOR, COMPRESSION_MINIMUM_SIZE, TRACING_ENABLED
+from .services.admission_service import get_admission_stats
+from .services.client_registry import registry
+from .services.health_service import run_health_monitor, get_backend_health
+from .services.routing_service import get_routing_stats
+from .services.session_service import get_session_stats
+from .services.transcript_service import get_transcript_stats
+from .utils.http import FastJSONResponse
+from .utils.log import get_logging_stats
+from .utils.metrics import render_metrics, get_prompt_cache_stats
+from .utils.tracing import TracingMiddleware
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build shared API clients and start the backend health monitor; clean both up on shutdown"""
+    if PRELOAD_CLIENTS:
+        await registry.startup(
+            index_names=[INDEX_NAME] if INDEX_NAME else [],
+            warm_up=WARM_UP_CLIENTS
+        )
+    health_monitor = asyncio.create_task(run_health_monitor()) if HEALTH_MONITOR else None
+    yield
+    if health_monitor:
+        health_monitor.cancel()
+        await asyncio.gather(health_monitor, return_exceptions=True)
+    await registry.shutdown()
 
 # Create FastAPI app
-app = FastAPI(title="TutorAI API", description="API for the TutorAI educational platform")
+app = FastAPI(
+    title="TutorAI API",
+    description="API for the TutorAI educational platform",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
+)
+
+# Compress large responses, preferring brotli when it is installed and the client accepts it
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(
+        BrotliMiddleware,
+        minimum_size=COMPRESSION_MINIMUM_SIZE,
+        gzip_fallback=True,
+        excluded_handlers=[r"/stream$"]  # Server-sent events must not be buffered by the compressor
+    )
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
 
 # Configure CORS
 app.add_middleware(
@@ -21,21 +65,42 @@ app.add_middleware(
     allow_methods=["GET", "POST", "OPTIONS", "DELETE"],
     allow_headers=["*"],
     max_age=86400,  # Cache preflight requests for 24 hours
+    expose_headers=["X-Trace-Id"],
 )
 
-# Initialize OpenAI client (for imports that might need it)
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Record a span waterfall for each API request (kept in memory, see /api/debug/traces)
+if TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware, exclude_prefixes=("/api/debug", "/api/health"))
 
 # Include all routers
 app.include_router(chat_routes.router)
 app.include_router(document_routes.router)
 app.include_router(meeting_routes.router)
+if TRACING_ENABLED:
+    app.include_router(debug_routes.router)
 
 # Simple health check route
 @app.get("/api/health", tags=["health"])
 async def health_check():
     """Check if the API is running"""
-    return {"status": "healthy", "version": "1.0.0"}
+    return {
+        "status": "healthy",
+        "version": "1.0.0",
+        "llm_backends": get_backend_health(),
+        "llm_queues": get_admission_stats(),
+        "llm_routing": get_routing_stats(),
+        "llm_prompt_cache": get_prompt_cache_stats(),
+        "youtube_transcripts": get_transcript_stats(),
+        "chat_sessions": get_session_stats(),
+        "logging": get_logging_stats()
+    }
+
+# Prometheus scrape endpoint: per-stage latency histograms and token counters
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Expose metrics in the Prometheus text format"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 # Placeholder for knowledge graph endpoint
 # This could be expanded in the future
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 
 class Professor(BaseModel):
     name: str
@@ -14,6 +14,17 @@ class ProfessorAvailability(BaseModel):
     end_time: str
     meeting_link: Optional[str] = None
     is_booked: bool = False
+
+class RecurringAvailability(BaseModel):
+    professor_name: str
+    start_date: str  # YYYY-MM-DD, first day of the recurrence window
+    end_date: str  # YYYY-MM-DD, last day of the recurrence window (inclusive)
+    weekdays: List[int]  # 0 = Monday ... 6 = Sunday
+    start_time: str  # HH:MM
+    end_time: str  # HH:MM
+    interval_weeks: int = 1  # 1 = every week, 2 = every other week, ...
+    exclude_dates: List[str] = []  # Holidays, reading weeks, etc.
+    meeting_link: Optional[str] = None  # Shared link for every slot; generated per slot if omitted
     
 class MeetingBooking(BaseModel):
     availability_id: str
@@ -27,19 +38,46 @@ class ChatRequest(BaseModel):
     model_type: str
     professor: Professor
     enable_search: bool = False  # Toggle web search
+    priority: Literal["interactive", "batch"] = "interactive"  # Admission priority for the LLM queue
+    fallback: bool = True  # With model_type "auto", retry on another model after a failure
+    hedge: bool = True  # With model_type "auto", race a second model when the first is slow
     
 class YoutubeChatRequest(BaseModel):
     youtube_url: str
     video_title: str = "Educational Video"
     message: str
-    previous_messages: list = []
+    session_id: Optional[str] = None  # From the previous turn's response; omit to start a session
+    previous_messages: list = []  # Deprecated: only seeds a new session
 
 class DocumentChatRequest(BaseModel):
     document_id: str
     document_url: str
     document_title: str
     message: str
-    previous_messages: list = []
+    session_id: Optional[str] = None  # From the previous turn's response; omit to start a session
+    previous_messages: list = []  # Deprecated: only seeds a new session
+
+class ChatSocketStart(BaseModel):
+    """First message on /api/chat/ws: what the session is about"""
+    kind: Literal["chat", "document", "youtube"] = "chat"
+    session_id: Optional[str] = None  # Resume an existing session
+    # kind "chat"
+    professor: Optional[Professor] = None
+    model_type: str = "openai"
+    enable_search: bool = False
+    priority: Literal["interactive", "batch"] = "interactive"
+    # kind "document"
+    document_id: Optional[str] = None
+    document_url: Optional[str] = None
+    document_title: Optional[str] = None
+    # kind "youtube"
+    youtube_url: Optional[str] = None
+    video_title: str = "Educational Video"
+
+class RemoveFromRAGRequest(BaseModel):
+    document_id: str  # ID the document was added to RAG with
+    file_path: Optional[str] = None
+    title: Optional[str] = None
 
 class DocumentResponse(BaseModel):
     document_id: str
@@ -1,51 +1,231 @@
-from fastapi import APIRouter, HTTPException
-from ..models.schemas import ChatRequest, DocumentChatRequest, YoutubeChatRequest
-from ..services.chat_service import process_chat_request, process_document_chat, process_youtube_chat
+import asyncio
+import contextvars
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from ..models.schemas import ChatRequest, ChatSocketStart, DocumentChatRequest, YoutubeChatRequest
+from ..services.chat_service import (
+    process_chat_request, stream_chat_request, process_document_chat, process_youtube_chat,
+    stream_document_chat, stream_youtube_chat
+)
+from ..services.session_service import open_session, get_session, delete_session
+from ..utils.helpers import extract_youtube_video_id
+from ..utils.http import cancel_on_disconnect, sse_event
+from ..utils.log import get_logger
+from ..utils.tracing import start_trace
+
+logger = get_logger(__name__)
 
 router = APIRouter(prefix="/api", tags=["chat"])
 
 @router.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """
     Process a chat request with an AI professor.
     """
     try:
-        return await process_chat_request(
+        return await cancel_on_disconnect(http_request, process_chat_request(
             message=request.message,
             model_type=request.model_type,
             professor=request.professor.dict(),
-            enable_search=request.enable_search
-        )
+            enable_search=request.enable_search,
+            priority=request.priority,
+            fallback=request.fallback,
+            hedge=request.hedge
+        ))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """
+    Process a chat request with an AI professor, streaming the response as server-sent events.
+    Generation stops as soon as the client disconnects.
+    """
+    events = stream_chat_request(
+        message=request.message,
+        model_type=request.model_type,
+        professor=request.professor.dict(),
+        enable_search=request.enable_search,
+        priority=request.priority,
+        is_disconnected=http_request.is_disconnected
+    )
+    
+    async def event_stream():
+        async for event in events:
+            yield sse_event(event)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/document-chat")
-async def document_chat(request: DocumentChatRequest):
+async def document_chat(request: DocumentChatRequest, http_request: Request):
     """
     Chat with an AI professor about a specific document.
     """
     try:
-        return await process_document_chat(
+        return await cancel_on_disconnect(http_request, process_document_chat(
             document_id=request.document_id,
             document_url=request.document_url,
             document_title=request.document_title,
             message=request.message,
+            session_id=request.session_id,
             previous_messages=request.previous_messages
-        )
+        ))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/youtube-chat")
-async def youtube_chat(request: YoutubeChatRequest):
+async def youtube_chat(request: YoutubeChatRequest, http_request: Request):
     """
     Chat with an AI professor about a YouTube video.
     """
     try:
-        return await process_youtube_chat(
+        return await cancel_on_disconnect(http_request, process_youtube_chat(
             youtube_url=request.youtube_url,
             video_title=request.video_title,
             message=request.message,
+            session_id=request.session_id,
             previous_messages=request.previous_messages
-        )
+        ))
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e)) 
+
+@router.get("/sessions/{session_id}")
+async def get_chat_session(session_id: str):
+    """
+    Get the turn log and running summary of a document or YouTube chat session.
+    """
+    return get_session(session_id)
+
+@router.delete("/sessions/{session_id}")
+async def delete_chat_session(session_id: str):
+    """
+    Delete a document or YouTube chat session.
+    """
+    return delete_session(session_id)
+
+def _open_socket_session(start: ChatSocketStart) -> dict:
+    """Open the session a WebSocket chat is about, checking the fields its kind needs."""
+    if start.kind == "chat":
+        if start.professor is None:
+            raise HTTPException(status_code=400, detail="professor is required for kind 'chat'")
+        return open_session(start.session_id, "chat", start.professor.name)
+    if start.kind == "document":
+        if not (start.document_id and start.document_url and start.document_title):
+            raise HTTPException(status_code=400, detail="document_id, document_url and document_title are required for kind 'document'")
+        return open_session(start.session_id, "document", start.document_id)
+    if not start.youtube_url:
+        raise HTTPException(status_code=400, detail="youtube_url is required for kind 'youtube'")
+    return open_session(start.session_id, "youtube", extract_youtube_video_id(start.youtube_url) or start.youtube_url)
+
+def _turn_events(start: ChatSocketStart, session: dict, message: str):
+    """Event stream for one turn of a WebSocket chat."""
+    if start.kind == "chat":
+        return stream_chat_request(
+            message=message,
+            model_type=start.model_type,
+            professor=start.professor.dict(),
+            enable_search=start.enable_search,
+            priority=start.priority,
+            session=session
+        )
+    if start.kind == "document":
+        return stream_document_chat(start.document_id, start.document_url, start.document_title, message, session)
+    return stream_youtube_chat(start.youtube_url, start.video_title, message, session)
+
+@router.websocket("/chat/ws")
+async def chat_socket(websocket: WebSocket):
+    """
+    Multi-turn chat with an AI professor over one WebSocket.
+    
+    The first message opens (or resumes) a session:
+    {"type": "start", "kind": "chat" | "document" | "youtube", ...}, with the
+    fields of ChatSocketStart; the server answers {"type": "session", "session_id"}.
+    After that, {"type": "message", "message": "..."} starts a turn, whose events
+    (those of /api/chat/stream, tokens split into "thinking" and "final" channels)
+    are sent tagged with the turn number; {"type": "cancel"} stops the turn being
+    generated, and {"type": "ping"} is answered with {"type": "pong"}.
+    """
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+    turn_task = None
+    turns = 0
+    
+    async def send(event: dict):
+        # The turn task and the receive loop both send
+        async with send_lock:
+            await websocket.send_json(event)
+    
+    async def run_turn(turn: int, message: str):
+        trace = start_trace("WS /api/chat/ws", method="WS", path="/api/chat/ws", kind=start.kind, turn=turn)
+        status = 200
+        try:
+            await send({"type": "turn", "turn": turn, "trace_id": trace.trace_id if trace else None})
+            async for event in _turn_events(start, session, message):
+                if event["type"] == "error":
+                    status = event.get("status_code", 500)
+                await send({**event, "turn": turn})
+        except asyncio.CancelledError:
+            status = 499
+            await send({"type": "cancelled", "turn": turn})
+        finally:
+            if trace:
+                trace.finish(status)
+    
+    try:
+        try:
+            first = await websocket.receive_json()
+            if not isinstance(first, dict) or first.get("type") != "start":
+                raise HTTPException(status_code=400, detail="The first message must be {\"type\": \"start\", ...}")
+            start = ChatSocketStart(**{k: v for k, v in first.items() if k != "type"})
+            session = _open_socket_session(start)
+        except ValueError as e:
+            # Malformed JSON, or fields that don't validate (ValidationError is a ValueError)
+            detail = e.errors(include_url=False, include_context=False) if isinstance(e, ValidationError) else "Messages must be JSON objects"
+            await websocket.send_json({"type": "error", "status_code": 422, "detail": detail})
+            await websocket.close(code=1008)
+            return
+        except HTTPException as e:
+            await websocket.send_json({"type": "error", "status_code": e.status_code, "detail": e.detail})
+            await websocket.close(code=1008)
+            return
+        await send({"type": "session", "session_id": session["id"], "kind": start.kind})
+        
+        while True:
+            try:
+                incoming = await websocket.receive_json()
+            except ValueError:
+                await send({"type": "error", "status_code": 400, "detail": "Messages must be JSON objects"})
+                continue
+            kind = incoming.get("type") if isinstance(incoming, dict) else None
+            if kind == "message" and incoming.get("message"):
+                if turn_task and not turn_task.done():
+                    await send({"type": "error", "status_code": 409, "detail": "A response is still being generated. Cancel it or wait for it to finish."})
+                    continue
+                turns += 1
+                # Each turn gets its own trace
+                turn_task = asyncio.create_task(run_turn(turns, incoming["message"]), context=contextvars.Context())
+            elif kind == "cancel":
+                if turn_task and not turn_task.done():
+                    turn_task.cancel()
+            elif kind == "ping":
+                await send({"type": "pong"})
+            else:
+                await send({"type": "error", "status_code": 400, "detail": f"Unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        logger.info("Chat socket closed", turns=turns)
+    finally:
+        # Stops the upstream generation if the client went away mid-turn
+        if turn_task and not turn_task.done():
+            turn_task.cancel()
+            await asyncio.gather(turn_task, return_exceptions=True)
@@ -0,0 +1,33 @@
+import time
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse
+from typing import Optional
+from ..utils.tracing import list_traces, get_trace, export_traces
+
+router = APIRouter(prefix="/api/debug", tags=["debug"])
+
+@router.get("/traces")
+async def list_recent_traces(
+    min_duration_ms: float = Query(0, ge=0),
+    path: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500)
+):
+    """List recent request traces, newest first (e.g. min_duration_ms=10000 for slow ones)"""
+    return {"traces": list_traces(min_duration_ms=min_duration_ms, path=path, limit=limit)}
+
+@router.get("/traces/export")
+async def export_recent_traces(min_duration_ms: float = Query(0, ge=0)):
+    """Download the buffered traces as a JSON file (nothing is written on the server)"""
+    filename = f"traces-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    return JSONResponse(
+        export_traces(min_duration_ms=min_duration_ms),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/traces/{trace_id}")
+async def get_trace_waterfall(trace_id: str):
+    """Get one trace as a waterfall of nested spans"""
+    trace = get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (it may have been evicted)")
+    return trace
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Request
 from typing import Optional
-from ..services.document_service import process_document_upload, get_all_documents, get_document_by_id, add_to_rag
-from ..models.schemas import DocumentResponse
+from ..config.settings import DEFAULT_PAGE_SIZE, store_versions
+from ..services.document_service import process_document_upload, get_all_documents, get_document_by_id, add_to_rag, remove_from_rag
+from ..models.schemas import DocumentResponse, RemoveFromRAGRequest
+from ..utils.http import conditional_json
 
 router = APIRouter(prefix="/api", tags=["documents"])
 
@@ -27,17 +29,35 @@ async def upload_document(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/documents")
-async def list_documents():
-    """List all available classroom documents"""
-    return get_all_documents()
+async def list_documents(
+    request: Request,
+    doc_type: Optional[str] = Query(None, alias="type"),
+    sort: str = "upload_time",
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    fields: Optional[str] = None
+):
+    """List a page of available classroom documents"""
+    return conditional_json(request, (store_versions["documents"],), lambda: get_all_documents(
+        doc_type=doc_type,
+        sort=sort,
+        cursor=cursor,
+        limit=limit,
+        fields=fields
+    ))
 
 @router.get("/documents/{document_id}")
-async def get_document(document_id: str):
+async def get_document(request: Request, document_id: str):
     """Get a specific document by ID"""
-    return get_document_by_id(document_id)
+    return conditional_json(request, (store_versions["documents"],), lambda: get_document_by_id(document_id))
 
 @router.post("/add_to_rag")
-async def add_document_to_rag(file: UploadFile = File(...)):
+async def add_document_to_rag(file: UploadFile = File(...), document_id: str = Form(None)):
     """Add document to RAG system for retrieval"""
-    contents = await file.read()
-    return await add_to_rag(contents, file.filename) 
\ No newline at end of file
+    # The upload is spooled to disk past a size limit; it is read from there page by page
+    return await add_to_rag(file.file, file.filename, document_id)
+
+@router.post("/remove_from_rag")
+async def remove_document_from_rag(request: RemoveFromRAGRequest):
+    """Delete a document's vectors from the RAG system"""
+    return await remove_from_rag(request.document_id) 
\ No newline at end of file
@@ -1,14 +1,17 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from typing import Optional
-from ..models.schemas import ProfessorAvailability, MeetingBooking
+from ..config.settings import DEFAULT_PAGE_SIZE, store_versions
+from ..models.schemas import ProfessorAvailability, RecurringAvailability, MeetingBooking
 from ..services.meeting_service import (
     add_professor_availability,
+    add_recurring_availability,
     get_professor_availabilities,
     book_meeting,
     get_student_bookings,
     get_professor_bookings,
     cancel_booking
 )
+from ..utils.http import conditional_json
 
 router = APIRouter(prefix="/api", tags=["meetings"])
 
@@ -20,11 +23,42 @@ async def create_professor_availability(availability: ProfessorAvailability):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/professor/availability/bulk")
+async def create_recurring_availability(recurrence: RecurringAvailability):
+    """Add every slot of a recurring availability rule in one call"""
+    try:
+        return add_recurring_availability(recurrence)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/professor/availability")
-async def list_professor_availabilities(professor_name: Optional[str] = None):
-    """Get availabilities for professors"""
+async def list_professor_availabilities(
+    request: Request,
+    professor_name: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    is_booked: Optional[bool] = None,
+    sort: str = "date",
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    fields: Optional[str] = None
+):
+    """Get a page of availabilities for professors"""
     try:
-        return get_professor_availabilities(professor_name)
+        return conditional_json(request, (store_versions["availabilities"],), lambda: get_professor_availabilities(
+            professor_name=professor_name,
+            date_from=date_from,
+            date_to=date_to,
+            is_booked=is_booked,
+            sort=sort,
+            cursor=cursor,
+            limit=limit,
+            fields=fields
+        ))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -37,18 +71,18 @@ async def create_meeting_booking(booking: MeetingBooking):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/student/bookings")
-async def list_student_bookings(student_email: str):
+async def list_student_bookings(request: Request, student_email: str):
     """Get bookings for a specific student"""
     try:
-        return get_student_bookings(student_email)
+        return conditional_json(request, (store_versions["bookings"],), lambda: get_student_bookings(student_email))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/professor/bookings")
-async def list_professor_bookings(professor_name: str):
+async def list_professor_bookings(request: Request, professor_name: str):
     """Get bookings for a specific professor"""
     try:
-        return get_professor_bookings(professor_name)
+        return conditional_json(request, (store_versions["bookings"],), lambda: get_professor_bookings(professor_name))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
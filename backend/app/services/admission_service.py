@@ -0,0 +1,151 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from ..config.settings import LLM_ADMISSION
+from ..utils.tracing import span
+
+# Priority classes, lower value is served first
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+PRIORITIES = {PRIORITY_INTERACTIVE: 0, PRIORITY_BATCH: 1}
+
+
+class AdmissionController:
+    """
+    Bounded priority queue in front of one LLM backend.
+
+    At most max_concurrency requests run against the backend at once. Others
+    wait in a queue ordered by priority class and arrival; interactive requests
+    may fill the queue up to max_queue, batch requests only up to
+    batch_max_queue, so batch work can never crowd out students. Requests that
+    cannot be queued, or wait longer than max_wait seconds, are rejected
+    immediately with a Retry-After hint instead of piling up until the
+    backend's timeout.
+    """
+
+    def __init__(self, backend: str, max_concurrency: int, max_queue: int, batch_max_queue: int, max_wait: float):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.batch_max_queue = batch_max_queue
+        self.max_wait = max_wait
+        self._active = 0
+        self._waiters = []  # Heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        self._service_time = None  # EWMA of seconds a request holds a slot
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests currently waiting for a slot."""
+        # Drop waiters that gave up (timed out or disconnected)
+        if any(future.done() for _, _, future in self._waiters):
+            self._waiters = [w for w in self._waiters if not w[2].done()]
+            heapq.heapify(self._waiters)
+        return len(self._waiters)
+
+    @property
+    def busy(self) -> bool:
+        """Whether any request holds a slot or is waiting for one."""
+        return self._active > 0 or self.queue_depth > 0
+
+    def retry_after(self) -> int:
+        """Estimate in seconds until a newly queued request would be served."""
+        service_time = self._service_time or 10.0
+        return max(1, math.ceil(service_time * (self.queue_depth + 1) / self.max_concurrency))
+
+    def ensure_capacity(self, priority: str = PRIORITY_INTERACTIVE):
+        """Reject right away if a request of this priority could not be queued now."""
+        if self._active < self.max_concurrency and self.queue_depth == 0:
+            return
+        limit = self.max_queue if priority == PRIORITY_INTERACTIVE else self.batch_max_queue
+        if self.queue_depth >= limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503 if priority == PRIORITY_INTERACTIVE else 429,
+                detail=f"The {self.backend} model is busy. Please try again shortly.",
+                headers={"Retry-After": str(self.retry_after())}
+            )
+
+    @asynccontextmanager
+    async def slot(self, priority: str = PRIORITY_INTERACTIVE):
+        """Hold one backend slot for the duration of the block."""
+        with span("queue_wait", backend=self.backend, queue_depth=self.queue_depth):
+            await self._acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self._service_time = elapsed if self._service_time is None else 0.8 * self._service_time + 0.2 * elapsed
+            self._release()
+
+    async def _acquire(self, priority: str):
+        self.ensure_capacity(priority)
+        if self._active < self.max_concurrency and self.queue_depth == 0:
+            self._active += 1
+            self.admitted += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (PRIORITIES.get(priority, 0), next(self._sequence), future))
+        try:
+            await asyncio.wait({future}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            # The slot may have been handed over just as the caller went away
+            if future.done() and not future.cancelled():
+                self._release()
+            else:
+                future.cancel()
+            raise
+
+        if not future.done():
+            future.cancel()
+            self.timed_out += 1
+            raise HTTPException(
+                status_code=503,
+                detail=f"Timed out waiting for the {self.backend} model. Please try again shortly.",
+                headers={"Retry-After": str(self.retry_after())}
+            )
+        self.admitted += 1
+
+    def _release(self):
+        self._active -= 1
+        # Hand the slot straight to the highest-priority waiter still waiting
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._active += 1
+                future.set_result(True)
+                break
+
+    def stats(self) -> dict:
+        """Current queue metrics for this backend."""
+        return {
+            "active": self._active,
+            "queue_depth": self.queue_depth,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_service_seconds": round(self._service_time, 3) if self._service_time is not None else None
+        }
+
+
+# One admission controller per LLM backend
+llm_admission = {
+    backend: AdmissionController(backend, **config)
+    for backend, config in LLM_ADMISSION.items()
+}
+
+
+def get_admission_stats() -> dict:
+    """Queue metrics for every LLM backend."""
+    return {backend: controller.stats() for backend, controller in llm_admission.items()}
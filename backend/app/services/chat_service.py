@@ -1,32 +1,61 @@
 import os
-import requests
-from openai import OpenAI
+import json
 from fastapi import HTTPException
-from ..config.settings import OPENAI_API_KEY, LM_STUDIO_URL, LM_STUDIO_HEADERS
+from ..config.settings import LM_STUDIO_URL, LM_STUDIO_HEADERS, LM_STUDIO_CONNECT_TIMEOUT
+from ..services.admission_service import llm_admission, PRIORITY_INTERACTIVE
+from ..services.client_registry import registry
+from ..services.health_service import backend_health
+from ..services.routing_service import latency_stats, rank_backends, route_request
 from ..services.search_service import get_web_search_results
-from ..utils.helpers import process_thinking_content, process_lecture_formatting
+from ..services.session_service import open_session, session_history, record_turn
+from ..services.transcript_service import get_transcript_context
+from ..utils.helpers import process_thinking_content, process_lecture_formatting, extract_youtube_video_id, ThinkingSplitter
+from ..utils.lecture_components import LectureComponentDetector
+from ..utils.log import get_logger
+from ..utils.metrics import track_stage, LLMTimer, record_tokens
+from ..utils.tracing import span
 
-# Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
+logger = get_logger(__name__)
 
-async def process_chat_request(message: str, model_type: str, professor: dict, enable_search: bool = False):
+async def run_chat_search(message: str, professor: dict):
     """
-    Process a chat request with the selected model and professor.
+    Run the academic web search for a chat request.
+    
+    Args:
+        message: User's message
+        professor: Professor details dictionary
+        
+    Returns:
+        Tuple of (search_context, search_results)
+    """
+    logger.info("Web search enabled", query=message)
+    return await get_web_search_results(
+        query=message,
+        professor={
+            "name": professor["name"],
+            "field": professor["field"]
+        }
+    )
+
+@track_stage("prompt_assembly")
+def build_chat_messages(message: str, model_type: str, professor: dict, search_context: str = "", search_results: list = None):
+    """
+    Build the prompt for a chat request for one model type.
     
     Args:
         message: User's message
         model_type: 'openai' or 'local'
         professor: Professor details dictionary
-        enable_search: Whether to enable web search
+        search_context: Formatted web search results, if any
+        search_results: Web search results, if any
         
     Returns:
-        Processed response
+        List of chat messages
     """
-    try:
-        # Create a rich classroom environment based on teaching mode
-        classroom_style = ""
-        if professor["teachingMode"] == "Socratic":
-            classroom_style = """
+    # Create a rich classroom environment based on teaching mode
+    classroom_style = ""
+    if professor["teachingMode"] == "Socratic":
+        classroom_style = """
 You primarily teach through questioning. Rather than giving direct answers, you guide students to discover solutions themselves.
 - Ask thought-provoking questions that lead students toward understanding
 - When a student gives an answer, respond with follow-up questions
@@ -34,8 +63,8 @@ You primarily teach through questioning. Rather than giving direct answers, you
 - Use phrases like "What would happen if...?", "How might we approach...?", "Consider this scenario..."
 - Create a dialogue that feels like a live classroom discussion
 """
-        elif professor["teachingMode"] == "Practical":
-            classroom_style = """
+    elif professor["teachingMode"] == "Practical":
+        classroom_style = """
 You focus on practical applications and real-world examples in your teaching.
 - Ground abstract concepts in concrete, tangible examples that students can relate to
 - Frequently reference how concepts apply in professional settings
@@ -43,8 +72,8 @@ You focus on practical applications and real-world examples in your teaching.
 - Phrase explanations as "In practice, this works by...", "A real-world application of this is..."
 - Structure responses like a workshop environment with hands-on explanations
 """
-        else:  # Default/Virtual teaching mode
-            classroom_style = """
+    else:  # Default/Virtual teaching mode
+        classroom_style = """
 You provide clear, structured explanations with a mix of theory and application.
 - Begin with clear learning objectives for the topic
 - Organize content logically with main points and supporting details
@@ -53,8 +82,8 @@ You provide clear, structured explanations with a mix of theory and application.
 - Your tone is encouraging but maintains academic rigor
 """
 
-        # Base system message with enhanced classroom environment
-        base_system_message = f"""You are Professor {professor["name"]}, an expert educator in {professor["field"]}. 
+    # Base system message with enhanced classroom environment
+    base_system_message = f"""You are Professor {professor["name"]}, an expert educator in {professor["field"]}. 
 You are currently teaching a class and responding to a student's question or comment.
 
 CLASSROOM ENVIRONMENT:
@@ -83,10 +112,10 @@ RESPONSE FORMAT:
 ADVICE SPECIALIZATION:
 You specialize in providing {professor["adviceType"]} to students.
 """
-        
-        # Add thinking instructions only for local models
-        if model_type == "local":
-            system_message = f"""{base_system_message}
+    
+    # Add thinking instructions only for local models
+    if model_type == "local":
+        system_message = f"""{base_system_message}
 
 Please show your reasoning and thinking process before providing your final answer. 
 Structure your response in this format:
@@ -97,174 +126,442 @@ Structure your response in this format:
 
 [Your final, polished classroom response goes here without the thinking process. This should be a clear, instructive response as if speaking directly to students in your classroom.]
 """
-        else:
-            # For OpenAI models, use the enhanced base message without thinking instructions
-            system_message = base_system_message
-        
-        # If web search is enabled, perform specialized academic search
-        search_context = ""
-        search_results = []
-        
-        if enable_search:
-            print(f"Web search enabled for query: '{message}'")
-            search_context, search_results = await get_web_search_results(
-                query=message,
-                professor={
-                    "name": professor["name"],
-                    "field": professor["field"]
-                }
-            )
-            
-            if search_results:
-                # Create search system message with classroom context
-                search_system_message = (
-                    "You have been provided with recent web search results relevant to the student's question. "
-                    "Use these sources to enhance your classroom response while maintaining your teaching style. "
-                    "\n\nGuidelines for using search results in your classroom:"
-                    "\n1. Refer to the sources as if they're materials you're familiar with - 'In a study by...' or 'According to recent research...'"
-                    "\n2. Cite sources naturally as you would in a lecture, using [Source X] notation where X is the source number"
-                    "\n3. Synthesize information from multiple sources when appropriate, as a professor would when lecturing"
-                    "\n4. If the search results don't contain relevant information, rely on your expertise"
-                    "\n5. Maintain your classroom presence and teaching style throughout"
-                    "\n6. For academic sources, explain their relevance to the class topic"
-                    "\n\nThe reference materials are:"
-                    f"\n\n{search_context}"
-                )
-                
-                # Add thinking reminder only for local models
-                if model_type == "local":
-                    search_system_message += "\n\nRemember to include your thinking in <think> tags before your final classroom response."
-                
-                system_message += "\n\n" + search_system_message
-
+    else:
+        # For OpenAI models, use the enhanced base message without thinking instructions
+        system_message = base_system_message
+    
+    # Add the web search results, if the search found any
+    if search_results:
+        # Create search system message with classroom context
+        search_system_message = (
+            "You have been provided with recent web search results relevant to the student's question. "
+            "Use these sources to enhance your classroom response while maintaining your teaching style. "
+            "\n\nGuidelines for using search results in your classroom:"
+            "\n1. Refer to the sources as if they're materials you're familiar with - 'In a study by...' or 'According to recent research...'"
+            "\n2. Cite sources naturally as you would in a lecture, using [Source X] notation where X is the source number"
+            "\n3. Synthesize information from multiple sources when appropriate, as a professor would when lecturing"
+            "\n4. If the search results don't contain relevant information, rely on your expertise"
+            "\n5. Maintain your classroom presence and teaching style throughout"
+            "\n6. For academic sources, explain their relevance to the class topic"
+            "\n\nThe reference materials are:"
+            f"\n\n{search_context}"
+        )
+        
+        # Add thinking reminder only for local models
         if model_type == "local":
-            try:
-                print("Attempting LM Studio request...")
-                
-                payload = {
-                    "messages": [
-                        {"role": "system", "content": system_message},
-                        {"role": "user", "content": message}
-                    ],
-                    "temperature": 0.7,
-                    "max_tokens": 4000,
-                    "stream": False
-                }
-                
-                print(f"Sending payload to LM Studio: {payload}")
-                
-                # Increased timeout to 120 seconds
-                response = requests.post(
+            search_system_message += "\n\nRemember to include your thinking in <think> tags before your final classroom response."
+        
+        system_message += "\n\n" + search_system_message
+
+    messages = [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": message}
+    ]
+    return messages
+
+async def prepare_chat_messages(message: str, model_type: str, professor: dict, enable_search: bool = False):
+    """
+    Build the prompt for a chat request, running the web search if enabled.
+    
+    Args:
+        message: User's message
+        model_type: 'openai' or 'local'
+        professor: Professor details dictionary
+        enable_search: Whether to enable web search
+        
+    Returns:
+        Tuple of (messages, search_results)
+    """
+    search_context, search_results = await run_chat_search(message, professor) if enable_search else ("", [])
+    return build_chat_messages(message, model_type, professor, search_context, search_results), search_results
+
+async def _complete_local(messages: list, search_results: list, priority: str = PRIORITY_INTERACTIVE,
+                         professor_name: str = None):
+    """Get a complete (non-streaming) response from LM Studio."""
+    import httpx
+    
+    try:
+        payload = {
+            "messages": messages,
+            "temperature": 0.7,
+            "max_tokens": 4000,
+            "stream": False
+        }
+        
+        logger.debug("Sending request to LM Studio", payload=payload)
+        
+        # Increased timeout to 120 seconds. If the caller is cancelled (client
+        # disconnected), the connection is closed and LM Studio stops generating.
+        async with llm_admission["local"].slot(priority), backend_health["local"].guard():
+            # Timed from inside the slot, so queue wait stays out of the latency stats (score() adds the queue)
+            with latency_stats["local"].track(), LLMTimer("local"):
+                response = await registry.http.post(
                     LM_STUDIO_URL, 
                     json=payload,
                     headers=LM_STUDIO_HEADERS,
-                    timeout=120  # Increased from 30 to 120 seconds
+                    timeout=httpx.Timeout(120, connect=LM_STUDIO_CONNECT_TIMEOUT)  # Increased from 30 to 120 seconds
                 )
                 
-                print(f"LM Studio response status: {response.status_code}")
+                logger.debug("LM Studio responded", status_code=response.status_code)
                 
-                if response.status_code == 200:
-                    response_json = response.json()
-                    raw_response = response_json["choices"][0]["message"]["content"]
-                    
-                    # Process thinking content for local models
-                    processed_response = process_thinking_content(raw_response)
-                    
-                    return {
-                        "response": raw_response,  # Keep original response with thinking tags
-                        "search_results": search_results if search_results else None,
-                        "has_thinking": processed_response["has_thinking"]
-                    }
-                else:
+                if response.status_code != 200:
                     error_msg = f"LM Studio error: Status {response.status_code}, Response: {response.text}"
-                    print(error_msg)
+                    logger.error("LM Studio error", status_code=response.status_code, response=response.text)
                     raise HTTPException(status_code=500, detail=error_msg)
-                    
-            except requests.exceptions.Timeout:
-                error_msg = "LM Studio request timed out. The model might be taking too long to generate a response."
-                print(error_msg)
-                raise HTTPException(status_code=504, detail=error_msg)
-            except requests.exceptions.ConnectionError as e:
-                error_msg = "Could not connect to LM Studio. Please ensure it's running and the model is loaded."
-                print(f"Connection error: {str(e)}")
-                raise HTTPException(status_code=500, detail=error_msg)
-            except Exception as e:
-                print(f"Unexpected LM Studio error: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"LM Studio error: {str(e)}")
-                
-        elif model_type == "openai":
-            try:
-                messages = [
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": message}
-                ]
-                
-                response = client.chat.completions.create(
+        
+        response_json = response.json()
+        record_tokens(response_json.get("model", "local"), professor_name, response_json.get("usage"))
+        raw_response = response_json["choices"][0]["message"]["content"]
+        
+        # Process thinking content for local models
+        processed_response = process_thinking_content(raw_response)
+        
+        return {
+            "response": raw_response,  # Keep original response with thinking tags
+            "search_results": search_results if search_results else None,
+            "has_thinking": processed_response["has_thinking"]
+        }
+            
+    except HTTPException:
+        raise
+    except httpx.TimeoutException:
+        error_msg = "LM Studio request timed out. The model might be taking too long to generate a response."
+        logger.error("LM Studio request timed out")
+        raise HTTPException(status_code=504, detail=error_msg)
+    except httpx.ConnectError as e:
+        error_msg = "Could not connect to LM Studio. Please ensure it's running and the model is loaded."
+        logger.error("Could not connect to LM Studio", error=str(e))
+        raise HTTPException(status_code=500, detail=error_msg)
+    except Exception as e:
+        logger.exception("Unexpected LM Studio error", error=str(e))
+        raise HTTPException(status_code=500, detail=f"LM Studio error: {str(e)}")
+
+async def _complete_openai(messages: list, search_results: list, priority: str = PRIORITY_INTERACTIVE,
+                          professor_name: str = None):
+    """Get a complete (non-streaming) response from OpenAI."""
+    try:
+        async with llm_admission["openai"].slot(priority), backend_health["openai"].guard():
+            # Timed from inside the slot, so queue wait stays out of the latency stats (score() adds the queue)
+            with latency_stats["openai"].track(), LLMTimer("openai"):
+                response = await registry.openai.chat.completions.create(
                     model="gpt-4o-mini",  # Using a more capable model
                     messages=messages,
                     temperature=0.85
                 )
-                
-                # Format citations in a more readable way for the frontend
-                if search_results:
-                    response_text = response.choices[0].message.content
-                    
-                    # Process for lecture formatting
-                    lecture_processed = process_lecture_formatting(response_text)
-                    
-                    return {
-                        "response": lecture_processed["formatted_text"],
-                        "search_results": search_results,
-                        "lecture_components": lecture_processed["lecture_components"]
-                    }
-                else:
-                    response_text = response.choices[0].message.content
-                    
-                    # Process for lecture formatting
-                    lecture_processed = process_lecture_formatting(response_text)
-                    
-                    return {
-                        "response": lecture_processed["formatted_text"],
-                        "lecture_components": lecture_processed["lecture_components"]
-                    }
-            except Exception as e:
-                print(f"OpenAI error: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"OpenAI error: {str(e)}")
-            
+        
+        record_tokens(response.model, professor_name, response.usage)
+        response_text = response.choices[0].message.content
+        
+        # Process for lecture formatting
+        lecture_processed = process_lecture_formatting(response_text)
+        
+        result = {
+            "response": lecture_processed["formatted_text"],
+            "lecture_components": lecture_processed["lecture_components"],
+            "component_positions": lecture_processed["component_positions"]
+        }
+        # Format citations in a more readable way for the frontend
+        if search_results:
+            result["search_results"] = search_results
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Unexpected error in chat service: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error("OpenAI error", error=str(e))
+        raise HTTPException(status_code=500, detail=f"OpenAI error: {str(e)}")
+
+COMPLETIONS = {"local": _complete_local, "openai": _complete_openai}
+
+async def _process_routed_chat(message: str, professor: dict, enable_search: bool, priority: str,
+                               fallback: bool, hedge: bool):
+    """Pick the backend for an 'auto' chat request from live latency and error rates."""
+    backends = rank_backends(priority)
+    if not fallback and not hedge:
+        backends = backends[:1]
+    
+    # Search once; each backend gets its own prompt built from the same results
+    search_context, search_results = await run_chat_search(message, professor) if enable_search and backends else ("", [])
+    calls = {
+        backend: (lambda backend=backend: COMPLETIONS[backend](
+            build_chat_messages(message, backend, professor, search_context, search_results),
+            search_results,
+            priority,
+            professor["name"]
+        ))
+        for backend in backends
+    }
+    
+    result, backend = await route_request(backends, calls, fallback=fallback, hedge=hedge)
+    result["model_type"] = backend
+    return result
 
-async def process_document_chat(document_id: str, document_url: str, document_title: str, message: str, previous_messages: list = []):
+async def process_chat_request(message: str, model_type: str, professor: dict, enable_search: bool = False,
+                               priority: str = PRIORITY_INTERACTIVE, fallback: bool = True, hedge: bool = True):
     """
-    Process a document-based chat request.
+    Process a chat request with the selected model and professor.
     
     Args:
-        document_id: Document ID
-        document_url: URL to the document
-        document_title: Document title
         message: User's message
-        previous_messages: Previous conversation messages
+        model_type: 'openai', 'local' or 'auto' (route by live latency and error rates)
+        professor: Professor details dictionary
+        enable_search: Whether to enable web search
+        priority: Admission priority class ('interactive' or 'batch')
+        fallback: For 'auto', whether to retry on another backend after a failure
+        hedge: For 'auto', whether to send a hedged request when the first backend is slow
         
     Returns:
         Processed response
     """
     try:
-        from ..utils.helpers import extract_text_from_pdf_url
+        if model_type == "auto":
+            return await _process_routed_chat(message, professor, enable_search, priority, fallback, hedge)
         
-        # Download and extract text from the PDF
-        document_text = await extract_text_from_pdf_url(document_url)
+        # Fail fast if the model is down or its queue is full, before doing any search work
+        if model_type in llm_admission:
+            backend_health[model_type].ensure_available()
+            llm_admission[model_type].ensure_capacity(priority)
         
-        if not document_text or document_text.startswith("Error"):
-            return {"response": "I couldn't extract text from this document. The PDF might be scanned, password-protected, or in an unsupported format."}
+        messages, search_results = await prepare_chat_messages(message, model_type, professor, enable_search)
+
+        if model_type in COMPLETIONS:
+            return await COMPLETIONS[model_type](messages, search_results, priority, professor["name"])
+            
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Unexpected error in chat service", error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _stream_local(messages: list, usage: dict):
+    """Yield response text deltas from LM Studio's streaming API, filling usage from the final chunk."""
+    payload = {
+        "messages": messages,
+        "temperature": 0.7,
+        "max_tokens": 4000,
+        "stream": True,
+        "stream_options": {"include_usage": True}
+    }
+    import httpx
+    
+    timeout = httpx.Timeout(120, connect=LM_STUDIO_CONNECT_TIMEOUT)
+    async with registry.http.stream("POST", LM_STUDIO_URL, json=payload, headers=LM_STUDIO_HEADERS, timeout=timeout) as response:
+        if response.status_code != 200:
+            body = await response.aread()
+            raise HTTPException(status_code=500, detail=f"LM Studio error: Status {response.status_code}, Response: {body.decode(errors='replace')}")
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if chunk.get("usage"):
+                usage.update(chunk["usage"], model=chunk.get("model", "local"))
+            delta = chunk["choices"][0].get("delta", {}).get("content") if chunk.get("choices") else None
+            if delta:
+                yield delta
+
+async def _stream_openai(messages: list, usage: dict, **options):
+    """Yield response text deltas from OpenAI's streaming API, filling usage from the final chunk."""
+    stream = await registry.openai.chat.completions.create(
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True},
+        **{"model": "gpt-4o-mini", "temperature": 0.85, **options}
+    )
+    # Closing the stream (also on cancellation) closes the upstream connection
+    async with stream:
+        async for chunk in stream:
+            if chunk.usage:
+                usage.update(chunk.usage.model_dump(), model=chunk.model)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+async def _stream_completion(messages: list, model_type: str, priority: str, professor_name: str,
+                             is_disconnected=None, result: dict = None, **options):
+    """
+    Stream one completion as "token", "component" and "done" events.
+    
+    Token events carry a "channel": local models' <think> reasoning is sent on
+    "thinking" and the answer on "final" (tags removed); OpenAI responses are all
+    "final" and are scanned for lecture components as they stream.
+    
+    Args:
+        messages: Prompt messages
+        model_type: 'openai' or 'local'
+        priority: Admission priority class
+        professor_name: Professor name for the token counters, if any
+        is_disconnected: Optional async callable returning True once the client is gone
+        result: Optional dict that receives the full "text" and the "final_text"
+            (without thinking) before the "done" event
+        **options: Extra OpenAI request options
         
-        # Truncate text if too long
-        max_chars = 100000  # Adjust based on token limits
-        if len(document_text) > max_chars:
-            document_text = document_text[:max_chars] + "...(content truncated due to length)"
+    Yields:
+        Stream events
+    """
+    chunks = []
+    final_parts = []
+    usage = {}
+    splitter = ThinkingSplitter() if model_type == "local" else None
+    detector = LectureComponentDetector() if model_type != "local" else None
+    stream = _stream_local(messages, usage) if model_type == "local" else _stream_openai(messages, usage, **options)
+    async with llm_admission[model_type].slot(priority), backend_health[model_type].guard():
+        with LLMTimer(model_type, streaming=True) as timer:
+            try:
+                async for delta in stream:
+                    if is_disconnected and await is_disconnected():
+                        logger.info("Client disconnected, aborting generation", model_type=model_type)
+                        return
+                    timer.mark_first_token()
+                    chunks.append(delta)
+                    if splitter:
+                        for channel, text in splitter.feed(delta):
+                            if channel == "final":
+                                final_parts.append(text)
+                            yield {"type": "token", "channel": channel, "content": text}
+                        continue
+                    final_parts.append(delta)
+                    yield {"type": "token", "channel": "final", "content": delta}
+                    for component in detector.feed(delta):
+                        yield {"type": "component", "component": component}
+            finally:
+                # Closes the upstream response if we stopped early
+                await stream.aclose()
+    record_tokens(usage.get("model", model_type), professor_name, usage)
+    
+    if splitter:
+        for channel, text in splitter.finish():
+            if channel == "final":
+                final_parts.append(text)
+            yield {"type": "token", "channel": channel, "content": text}
+    if result is not None:
+        result.update(text="".join(chunks), final_text="".join(final_parts).strip())
+    
+    if model_type == "local":
+        yield {"type": "done", "has_thinking": process_thinking_content("".join(chunks))["has_thinking"]}
+    else:
+        for component in detector.finish():
+            yield {"type": "component", "component": component}
+        yield {"type": "done", "lecture_components": detector.flags, "component_positions": detector.components}
+
+async def _stream_session_turn(messages: list, model_type: str, priority: str, professor_name: str,
+                               session: dict, message: str, is_disconnected=None, **options):
+    """Stream a completion, adding the turn to the session just before the "done" event."""
+    result = {}
+    async for event in _stream_completion(messages, model_type, priority, professor_name, is_disconnected, result, **options):
+        if event["type"] == "done" and session is not None:
+            record_turn(session, message, result["final_text"])
+            event["session_id"] = session["id"]
+        yield event
+
+def _add_history(messages: list, session: dict, model_type: str):
+    """Put a session's history between the system prompt and the question."""
+    history = session_history(session)
+    if model_type == "local" and history and history[0]["role"] == "system":
+        # Local chat templates often only accept a system message at the start
+        messages[0] = {"role": "system", "content": f"{messages[0]['content']}\n\n{history.pop(0)['content']}"}
+    messages[1:1] = history
+
+async def stream_chat_request(message: str, model_type: str, professor: dict, enable_search: bool = False,
+                              priority: str = PRIORITY_INTERACTIVE, is_disconnected=None, session: dict = None):
+    """
+    Process a chat request, yielding events as the response is generated.
+    
+    Events are dicts with a "type" of "route", "search_results", "token", "component",
+    "done" or "error". Token events carry a "channel": "thinking" for a local
+    model's reasoning and "final" for the answer. OpenAI responses are scanned
+    for lecture components as they stream; a "component" event (with type, start
+    and end) is sent as soon as each whiteboard block, equation or other
+    component is complete.
+    Streams are not hedged: with 'auto' the best-ranked backend is used and a
+    "route" event reports which one it is.
+    The upstream generation is aborted as soon as the consumer stops iterating
+    or is_disconnected() reports that the client has gone away.
+    
+    Args:
+        message: User's message
+        model_type: 'openai', 'local' or 'auto' (best backend right now)
+        professor: Professor details dictionary
+        enable_search: Whether to enable web search
+        priority: Admission priority class ('interactive' or 'batch')
+        is_disconnected: Optional async callable returning True once the client is gone
+        session: Optional chat session; its history is sent with the message and
+            the turn is added to it
+        
+    Yields:
+        Stream events
+    """
+    if model_type == "auto":
+        backends = rank_backends(priority)
+        if not backends:
+            yield {"type": "error", "status_code": 503, "detail": "No model is available right now. Please try again shortly."}
+            return
+        model_type = backends[0]
+        yield {"type": "route", "model_type": model_type}
+    
+    if model_type not in llm_admission:
+        yield {"type": "error", "detail": f"Unsupported model type: {model_type}"}
+        return
+    
+    try:
+        backend_health[model_type].ensure_available()
+        llm_admission[model_type].ensure_capacity(priority)
+        messages, search_results = await prepare_chat_messages(message, model_type, professor, enable_search)
+        if search_results:
+            yield {"type": "search_results", "search_results": search_results}
+        if session is not None:
+            _add_history(messages, session, model_type)
+        
+        async for event in _stream_session_turn(messages, model_type, priority, professor["name"], session, message, is_disconnected):
+            yield event
+    except HTTPException as e:
+        yield {"type": "error", "status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        logger.error("Error in chat stream", error=str(e))
+        yield {"type": "error", "status_code": 500, "detail": str(e)}
+
+DOCUMENT_UNREADABLE = "I couldn't extract text from this document. The PDF might be scanned, password-protected, or in an unsupported format."
+TRANSCRIPT_UNAVAILABLE = "I couldn't extract the transcript from this YouTube video. It might not have captions available or might be in an unsupported format."
+
+def _source_chat_options(cache_key: str) -> dict:
+    """OpenAI options for document and YouTube chats."""
+    return {
+        "model": "gpt-4o-mini",  # Using a more capable model for document and video analysis
+        "temperature": 0.7,
+        "max_tokens": 1000,
+        # Routes turns about one document or video to the same cache. Sent as a raw body field,
+        # since SDK releases older than the parameter reject it as a keyword argument
+        "extra_body": {"prompt_cache_key": cache_key}
+    }
+
+async def build_document_chat_messages(document_title: str, document_url: str, message: str, session: dict):
+    """
+    Build the prompt for a document chat turn, downloading and extracting the document.
+    
+    Args:
+        document_title: Document title
+        document_url: URL to the document
+        message: User's message
+        session: Chat session the turn belongs to
         
-        # Create classroom-oriented system prompt
-        classroom_system_prompt = f"""You are a professor leading a class discussion about the document titled '{document_title}'.
+    Returns:
+        List of chat messages, or None if no text could be extracted
+    """
+    from ..utils.helpers import extract_text_from_pdf_url
+    
+    # Download and extract text from the PDF
+    document_text = await extract_text_from_pdf_url(document_url)
+    
+    if not document_text or document_text.startswith("Error"):
+        return None
+    
+    # Truncate text if too long
+    max_chars = 100000  # Adjust based on token limits
+    if len(document_text) > max_chars:
+        document_text = document_text[:max_chars] + "...(content truncated due to length)"
+    
+    # Create classroom-oriented system prompt
+    classroom_system_prompt = f"""You are a professor leading a class discussion about the document titled '{document_title}'.
         
 CLASSROOM ENVIRONMENT:
 - You are in a classroom with students discussing this document as a learning resource
@@ -288,73 +585,61 @@ RESPONSE FORMAT:
 - Consider using an introduction, main points, and conclusion format
 - Wrap up with suggestions for further exploration if appropriate
 """
-        
-        # Build context from previous messages
+    
+    with track_stage("prompt_assembly"):
+        # The persona and the document come first and are the same on every turn about this
+        # document, so the provider can serve them from its prompt cache
         messages = [
-            {"role": "system", "content": classroom_system_prompt}
+            {"role": "system", "content": f"{classroom_system_prompt}\nHere is the content of the document '{document_title}':\n\n{document_text}"}
         ]
         
-        # Add previous conversation context
-        for msg in previous_messages:
-            messages.append({"role": msg["role"], "content": msg["content"]})
+        # Add the conversation so far: a summary of older turns and the most recent ones, within a token budget
+        messages.extend(session_history(session))
         
-        # Add the document content and user's question
+        # Add the user's question
         messages.append({
             "role": "user", 
-            "content": f"Here is the content of the document '{document_title}':\n\n{document_text}\n\nStudent question: {message}\n\nPlease respond as if we're discussing this document in class."
+            "content": f"Student question: {message}\n\nPlease respond as if we're discussing this document in class."
         })
-        
-        # Get response from OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Using a more capable model for document analysis
-            messages=messages,
-            temperature=0.7,
-            max_tokens=1000
-        )
-        
-        response_text = response.choices[0].message.content
-        
-        # Process for lecture formatting
-        lecture_processed = process_lecture_formatting(response_text)
-        
-        return {
-            "response": lecture_processed["formatted_text"],
-            "lecture_components": lecture_processed["lecture_components"]
-        }
-    
-    except Exception as e:
-        print(f"Error in document_chat: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error processing document chat: {str(e)}")
+    return messages
 
-async def process_youtube_chat(youtube_url: str, video_title: str, message: str, previous_messages: list = []):
+async def build_youtube_chat_messages(youtube_url: str, video_title: str, video_id: str, message: str, session: dict):
     """
-    Process a YouTube video-based chat request.
+    Build the prompt for a YouTube chat turn from the video's stored transcript.
     
     Args:
         youtube_url: YouTube video URL
         video_title: Video title
+        video_id: YouTube video ID (None if it could not be read from the URL)
         message: User's message
-        previous_messages: Previous conversation messages
+        session: Chat session the turn belongs to
         
     Returns:
-        Processed response
+        Tuple of (messages, transcript context), or (None, None) if the video has no transcript
     """
-    try:
-        from ..utils.helpers import get_youtube_transcript
-        
-        # Fetch YouTube transcript
-        transcript_text = get_youtube_transcript(youtube_url)
-        
-        if not transcript_text or transcript_text.startswith("Error"):
-            return {"response": "I couldn't extract the transcript from this YouTube video. It might not have captions available or might be in an unsupported format."}
-        
-        # Truncate text if too long
-        max_chars = 50000  # Adjust based on token limits
-        if len(transcript_text) > max_chars:
-            transcript_text = transcript_text[:max_chars] + "...(transcript truncated due to length)"
-        
-        # Create classroom-oriented system prompt for YouTube discussions
-        classroom_system_prompt = f"""You are a professor leading a class discussion about a YouTube video titled '{video_title}'.
+    # Transcripts are fetched once per video (usually in the background at upload) and kept in the store;
+    # long ones are cut down to the time windows most relevant to the question
+    transcript = None
+    if video_id:
+        with span("transcript_retrieval", video_id=video_id) as retrieval:
+            transcript = await get_transcript_context(video_id, message)
+            if transcript:
+                retrieval.set(windows=len(transcript["windows"]), chars=len(transcript["text"]), complete=transcript["complete"])
+    
+    if not transcript or not transcript["text"]:
+        return None, None
+    
+    if transcript["complete"]:
+        transcript_intro = f"Here is the transcript of the YouTube video '{video_title}' ({youtube_url}):"
+    else:
+        transcript_intro = (
+            f"Here are the parts of the transcript of the YouTube video '{video_title}' ({youtube_url}) "
+            "most relevant to the question, each under its [MM:SS-MM:SS] time range. "
+            "Cite these timestamps so the student can jump to them; other parts of the video are not shown."
+        )
+    
+    # Create classroom-oriented system prompt for YouTube discussions
+    classroom_system_prompt = f"""You are a professor leading a class discussion about a YouTube video titled '{video_title}'.
         
 CLASSROOM ENVIRONMENT:
 - You are in a classroom with students discussing this educational video as a learning resource
@@ -378,40 +663,207 @@ RESPONSE FORMAT:
 - Consider using an introduction, main points, and conclusion format
 - Wrap up with suggestions for further exploration if appropriate
 """
-        
-        # Build context from previous messages
+    
+    with track_stage("prompt_assembly"):
+        # The persona and a whole transcript come first and are the same on every turn about this
+        # video, so the provider can serve them from its prompt cache. Windows picked for a
+        # question differ from turn to turn, so they go with the question instead.
+        if transcript["complete"]:
+            system_content = f"{classroom_system_prompt}\n{transcript_intro}\n\n{transcript['text']}"
+            question = f"Student question: {message}"
+        else:
+            system_content = classroom_system_prompt
+            question = f"{transcript_intro}\n\n{transcript['text']}\n\nStudent question: {message}"
         messages = [
-            {"role": "system", "content": classroom_system_prompt}
+            {"role": "system", "content": system_content}
         ]
         
-        # Add previous conversation context
-        for msg in previous_messages:
-            messages.append({"role": msg["role"], "content": msg["content"]})
+        # Add the conversation so far: a summary of older turns and the most recent ones, within a token budget
+        messages.extend(session_history(session))
         
-        # Add the video transcript and user's question
+        # Add the user's question
         messages.append({
             "role": "user", 
-            "content": f"Here is the transcript of the YouTube video '{video_title}' ({youtube_url}):\n\n{transcript_text}\n\nStudent question: {message}\n\nPlease respond as if we're discussing this video in class."
+            "content": f"{question}\n\nPlease respond as if we're discussing this video in class."
         })
+    return messages, transcript
+
+async def process_document_chat(document_id: str, document_url: str, document_title: str, message: str,
+                                session_id: str = None, previous_messages: list = None):
+    """
+    Process a document-based chat request.
+    
+    Args:
+        document_id: Document ID
+        document_url: URL to the document
+        document_title: Document title
+        message: User's message
+        session_id: Chat session ID from an earlier turn, or None to start a session
+        previous_messages: Previous conversation messages (deprecated, seeds a new session)
+        
+    Returns:
+        Processed response
+    """
+    try:
+        # Fail fast if OpenAI is down, before downloading anything
+        backend_health["openai"].ensure_available()
+        session = open_session(session_id, "document", document_id, previous_messages)
+        
+        messages = await build_document_chat_messages(document_title, document_url, message, session)
+        if messages is None:
+            return {"response": DOCUMENT_UNREADABLE, "session_id": session["id"]}
         
         # Get response from OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Using a more capable model for video analysis
-            messages=messages,
-            temperature=0.7,
-            max_tokens=1000
-        )
+        async with llm_admission["openai"].slot(), backend_health["openai"].guard():
+            with LLMTimer("openai"):
+                response = await registry.openai.chat.completions.create(
+                    messages=messages,
+                    **_source_chat_options(f"document:{document_id}")
+                )
         
+        record_tokens(response.model, None, response.usage)
         response_text = response.choices[0].message.content
+        record_turn(session, message, response_text)
         
         # Process for lecture formatting
         lecture_processed = process_lecture_formatting(response_text)
         
         return {
+            "session_id": session["id"],
             "response": lecture_processed["formatted_text"],
-            "lecture_components": lecture_processed["lecture_components"]
+            "lecture_components": lecture_processed["lecture_components"],
+            "component_positions": lecture_processed["component_positions"]
         }
     
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error in document chat", document_id=document_id, error=str(e))
+        raise HTTPException(status_code=500, detail=f"Error processing document chat: {str(e)}")
+
+async def process_youtube_chat(youtube_url: str, video_title: str, message: str,
+                               session_id: str = None, previous_messages: list = None):
+    """
+    Process a YouTube video-based chat request.
+    
+    Args:
+        youtube_url: YouTube video URL
+        video_title: Video title
+        message: User's message
+        session_id: Chat session ID from an earlier turn, or None to start a session
+        previous_messages: Previous conversation messages (deprecated, seeds a new session)
+        
+    Returns:
+        Processed response
+    """
+    try:
+        # Fail fast if OpenAI is down, before downloading anything
+        backend_health["openai"].ensure_available()
+        video_id = extract_youtube_video_id(youtube_url)
+        session = open_session(session_id, "youtube", video_id or youtube_url, previous_messages)
+        
+        messages, transcript = await build_youtube_chat_messages(youtube_url, video_title, video_id, message, session)
+        if messages is None:
+            return {"response": TRANSCRIPT_UNAVAILABLE, "session_id": session["id"]}
+        
+        # Get response from OpenAI
+        async with llm_admission["openai"].slot(), backend_health["openai"].guard():
+            with LLMTimer("openai"):
+                response = await registry.openai.chat.completions.create(
+                    messages=messages,
+                    **_source_chat_options(f"youtube:{video_id}")
+                )
+        
+        record_tokens(response.model, None, response.usage)
+        response_text = response.choices[0].message.content
+        record_turn(session, message, response_text)
+        
+        # Process for lecture formatting
+        lecture_processed = process_lecture_formatting(response_text)
+        
+        return {
+            "session_id": session["id"],
+            "response": lecture_processed["formatted_text"],
+            "lecture_components": lecture_processed["lecture_components"],
+            "component_positions": lecture_processed["component_positions"],
+            "transcript_windows": transcript["windows"]
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error in YouTube chat", youtube_url=youtube_url, error=str(e))
+        raise HTTPException(status_code=500, detail=f"Error processing YouTube chat: {str(e)}")
+
+async def stream_document_chat(document_id: str, document_url: str, document_title: str, message: str,
+                               session: dict, is_disconnected=None):
+    """
+    Process a document chat turn in a session, yielding events as the response is generated.
+    
+    Events are those of stream_chat_request. The turn is added to the session
+    just before the "done" event.
+    
+    Args:
+        document_id: Document ID
+        document_url: URL to the document
+        document_title: Document title
+        message: User's message
+        session: Chat session the turn belongs to
+        is_disconnected: Optional async callable returning True once the client is gone
+        
+    Yields:
+        Stream events
+    """
+    try:
+        backend_health["openai"].ensure_available()
+        llm_admission["openai"].ensure_capacity()
+        messages = await build_document_chat_messages(document_title, document_url, message, session)
+        if messages is None:
+            yield {"type": "error", "status_code": 422, "detail": DOCUMENT_UNREADABLE}
+            return
+        
+        async for event in _stream_session_turn(messages, "openai", PRIORITY_INTERACTIVE, None, session, message,
+                                                is_disconnected, **_source_chat_options(f"document:{document_id}")):
+            yield event
+    except HTTPException as e:
+        yield {"type": "error", "status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        logger.error("Error in document chat stream", document_id=document_id, error=str(e))
+        yield {"type": "error", "status_code": 500, "detail": str(e)}
+
+async def stream_youtube_chat(youtube_url: str, video_title: str, message: str, session: dict, is_disconnected=None):
+    """
+    Process a YouTube chat turn in a session, yielding events as the response is generated.
+    
+    Events are those of stream_chat_request, with the transcript time ranges
+    used sent first in a "transcript_windows" event. The turn is added to the
+    session just before the "done" event.
+    
+    Args:
+        youtube_url: YouTube video URL
+        video_title: Video title
+        message: User's message
+        session: Chat session the turn belongs to
+        is_disconnected: Optional async callable returning True once the client is gone
+        
+    Yields:
+        Stream events
+    """
+    try:
+        backend_health["openai"].ensure_available()
+        llm_admission["openai"].ensure_capacity()
+        video_id = extract_youtube_video_id(youtube_url)
+        messages, transcript = await build_youtube_chat_messages(youtube_url, video_title, video_id, message, session)
+        if messages is None:
+            yield {"type": "error", "status_code": 422, "detail": TRANSCRIPT_UNAVAILABLE}
+            return
+        yield {"type": "transcript_windows", "transcript_windows": transcript["windows"]}
+        
+        async for event in _stream_session_turn(messages, "openai", PRIORITY_INTERACTIVE, None, session, message,
+                                                is_disconnected, **_source_chat_options(f"youtube:{video_id}")):
+            yield event
+    except HTTPException as e:
+        yield {"type": "error", "status_code": e.status_code, "detail": e.detail}
     except Exception as e:
-        print(f"Error in youtube_chat: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error processing YouTube chat: {str(e)}") 
\ No newline at end of file
+        logger.error("Error in YouTube chat stream", youtube_url=youtube_url, error=str(e))
+        yield {"type": "error", "status_code": 500, "detail": str(e)}
@@ -0,0 +1,121 @@
+import asyncio
+from ..config.settings import (
+    OPENAI_API_KEY,
+    PINECONE_API_KEY,
+    PINECONE_HOST,
+    LM_STUDIO_MODELS_URL,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY
+)
+
+
+class ClientRegistry:
+    """
+    Owns the long-lived clients used on the request path.
+
+    The app lifespan calls startup() once so connection pools, TLS sessions
+    and index handles are created before the first request and reused by
+    every request after it; shutdown() closes them. Each client is also
+    created lazily on first access, so scripts and tests that never run the
+    lifespan still work.
+    """
+
+    def __init__(self):
+        self._openai = None
+        self._http = None
+        self._pinecone = None
+        self._embedder = None
+        self._indexes = {}
+
+    @property
+    def openai(self):
+        """Shared async OpenAI client."""
+        if self._openai is None:
+            from openai import AsyncOpenAI
+            self._openai = AsyncOpenAI(api_key=OPENAI_API_KEY)
+        return self._openai
+
+    @property
+    def http(self):
+        """Shared pooled async HTTP client (LM Studio, web pages, PDF downloads)."""
+        if self._http is None:
+            import httpx
+            self._http = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(30.0),
+                follow_redirects=True
+            )
+        return self._http
+
+    @property
+    def pinecone(self):
+        """Shared Pinecone client."""
+        if self._pinecone is None:
+            from pinecone import Pinecone
+            self._pinecone = Pinecone(api_key=PINECONE_API_KEY)
+        return self._pinecone
+
+    @property
+    def embedder(self):
+        """Shared OpenAI embeddings client."""
+        if self._embedder is None:
+            from langchain_openai import OpenAIEmbeddings
+            self._embedder = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
+        return self._embedder
+
+    def get_index(self, name: str):
+        """Get a cached Pinecone index handle by name."""
+        if name not in self._indexes:
+            self._indexes[name] = self.pinecone.Index(name, host=PINECONE_HOST) if PINECONE_HOST else self.pinecone.Index(name)
+        return self._indexes[name]
+
+    async def startup(self, index_names: list = None, warm_up: bool = False):
+        """
+        Build clients ahead of the first request.
+
+        Args:
+            index_names: Pinecone indexes to open handles for
+            warm_up: Whether to make a cheap call to each backend so DNS,
+                TCP and TLS setup happen now rather than on the first request
+        """
+        self.http  # Accessing a client property creates it
+        if OPENAI_API_KEY:
+            self.openai
+            self.embedder
+        if PINECONE_API_KEY:
+            for name in index_names or []:
+                self.get_index(name)
+
+        if warm_up:
+            await asyncio.gather(*self._warm_up_calls(index_names or []), return_exceptions=True)
+
+    def _warm_up_calls(self, index_names: list) -> list:
+        """Cheap calls that open a connection to each configured backend."""
+        calls = [self.http.get(LM_STUDIO_MODELS_URL, timeout=2.0)]
+        if OPENAI_API_KEY:
+            calls.append(self.openai.models.list())
+        if PINECONE_API_KEY:
+            for name in index_names:
+                calls.append(asyncio.to_thread(self.get_index(name).describe_index_stats))
+        return calls
+
+    async def shutdown(self):
+        """Close connection pools and drop all clients."""
+        if self._http is not None:
+            await self._http.aclose()
+        if self._openai is not None:
+            await self._openai.close()
+        self._openai = None
+        self._http = None
+        self._pinecone = None
+        self._embedder = None
+        self._indexes = {}
+
+
+# Process-wide registry used by the services
+registry = ClientRegistry()
@@ -1,11 +1,42 @@
 import os
 import time
 import uuid
-import PyPDF2
-import io
-import pdfplumber
 from fastapi import UploadFile, HTTPException
-from ..config.settings import UPLOAD_DIR, documents_db
+from ..config.settings import (
+    UPLOAD_DIR,
+    documents_db,
+    documents_by_id,
+    documents_sorted,
+    documents_by_type,
+    store_versions,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE
+)
+from ..services.transcript_service import prefetch_transcript
+from ..utils.pagination import insert_sorted, paginate, parse_fields
+from ..utils.metrics import track_stage
+from ..utils.log import get_logger
+
+logger = get_logger(__name__)
+
+DOCUMENT_FIELDS = {"document_id", "filename", "file_path", "title", "description", "content_preview", "upload_time", "type"}
+
+# Fields returned by list endpoints unless fields= asks for more; previews stay on the detail endpoint
+DEFAULT_DOCUMENT_LIST_FIELDS = ["document_id", "filename", "file_path", "title", "description", "upload_time", "type"]
+
+# Sort orders for document listings; every key ends with the ID so ordering is stable
+DOCUMENT_SORT_KEYS = {
+    "upload_time": lambda d: (d["upload_time"], d["document_id"]),
+    "title": lambda d: (d["title"].lower(), d["document_id"]),
+}
+
+def _store_document(document_info):
+    """Add a document to storage and its indexes."""
+    documents_db.append(document_info)
+    documents_by_id[document_info["document_id"]] = document_info
+    insert_sorted(documents_sorted, document_info, DOCUMENT_SORT_KEYS)
+    insert_sorted(documents_by_type.setdefault(document_info["type"], {}), document_info, DOCUMENT_SORT_KEYS)
+    store_versions["documents"] += 1
 
 async def process_document_upload(file: UploadFile = None, youtube_url: str = None, title: str = None, description: str = None):
     """
@@ -20,6 +51,8 @@ async def process_document_upload(file: UploadFile = None, youtube_url: str = No
     Returns:
         Document info
     """
+    import pdfplumber
+    
     try:
         document_id = str(uuid.uuid4())
         
@@ -46,7 +79,7 @@ async def process_document_upload(file: UploadFile = None, youtube_url: str = No
             if file_extension == '.pdf':
                 # Extract first few pages as preview
                 try:
-                    with pdfplumber.open(file_path) as pdf:
+                    with track_stage("pdf_extraction"), pdfplumber.open(file_path) as pdf:
                         for i, page in enumerate(pdf.pages[:3]):  # First 3 pages
                             if i == 0:  # Use first page for title if not provided
                                 extracted_text = page.extract_text() or ""
@@ -82,7 +115,7 @@ async def process_document_upload(file: UploadFile = None, youtube_url: str = No
                 "type": "file"
             }
             
-            documents_db.append(document_info)
+            _store_document(document_info)
             
             return {
                 "document_id": document_id,
@@ -94,9 +127,8 @@ async def process_document_upload(file: UploadFile = None, youtube_url: str = No
             }
             
         elif youtube_url:
-            # Handle YouTube URL processing
-            # This would typically involve YouTube transcript extraction
-            # For now, we'll just store the URL
+            # Fetch the transcript in the background so the first chat about the video doesn't wait for it
+            prefetch_transcript(youtube_url)
             
             if not title:
                 title = f"YouTube Resource: {youtube_url.split('?v=')[-1]}"
@@ -112,7 +144,7 @@ async def process_document_upload(file: UploadFile = None, youtube_url: str = No
                 "type": "youtube"
             }
             
-            documents_db.append(document_info)
+            _store_document(document_info)
             
             return {
                 "document_id": document_id,
@@ -126,62 +158,108 @@ async def process_document_upload(file: UploadFile = None, youtube_url: str = No
             raise HTTPException(status_code=400, detail="No file or YouTube URL provided")
     
     except Exception as e:
-        print(f"Error in document upload: {str(e)}")
+        logger.error("Error in document upload", error=str(e))
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
-def get_all_documents():
-    """Get all documents from the database"""
-    return {"documents": documents_db}
+def get_all_documents(doc_type: str = None, sort: str = "upload_time", cursor: str = None,
+                      limit: int = DEFAULT_PAGE_SIZE, fields: str = None):
+    """
+    Get a page of documents from the database.
+    
+    Args:
+        doc_type: Optional document type to filter by ("file" or "youtube")
+        sort: Sort order ("upload_time", "title", prefix with "-" for descending)
+        cursor: Cursor from the previous page
+        limit: Maximum number of documents to return
+        fields: Optional comma-separated list of fields to return
+        
+    Returns:
+        Page of documents and the cursor for the next page
+    """
+    descending = sort.startswith("-")
+    sort_key = DOCUMENT_SORT_KEYS.get(sort.lstrip("-"))
+    if not sort_key:
+        raise HTTPException(status_code=400, detail=f"Unsupported sort order. Allowed: {', '.join(DOCUMENT_SORT_KEYS)}")
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    
+    # Use the type index when filtering by type
+    index = documents_by_type.get(doc_type, {}) if doc_type else documents_sorted
+    
+    try:
+        page = paginate(
+            index.get(sort.lstrip("-"), []),
+            sort_key=sort_key,
+            descending=descending,
+            cursor=cursor,
+            limit=limit,
+            fields=parse_fields(fields, DOCUMENT_FIELDS) if fields else DEFAULT_DOCUMENT_LIST_FIELDS
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"documents": page["items"], "next_cursor": page["next_cursor"]}
 
 def get_document_by_id(document_id: str):
     """Get a specific document by ID"""
-    document = next((doc for doc in documents_db if doc["document_id"] == document_id), None)
+    document = documents_by_id.get(document_id)
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     return document
 
-async def add_to_rag(file_content, filename):
-    """Add document content to RAG system for retrieval"""
+async def add_to_rag(file, filename, document_id=None):
+    """
+    Add a PDF to the RAG system for retrieval.
+    
+    The file is read page by page and embedded and upserted in batches, so
+    a long document is never held in memory whole. Its vector IDs are
+    recorded under the document ID, which removes them again.
+    
+    Args:
+        file: Seekable binary file object with the PDF (an upload's spooled file)
+        filename: Name stored with each chunk
+        document_id: ID to remove the document by (default: a new ID, returned)
+        
+    Returns:
+        Status message and document ID
+    """
     try:
-        from langchain.text_splitter import RecursiveCharacterTextSplitter
-        from langchain.embeddings import OpenAIEmbeddings
         from ..config.settings import PINECONE_API_KEY, INDEX_NAME
+        from ..services.client_registry import registry
+        from ..services.vector_service import add_document
         
         # Only attempt to use Pinecone if the API key is available
         if PINECONE_API_KEY and INDEX_NAME:
-            from pinecone import Pinecone
-            
-            # Initialize Pinecone
-            pc = Pinecone(api_key=PINECONE_API_KEY)
-            index = pc.Index(INDEX_NAME)
-            
-            # Initialize embedder
-            embedder = OpenAIEmbeddings()
-            
-            # Extract text from PDF
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-            text = "\n".join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
-            
-            # Split text into chunks
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-            chunks = text_splitter.split_text(text)
-            
-            # Create embeddings
-            embeddings = embedder.embed_documents(chunks)
-            
-            # Prepare data for upsert
-            upsert_data = [
-                (str(uuid.uuid4()), embedding, {"text": chunk, "source": filename})
-                for chunk, embedding in zip(chunks, embeddings)
-            ]
-            
-            # Upsert to Pinecone
-            index.upsert(upsert_data)
-            
-            return {"message": f"Added {len(chunks)} chunks from {filename} to RAG"}
+            # Shared index handle and embedder, built once by the client registry
+            result = await add_document(file, filename, document_id or str(uuid.uuid4()), INDEX_NAME,
+                                        registry.get_index, registry.embedder)
+            return {
+                "message": f"Added {result['chunks']} chunks from {filename} to RAG",
+                "document_id": result["document_id"]
+            }
         else:
             return {"message": "Pinecone API key or index name not configured - skipping RAG update"}
             
     except Exception as e:
-        print(f"Error adding to RAG: {str(e)}")
-        return {"message": f"Error adding to RAG: {str(e)}"} 
\ No newline at end of file
+        logger.error("Error adding to RAG", filename=filename, error=str(e))
+        return {"message": f"Error adding to RAG: {str(e)}"}
+
+async def remove_from_rag(document_id):
+    """
+    Delete a document's vectors from the RAG system.
+    
+    Args:
+        document_id: ID the document was added with
+        
+    Returns:
+        Status message and number of vectors deleted
+    """
+    from ..services.client_registry import registry
+    from ..services.vector_service import remove_document
+    
+    try:
+        result = await remove_document(document_id, registry.get_index)
+    except Exception as e:
+        logger.error("Error removing document from RAG", document_id=document_id, error=str(e))
+        raise HTTPException(status_code=500, detail=f"Failed to remove document: {str(e)}")
+    return {"message": f"Removed {result['vectors']} vectors of document {document_id} from RAG", **result}
@@ -0,0 +1,201 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from ..config.settings import (
+    OPENAI_API_KEY,
+    LM_STUDIO_URL,
+    LM_STUDIO_HEADERS,
+    LM_STUDIO_MODELS_URL,
+    LM_STUDIO_KEEPALIVE,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    CIRCUIT_MAX_RESET_TIMEOUT,
+    HEALTH_CHECK_INTERVAL
+)
+from ..services.admission_service import llm_admission, PRIORITY_BATCH
+from ..services.client_registry import registry
+from ..utils.log import get_logger
+
+logger = get_logger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one LLM backend.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are rejected immediately with a 503 for reset_timeout seconds. Then one
+    trial call is let through (half-open); if it succeeds the circuit closes,
+    otherwise it opens again with a doubled timeout, up to max_reset_timeout.
+    """
+
+    def __init__(self, backend: str, failure_threshold: int, reset_timeout: float, max_reset_timeout: float):
+        self.backend = backend
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+        self.last_success = None
+        self.last_failure = None
+        self.last_error = None
+
+    def _retry_after(self) -> int:
+        remaining = self.reset_timeout - (time.monotonic() - self.opened_at) if self.opened_at else 1
+        return max(1, int(remaining + 0.999))
+
+    def ensure_available(self):
+        """Raise a 503 right away if the circuit does not allow a call now."""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+        if self.state == OPEN or (self.state == HALF_OPEN and self.trial_in_progress):
+            raise HTTPException(
+                status_code=503,
+                detail=f"The {self.backend} model is currently unavailable. Please try again shortly.",
+                headers={"Retry-After": str(self._retry_after())}
+            )
+
+    def record_success(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.reset_timeout = self.base_reset_timeout
+        self.opened_at = None
+        self.last_success = time.time()
+
+    def record_failure(self, error: str):
+        self.consecutive_failures += 1
+        self.last_failure = time.time()
+        self.last_error = error[:500]
+        if self.state == HALF_OPEN:
+            # The trial call failed, back off further before the next one
+            self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            self._open()
+        elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        if self.state != OPEN:
+            logger.warning(
+                "Circuit opened",
+                backend=self.backend,
+                consecutive_failures=self.consecutive_failures,
+                error=self.last_error
+            )
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+    @asynccontextmanager
+    async def guard(self):
+        """
+        Wrap one call to the backend, recording its outcome.
+
+        Exceptions count as failures except client errors (HTTPException with
+        a status below 500); cancellations are not counted either way.
+        """
+        self.ensure_available()
+        is_trial = self.state == HALF_OPEN
+        if is_trial:
+            self.trial_in_progress = True
+        try:
+            yield
+        except HTTPException as e:
+            if e.status_code >= 500:
+                self.record_failure(str(e.detail))
+            raise
+        except Exception as e:
+            self.record_failure(f"{type(e).__name__}: {str(e)}")
+            raise
+        else:
+            self.record_success()
+        finally:
+            if is_trial:
+                self.trial_in_progress = False
+
+    def status(self) -> dict:
+        """Current circuit status for this backend."""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_after": self._retry_after() if self.state == OPEN else None,
+            "last_success": self.last_success,
+            "last_failure": self.last_failure,
+            "last_error": self.last_error
+        }
+
+
+# One circuit breaker per LLM backend
+backend_health = {
+    backend: CircuitBreaker(backend, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, CIRCUIT_MAX_RESET_TIMEOUT)
+    for backend in ("local", "openai")
+}
+
+
+async def _probe_local():
+    """
+    Ping LM Studio. A one-token completion also keeps the model loaded.
+
+    The completion takes a batch slot, so it never runs beside a student's
+    generation. While requests hold or wait for a slot, the model is loaded
+    anyway and only the models listing is fetched.
+    """
+    if LM_STUDIO_KEEPALIVE and not llm_admission["local"].busy:
+        payload = {
+            "messages": [{"role": "user", "content": "ping"}],
+            "max_tokens": 1,
+            "temperature": 0,
+            "stream": False
+        }
+        async with llm_admission["local"].slot(PRIORITY_BATCH):
+            response = await registry.http.post(LM_STUDIO_URL, json=payload, headers=LM_STUDIO_HEADERS, timeout=30)
+    else:
+        response = await registry.http.get(LM_STUDIO_MODELS_URL, timeout=5)
+    if response.status_code != 200:
+        raise HTTPException(status_code=502, detail=f"LM Studio health check returned status {response.status_code}")
+
+
+async def _probe_openai():
+    """Ping OpenAI with a cheap models listing."""
+    await registry.openai.models.list()
+
+
+PROBES = {"local": _probe_local, "openai": _probe_openai}
+
+
+async def check_backend(backend: str):
+    """
+    Probe one backend and feed the result into its circuit breaker.
+
+    Backends that served a request within the last interval are skipped,
+    since live traffic already keeps them loaded and reports their health.
+    An open circuit is probed once its reset timeout has passed, so the
+    breaker can close again without waiting for a user request.
+    """
+    breaker = backend_health[backend]
+    if breaker.state == CLOSED and breaker.last_success and time.time() - breaker.last_success < HEALTH_CHECK_INTERVAL:
+        return
+    try:
+        async with breaker.guard():
+            await PROBES[backend]()
+    except Exception:
+        pass
+
+
+async def run_health_monitor():
+    """Periodically probe every configured backend until cancelled."""
+    while True:
+        backends = ["local"] + (["openai"] if OPENAI_API_KEY else [])
+        await asyncio.gather(*(check_backend(backend) for backend in backends))
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+
+def get_backend_health() -> dict:
+    """Circuit status for every LLM backend."""
+    return {backend: breaker.status() for backend, breaker in backend_health.items()}
@@ -0,0 +1,146 @@
+import asyncio
+import uuid
+from itertools import islice
+from typing import Awaitable, BinaryIO, Callable, Iterable, Iterator, List, Optional, Tuple
+from ..config.settings import RAG_CHUNK_TOKENS, RAG_CHUNK_OVERLAP_TOKENS, RAG_BATCH_SIZE
+from ..utils.chunking import chunk_pages, get_token_counter
+from ..utils.metrics import track_stage
+from ..utils.tracing import span
+from ..utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+def iter_pdf_pages(stream: BinaryIO) -> Iterator[Tuple[int, str]]:
+    """
+    Extract a PDF's text one page at a time.
+
+    PyPDF2 keeps every object it has parsed, so the reader's cache is
+    cleared after each page; otherwise a long document would end up fully
+    parsed in memory.
+
+    Args:
+        stream: Seekable binary file object
+
+    Yields:
+        Tuples of (page number from 1, page text)
+    """
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(stream)
+    for number, page in enumerate(reader.pages, start=1):
+        text = page.extract_text() or ""
+        reader.resolved_objects.clear()
+        yield number, text
+
+
+def iter_chunks(pages: Iterable[Tuple[int, str]]) -> Iterator[dict]:
+    """
+    Split page texts into chunks as they arrive, with the same chunker
+    settings as the rest of the ingestion paths.
+
+    Args:
+        pages: Tuples of (page number, text)
+
+    Yields:
+        Chunk dicts from chunk_pages
+    """
+    return chunk_pages(pages, RAG_CHUNK_TOKENS, RAG_CHUNK_OVERLAP_TOKENS)
+
+
+def vector_id(document_id: str, number: int) -> str:
+    """ID of a document's chunk `number`; ingesting the document again overwrites it."""
+    return f"{document_id}#{number:05d}"
+
+
+def chunk_metadata(chunk: dict, source: str, tokenizer: str) -> dict:
+    """Metadata stored with a chunk's vector."""
+    metadata = {
+        "text": chunk["text"],
+        "source": source,
+        "page_start": chunk["page_start"],
+        "page_end": chunk["page_end"],
+        "tokens": chunk["tokens"],
+        "tokenizer": tokenizer
+    }
+    if "section" in chunk:
+        metadata["section"] = chunk["section"]
+    return metadata
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """Group an iterable into lists of up to `size` items."""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+async def ingest_pdf(stream: BinaryIO, source: str, index, embedder, batch_size: int = RAG_BATCH_SIZE,
+                     document_id: Optional[str] = None, namespace: str = "",
+                     on_batch: Optional[Callable[[List[str]], Awaitable]] = None) -> dict:
+    """
+    Extract, split, embed and upsert a PDF one batch of chunks at a time.
+
+    Only the current batch of chunks, its embeddings and the batch being
+    upserted are held in memory, so memory use does not grow with the
+    document. Extraction and splitting run in a worker thread, and a
+    batch's upsert overlaps with embedding the next one.
+
+    Args:
+        stream: Seekable binary file object with the PDF
+        source: Name stored with each chunk
+        index: Pinecone index handle
+        embedder: Embeddings client with aembed_documents
+        batch_size: Chunks per embedding call and upsert
+        document_id: Document the vectors belong to (default: a new ID)
+        namespace: Index namespace to write to
+        on_batch: Awaited with each batch's vector IDs before they are
+            upserted, so they can be recorded first
+
+    Returns:
+        Dict with the document ID and the number of chunks and batches
+    """
+    document_id = document_id or str(uuid.uuid4())
+    batches = batched(iter_chunks(iter_pdf_pages(stream)), batch_size)
+    tokenizer = get_token_counter().name
+    chunk_count = 0
+    batch_count = 0
+    upsert_task = None
+    try:
+        while True:
+            with track_stage("pdf_extraction"):
+                batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+
+            with span("embed_batch", chunks=len(batch)), track_stage("embedding"):
+                embeddings = await embedder.aembed_documents([chunk["text"] for chunk in batch])
+            vectors = [
+                (vector_id(document_id, chunk_count + i), embedding,
+                 {**chunk_metadata(chunk, source, tokenizer), "document_id": document_id})
+                for i, (chunk, embedding) in enumerate(zip(batch, embeddings))
+            ]
+            del embeddings
+            if on_batch is not None:
+                await on_batch([vector[0] for vector in vectors])
+
+            # One upsert in flight: wait for the previous batch before sending this one
+            if upsert_task is not None:
+                await upsert_task
+            upsert_task = asyncio.create_task(_upsert(index, vectors, namespace))
+            chunk_count += len(batch)
+            batch_count += 1
+        if upsert_task is not None:
+            await upsert_task
+    except BaseException:
+        if upsert_task is not None and not upsert_task.done():
+            upsert_task.cancel()
+        raise
+
+    logger.info("Ingested PDF", source=source, document_id=document_id, chunks=chunk_count, batches=batch_count)
+    return {"document_id": document_id, "chunks": chunk_count, "batches": batch_count}
+
+
+async def _upsert(index, vectors: list, namespace: str):
+    with span("upsert_batch", vectors=len(vectors)), track_stage("upsert"):
+        await asyncio.to_thread(index.upsert, vectors=vectors, namespace=namespace)
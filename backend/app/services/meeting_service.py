@@ -1,7 +1,37 @@
 import uuid
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
 from fastapi import HTTPException
-from ..config.settings import professor_availabilities, meeting_bookings
+from ..config.settings import (
+    professor_availabilities,
+    meeting_bookings,
+    availabilities_by_id,
+    availabilities_sorted,
+    availabilities_by_professor,
+    store_versions,
+    MAX_RECURRING_SLOTS,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE
+)
 from ..utils.helpers import generate_google_meet_link
+from ..utils.pagination import insert_sorted, paginate, parse_fields
+
+AVAILABILITY_FIELDS = {"id", "professor_name", "date", "start_time", "end_time", "meeting_link", "is_booked"}
+
+# Sort orders for availability listings; every key ends with the ID so ordering is stable
+AVAILABILITY_SORT_KEYS = {
+    "date": lambda a: (a["date"], a["start_time"], a["id"]),
+    "professor_name": lambda a: (a["professor_name"], a["date"], a["start_time"], a["id"]),
+}
+
+def _store_availability(stored_availability):
+    """Add an availability to storage and its indexes."""
+    professor_availabilities.append(stored_availability)
+    availabilities_by_id[stored_availability["id"]] = stored_availability
+    insert_sorted(availabilities_sorted, stored_availability, AVAILABILITY_SORT_KEYS)
+    insert_sorted(availabilities_by_professor.setdefault(stored_availability["professor_name"], {}),
+                  stored_availability, AVAILABILITY_SORT_KEYS)
+    store_versions["availabilities"] += 1
 
 def add_professor_availability(availability_data):
     """
@@ -26,7 +56,7 @@ def add_professor_availability(availability_data):
     stored_availability = availability_data.dict()
     stored_availability["id"] = availability_id
     stored_availability["meeting_link"] = meeting_link
-    professor_availabilities.append(stored_availability)
+    _store_availability(stored_availability)
     
     return {
         "id": availability_id, 
@@ -34,24 +64,169 @@ def add_professor_availability(availability_data):
         "status": "Availability added successfully"
     }
 
-def get_professor_availabilities(professor_name=None):
+def _parse_time(value):
+    """Parse an HH:MM time string into minutes since midnight."""
+    parsed = datetime.strptime(value, "%H:%M")
+    return parsed.hour * 60 + parsed.minute
+
+def _overlaps(intervals, start, end):
+    """Check whether [start, end) overlaps any interval in the list."""
+    return any(start < other_end and other_start < end for other_start, other_end in intervals)
+
+def add_recurring_availability(recurrence):
+    """
+    Materialize a recurrence rule into availability slots and add them all at once.
+    
+    Every slot is validated (dates, times, overlaps with the professor's existing
+    slots and with each other) before anything is stored, so the whole batch is
+    either added or rejected.
+    
+    Args:
+        recurrence: RecurringAvailability rule
+        
+    Returns:
+        Created availability IDs and meeting links
+    """
+    try:
+        start_date = date.fromisoformat(recurrence.start_date)
+        end_date = date.fromisoformat(recurrence.end_date)
+        start_minutes = _parse_time(recurrence.start_time)
+        end_minutes = _parse_time(recurrence.end_time)
+        excluded = {date.fromisoformat(d) for d in recurrence.exclude_dates}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date or time: {str(e)}")
+    
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    if end_minutes <= start_minutes:
+        raise HTTPException(status_code=400, detail="end_time must be after start_time")
+    if not recurrence.weekdays or any(day < 0 or day > 6 for day in recurrence.weekdays):
+        raise HTTPException(status_code=400, detail="weekdays must be a non-empty list of values from 0 (Monday) to 6 (Sunday)")
+    if recurrence.interval_weeks < 1:
+        raise HTTPException(status_code=400, detail="interval_weeks must be at least 1")
+    
+    # Expand the rule into concrete dates, counting weeks from the start date's week
+    weekdays = set(recurrence.weekdays)
+    first_week_start = start_date - timedelta(days=start_date.weekday())
+    slot_dates = []
+    current = start_date
+    while current <= end_date:
+        week_number = (current - first_week_start).days // 7
+        if (current.weekday() in weekdays
+                and week_number % recurrence.interval_weeks == 0
+                and current not in excluded):
+            slot_dates.append(current)
+            if len(slot_dates) > MAX_RECURRING_SLOTS:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Recurrence would create more than {MAX_RECURRING_SLOTS} slots"
+                )
+        current += timedelta(days=1)
+    
+    if not slot_dates:
+        raise HTTPException(status_code=400, detail="Recurrence rule does not produce any slots")
+    
+    # Index the professor's existing slots by date so each overlap check is local
+    existing_by_date = {}
+    for avail in availabilities_by_professor.get(recurrence.professor_name, {}).get("date", []):
+        try:
+            interval = (_parse_time(avail["start_time"]), _parse_time(avail["end_time"]))
+        except ValueError:
+            continue
+        existing_by_date.setdefault(avail["date"], []).append(interval)
+    
+    conflicts = [
+        slot_date.isoformat() for slot_date in slot_dates
+        if _overlaps(existing_by_date.get(slot_date.isoformat(), []), start_minutes, end_minutes)
+    ]
+    if conflicts:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Slots overlap existing availability on: {', '.join(conflicts)}"
+        )
+    
+    # Build every slot first, then store them in one step
+    new_availabilities = []
+    for slot_date in slot_dates:
+        new_availabilities.append({
+            "professor_name": recurrence.professor_name,
+            "date": slot_date.isoformat(),
+            "start_time": recurrence.start_time,
+            "end_time": recurrence.end_time,
+            "meeting_link": recurrence.meeting_link or generate_google_meet_link(),
+            "is_booked": False,
+            "id": str(uuid.uuid4())
+        })
+    for stored_availability in new_availabilities:
+        _store_availability(stored_availability)
+    
+    return {
+        "count": len(new_availabilities),
+        "availabilities": [
+            {"id": a["id"], "date": a["date"], "meeting_link": a["meeting_link"]}
+            for a in new_availabilities
+        ],
+        "status": "Availabilities added successfully"
+    }
+
+def get_professor_availabilities(professor_name=None, date_from=None, date_to=None, is_booked=None,
+                                 sort="date", cursor=None, limit=DEFAULT_PAGE_SIZE, fields=None):
     """
-    Get availabilities for a specific professor or all professors.
+    Get a page of availabilities, optionally filtered by professor, date range and booked status.
     
     Args:
         professor_name: Optional professor name to filter by
+        date_from: Optional earliest date (YYYY-MM-DD, inclusive)
+        date_to: Optional latest date (YYYY-MM-DD, inclusive)
+        is_booked: Optional booked status to filter by
+        sort: Sort order ("date", "professor_name", prefix with "-" for descending)
+        cursor: Cursor from the previous page
+        limit: Maximum number of availabilities to return
+        fields: Optional comma-separated list of fields to return
         
     Returns:
-        List of availabilities
+        Page of availabilities and the cursor for the next page
     """
-    if professor_name:
-        # Filter availabilities by professor name
-        filtered_availabilities = [a for a in professor_availabilities 
-                                  if a["professor_name"] == professor_name]
-        return {"availabilities": filtered_availabilities}
-    
-    # Return all availabilities if no professor name provided
-    return {"availabilities": professor_availabilities}
+    descending = sort.startswith("-")
+    sort_key = AVAILABILITY_SORT_KEYS.get(sort.lstrip("-"))
+    if not sort_key:
+        raise HTTPException(status_code=400, detail=f"Unsupported sort order. Allowed: {', '.join(AVAILABILITY_SORT_KEYS)}")
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    
+    # Use the professor index when filtering by professor
+    index = availabilities_by_professor.get(professor_name, {}) if professor_name else availabilities_sorted
+    items = index.get(sort.lstrip("-"), [])
+    
+    # Both orders are by date within one professor, so the date range can be bisected
+    # unless listing every professor by name; ISO dates compare correctly as strings
+    by_date = bool(professor_name) or sort.lstrip("-") == "date"
+    lo, hi = 0, len(items)
+    if by_date and date_from is not None:
+        lo = bisect_left(items, date_from, key=lambda a: a["date"])
+    if by_date and date_to is not None:
+        hi = max(bisect_right(items, date_to, key=lambda a: a["date"]), lo)
+    
+    def matches(a):
+        return (by_date or ((date_from is None or a["date"] >= date_from) and (date_to is None or a["date"] <= date_to))) \
+            and (is_booked is None or a["is_booked"] == is_booked)
+    
+    try:
+        page = paginate(
+            items,
+            sort_key=sort_key,
+            descending=descending,
+            cursor=cursor,
+            limit=limit,
+            fields=parse_fields(fields, AVAILABILITY_FIELDS) if fields else None,
+            lo=lo,
+            hi=hi,
+            where=matches
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"availabilities": page["items"], "next_cursor": page["next_cursor"]}
 
 def book_meeting(booking_data):
     """
@@ -64,17 +239,14 @@ def book_meeting(booking_data):
         Booking details
     """
     # Find the availability to update
-    availability = None
-    for avail in professor_availabilities:
-        if avail["id"] == booking_data.availability_id:
-            if avail["is_booked"]:
-                return {"status": "error", "message": "This time slot is already booked"}
-            availability = avail
-            break
+    availability = availabilities_by_id.get(booking_data.availability_id)
     
     if not availability:
         return {"status": "error", "message": "Availability not found"}
     
+    if availability["is_booked"]:
+        return {"status": "error", "message": "This time slot is already booked"}
+    
     # Mark as booked
     availability["is_booked"] = True
     
@@ -90,6 +262,8 @@ def book_meeting(booking_data):
     # Make sure availability_id is included in the stored booking
     stored_booking["availability_id"] = booking_data.availability_id
     meeting_bookings.append(stored_booking)
+    store_versions["availabilities"] += 1
+    store_versions["bookings"] += 1
     
     return {
         "id": booking_id,
@@ -142,22 +316,19 @@ def cancel_booking(booking_id):
             booking_to_cancel = booking
             # Remove the booking from the list
             meeting_bookings.pop(i)
+            store_versions["bookings"] += 1
             break
     
     if not booking_to_cancel:
         raise HTTPException(status_code=404, detail="Booking not found")
     
     # Find the corresponding availability and mark it as available
-    availability_id = booking_to_cancel["availability_id"]
-    availability_updated = False
-    
-    for avail in professor_availabilities:
-        if avail["id"] == availability_id:
-            avail["is_booked"] = False
-            availability_updated = True
-            break
+    availability = availabilities_by_id.get(booking_to_cancel["availability_id"])
     
-    if not availability_updated:
+    if availability:
+        availability["is_booked"] = False
+        store_versions["availabilities"] += 1
+    else:
         # This is an unexpected state, but we'll handle it gracefully
         # The booking was deleted, but we couldn't update the availability
         return {
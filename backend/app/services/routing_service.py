@@ -0,0 +1,183 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from fastapi import HTTPException
+from ..config.settings import (
+    OPENAI_API_KEY,
+    ROUTING_EWMA_ALPHA,
+    ROUTING_PRIOR_LATENCY,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_DEFAULT_DELAY,
+    HEDGE_MIN_DELAY
+)
+from ..services.admission_service import llm_admission
+from ..services.health_service import backend_health
+from ..utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class LatencyTracker:
+    """EWMA latency and error rate, plus a recent-latency window for percentiles, for one backend."""
+
+    def __init__(self, backend: str, prior_latency: float, alpha: float, window: int = 200):
+        self.backend = backend
+        self.alpha = alpha
+        self.ewma_latency = prior_latency
+        self.ewma_error_rate = 0.0
+        self.samples = 0
+        self._recent = deque(maxlen=window)
+
+    def record(self, latency: float, ok: bool):
+        self.samples += 1
+        self.ewma_error_rate = (1 - self.alpha) * self.ewma_error_rate + self.alpha * (0.0 if ok else 1.0)
+        if ok:
+            self.ewma_latency = (1 - self.alpha) * self.ewma_latency + self.alpha * latency
+            self._recent.append(latency)
+
+    @contextmanager
+    def track(self):
+        """Time a completion; exceptions count as errors, cancellations are ignored."""
+        started = time.monotonic()
+        try:
+            yield
+        except HTTPException as e:
+            if e.status_code >= 500:
+                self.record(time.monotonic() - started, ok=False)
+            raise
+        except Exception:
+            self.record(time.monotonic() - started, ok=False)
+            raise
+        else:
+            self.record(time.monotonic() - started, ok=True)
+
+    def percentile(self, q: float):
+        """Latency percentile over the recent window, or None without enough samples."""
+        if len(self._recent) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def score(self) -> float:
+        """
+        Expected latency, inflated by the error rate and the backend's current queue.
+
+        Latencies are timed inside the admission slot, so queueing is only
+        counted here, once.
+        """
+        admission = llm_admission[self.backend]
+        queue_factor = 1 + admission.queue_depth / admission.max_concurrency
+        return self.ewma_latency * queue_factor / max(0.05, 1 - self.ewma_error_rate)
+
+    def stats(self) -> dict:
+        p95 = self.percentile(0.95)
+        return {
+            "ewma_latency": round(self.ewma_latency, 3),
+            "ewma_error_rate": round(self.ewma_error_rate, 3),
+            "p95_latency": round(p95, 3) if p95 is not None else None,
+            "samples": self.samples
+        }
+
+
+latency_stats = {
+    backend: LatencyTracker(backend, ROUTING_PRIOR_LATENCY[backend], ROUTING_EWMA_ALPHA)
+    for backend in ("local", "openai")
+}
+
+
+def rank_backends(priority: str) -> list:
+    """
+    Backends that can take a request right now, best first.
+
+    Backends with an open circuit or a full queue are left out.
+    """
+    candidates = []
+    for backend, tracker in latency_stats.items():
+        if backend == "openai" and not OPENAI_API_KEY:
+            continue
+        try:
+            backend_health[backend].ensure_available()
+            llm_admission[backend].ensure_capacity(priority)
+        except HTTPException:
+            continue
+        candidates.append(backend)
+    return sorted(candidates, key=lambda backend: latency_stats[backend].score())
+
+
+def _hedge_delay(backend: str) -> float:
+    p95 = latency_stats[backend].percentile(0.95)
+    return max(HEDGE_MIN_DELAY, p95 if p95 is not None else HEDGE_DEFAULT_DELAY)
+
+
+async def route_request(backends: list, calls: dict, fallback: bool = True, hedge: bool = True):
+    """
+    Run a request on the best backend, with optional hedging and fallback.
+
+    With hedging, if the primary has not answered within its p95 latency a
+    second request goes to the next backend and whichever succeeds first
+    wins; the other is cancelled. With fallback, a failed request is retried
+    on the remaining backends in order.
+
+    Args:
+        backends: Candidate backends, best first (from rank_backends)
+        calls: Backend name -> zero-argument coroutine function making the request
+        fallback: Whether to retry on another backend after a failure
+        hedge: Whether to send a hedged request to a second backend
+
+    Returns:
+        Tuple of (result, backend that produced it)
+    """
+    if not backends:
+        raise HTTPException(
+            status_code=503,
+            detail="No model is available right now. Please try again shortly.",
+            headers={"Retry-After": "10"}
+        )
+
+    remaining = list(backends)
+    pending = {}
+    last_error = None
+    try:
+        primary = remaining.pop(0)
+        pending[asyncio.ensure_future(calls[primary]())] = primary
+        hedge_at = time.monotonic() + _hedge_delay(primary) if hedge and remaining else None
+
+        while pending:
+            timeout = max(0.0, hedge_at - time.monotonic()) if hedge_at else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:
+                # Primary is slower than its p95: hedge on the next backend
+                hedge_at = None
+                backend = remaining.pop(0)
+                logger.info("Hedging request", primary=primary, backend=backend)
+                pending[asyncio.ensure_future(calls[backend]())] = backend
+                continue
+
+            for task in done:
+                backend = pending.pop(task)
+                try:
+                    return task.result(), backend
+                except Exception as e:
+                    logger.warning("Routed request failed", backend=backend, error=str(e))
+                    last_error = e
+
+            # Every finished request failed; fall back if nothing is still running
+            if not pending and fallback and remaining:
+                hedge_at = None
+                backend = remaining.pop(0)
+                logger.info("Falling back", backend=backend)
+                pending[asyncio.ensure_future(calls[backend]())] = backend
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    raise last_error
+
+
+def get_routing_stats() -> dict:
+    """Latency and error statistics for every LLM backend."""
+    return {backend: tracker.stats() for backend, tracker in latency_stats.items()}
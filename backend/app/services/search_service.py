@@ -1,9 +1,114 @@
-import requests
-from bs4 import BeautifulSoup
-from duckduckgo_search import DDGS
 import asyncio
+from ..services.client_registry import registry
+from ..utils.metrics import track_stage
+from ..utils.tracing import span
+from ..utils.log import get_logger
 from typing import Tuple, List, Dict, Any
 
+logger = get_logger(__name__)
+
+ACADEMIC_DOMAINS = [
+    'doi.org',
+    'scholar.google',
+    'researchgate',
+    'academia.edu',
+    'arxiv.org',
+    '.edu',
+    '.ac.',
+    'ncbi.nlm.nih.gov',
+    'semanticscholar.org'
+]
+
+def parse_result_page(result: Dict[str, Any], html: str, query: str) -> Dict[str, Any]:
+    """
+    Extract the title, description and leading paragraphs of a search result's
+    page and score its relevance to the query.
+    
+    Args:
+        result: Search result from DDGS (href, title, body)
+        html: The fetched page
+        query: User's search query
+        
+    Returns:
+        Formatted result with content, is_academic and relevance_score
+    """
+    from bs4 import BeautifulSoup
+    
+    with span("parse_page"):
+        soup = BeautifulSoup(html, 'html.parser')
+    
+    # Extract more detailed information
+    title = soup.title.string if soup.title else result.get('title', 'No title')
+    
+    # Try to get meta description
+    meta_desc = soup.find('meta', {'name': 'description'})
+    description = meta_desc['content'] if meta_desc else result.get('body', 'No description available')
+    
+    # Extract main content (customize based on common academic sites)
+    main_content = soup.find('main') or soup.find('article') or soup.find('div', {'class': ['content', 'main', 'article']})
+    
+    # Extract relevant text paragraphs
+    paragraphs = []
+    if main_content:
+        for p in main_content.find_all('p')[:3]:  # Get first 3 paragraphs
+            paragraphs.append(p.get_text().strip())
+    
+    # Check for academic indicators
+    is_academic = any(domain in result['href'] for domain in ACADEMIC_DOMAINS)
+    
+    # Relevance score based on keyword matching
+    query_keywords = set(query.lower().split())
+    title_keywords = set(title.lower().split())
+    desc_keywords = set(description.lower().split())
+    
+    # Calculate keyword match score
+    keyword_match_score = len(query_keywords & title_keywords) * 2 + len(query_keywords & desc_keywords)
+    
+    # Format the result with enhanced information
+    return {
+        "title": title[:200],  # Limit title length
+        "link": result['href'],
+        "summary": description[:500],  # Limit description length
+        "content": ' '.join(paragraphs)[:1000] if paragraphs else description,  # Use extracted paragraphs if available
+        "is_academic": is_academic,
+        "relevance_score": keyword_match_score  # Add relevance score for sorting
+    }
+
+def rank_search_results(formatted_results: List[Dict[str, Any]], num_results: int) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Pick the top results and build the search context for the LLM.
+    
+    Args:
+        formatted_results: Results from parse_result_page
+        num_results: Number of results to keep
+        
+    Returns:
+        Tuple of (search_context, top_results), with content and score removed from the results
+    """
+    search_context = "Relevant academic and research sources:\n\n"
+    
+    # Sort results by relevance score and academic status
+    formatted_results.sort(key=lambda x: (x.get('relevance_score', 0) * (2 if x.get('is_academic', False) else 1)), reverse=True)
+    
+    # Take top results
+    top_results = formatted_results[:num_results]
+    
+    # Build search context for the LLM
+    for i, result in enumerate(top_results):
+        search_context += f"[Source {i+1}] {result['title']}\n"
+        search_context += f"URL: {result['link']}\n"
+        search_context += f"Summary: {result['summary']}\n"
+        if result.get('content'):
+            search_context += f"Content: {result['content']}\n"
+        search_context += "\n"
+        
+        # Clean up result for the frontend
+        result.pop('content', None)  # Remove content field for frontend
+        result.pop('relevance_score', None)  # Remove score field
+        
+    return search_context, top_results
+
+@track_stage("web_search")
 async def get_web_search_results(query: str, professor: dict, num_results: int = 5) -> Tuple[str, List[Dict[str, Any]]]:
     """
     Perform academic-focused web search for the given query.
@@ -16,6 +121,9 @@ async def get_web_search_results(query: str, professor: dict, num_results: int =
     Returns:
         Tuple of (search_context, search_results)
     """
+    import httpx
+    from duckduckgo_search import DDGS
+    
     try:
         ddgs = DDGS()
         
@@ -30,14 +138,14 @@ async def get_web_search_results(query: str, professor: dict, num_results: int =
         
         all_results = []
         formatted_results = []
-        search_context = "Relevant academic and research sources:\n\n"
         
         # Track already processed URLs to avoid duplicates
         processed_urls = set()
         
         # Perform multiple targeted searches
         for specialized_query in academic_queries:
-            results = list(ddgs.text(specialized_query, max_results=4))
+            with span("search_query", query=specialized_query[:100]):
+                results = list(ddgs.text(specialized_query, max_results=4))
             
             # Process each result with BeautifulSoup
             for result in results:
@@ -47,92 +155,28 @@ async def get_web_search_results(query: str, professor: dict, num_results: int =
                         
                         # Fetch the webpage content
                         try:
-                            response = requests.get(result['href'], timeout=5)
-                            soup = BeautifulSoup(response.text, 'html.parser')
-                            
-                            # Extract more detailed information
-                            title = soup.title.string if soup.title else result.get('title', 'No title')
-                            
-                            # Try to get meta description
-                            meta_desc = soup.find('meta', {'name': 'description'})
-                            description = meta_desc['content'] if meta_desc else result.get('body', 'No description available')
-                            
-                            # Extract main content (customize based on common academic sites)
-                            main_content = soup.find('main') or soup.find('article') or soup.find('div', {'class': ['content', 'main', 'article']})
-                            
-                            # Extract relevant text paragraphs
-                            paragraphs = []
-                            if main_content:
-                                for p in main_content.find_all('p')[:3]:  # Get first 3 paragraphs
-                                    paragraphs.append(p.get_text().strip())
-                            
-                            # Check for academic indicators
-                            is_academic = any([
-                                'doi.org' in result['href'],
-                                'scholar.google' in result['href'],
-                                'researchgate' in result['href'],
-                                'academia.edu' in result['href'],
-                                'arxiv.org' in result['href'],
-                                '.edu' in result['href'],
-                                '.ac.' in result['href'],
-                                'ncbi.nlm.nih.gov' in result['href'],
-                                'semanticscholar.org' in result['href']
-                            ])
-                            
-                            # Relevance score based on keyword matching
-                            query_keywords = set(query.lower().split())
-                            title_keywords = set(title.lower().split())
-                            desc_keywords = set(description.lower().split())
-                            
-                            # Calculate keyword match score
-                            keyword_match_score = len(query_keywords & title_keywords) * 2 + len(query_keywords & desc_keywords)
-                            
-                            # Format the result with enhanced information
-                            formatted_result = {
-                                "title": title[:200],  # Limit title length
-                                "link": result['href'],
-                                "summary": description[:500],  # Limit description length
-                                "content": ' '.join(paragraphs)[:1000] if paragraphs else description,  # Use extracted paragraphs if available
-                                "is_academic": is_academic,
-                                "relevance_score": keyword_match_score  # Add relevance score for sorting
-                            }
+                            with span("fetch_page", url=result['href']) as fetch:
+                                response = await registry.http.get(result['href'], timeout=5)
+                                fetch.set(status_code=response.status_code, bytes=len(response.content))
+                            formatted_result = parse_result_page(result, response.text, query)
                             
                             formatted_results.append(formatted_result)
                             
                             if len(formatted_results) >= num_results * 3:  # Collect 3x more results than needed
                                 break
                                 
-                        except (requests.exceptions.RequestException, requests.exceptions.Timeout):
+                        except httpx.HTTPError:
                             # Skip this result if we can't fetch the page
                             continue
                 except Exception as e:
-                    print(f"Error processing search result: {e}")
+                    logger.warning("Error processing search result", url=result.get('href'), error=str(e), sample=0.1)
                     continue
             
             if len(formatted_results) >= num_results * 3:
                 break
         
-        # Sort results by relevance score and academic status
-        formatted_results.sort(key=lambda x: (x.get('relevance_score', 0) * (2 if x.get('is_academic', False) else 1)), reverse=True)
-        
-        # Take top results
-        top_results = formatted_results[:num_results]
-        
-        # Build search context for the LLM
-        for i, result in enumerate(top_results):
-            search_context += f"[Source {i+1}] {result['title']}\n"
-            search_context += f"URL: {result['link']}\n"
-            search_context += f"Summary: {result['summary']}\n"
-            if result.get('content'):
-                search_context += f"Content: {result['content']}\n"
-            search_context += "\n"
-            
-            # Clean up result for the frontend
-            result.pop('content', None)  # Remove content field for frontend
-            result.pop('relevance_score', None)  # Remove score field
-            
-        return search_context, top_results
+        return rank_search_results(formatted_results, num_results)
         
     except Exception as e:
-        print(f"Error in web search: {e}")
+        logger.error("Error in web search", query=query, error=str(e))
         return "", [] 
\ No newline at end of file
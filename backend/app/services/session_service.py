@@ -0,0 +1,252 @@
+import asyncio
+import contextvars
+import time
+import uuid
+from typing import Dict, List, Optional
+from fastapi import HTTPException
+from ..config.settings import (
+    chat_sessions,
+    SESSION_HISTORY_TOKENS,
+    SESSION_SUMMARY_TOKENS,
+    SESSION_STORE_SIZE,
+    SESSION_TTL
+)
+from ..services.admission_service import llm_admission, PRIORITY_BATCH
+from ..services.client_registry import registry
+from ..services.health_service import backend_health
+from ..utils.metrics import track_stage, LLMTimer, record_tokens
+from ..utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Summaries being written, by session ID, so a session is summarized by one task at a time
+_summaries: Dict[str, asyncio.Task] = {}
+
+session_stats = {"created": 0, "expired": 0, "evictions": 0, "reseeded": 0, "summaries": 0, "summary_errors": 0}
+
+SUMMARY_PROMPT = """You keep the running summary of a tutoring conversation between a student and a professor.
+Update the summary with the new turns. Keep the questions the student asked, what was explained,
+definitions, examples and page or timestamp references the student may come back to, and anything the
+student said they did not understand. Drop greetings and repetition. Write plain prose in the third person."""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting (about four characters per token for English)."""
+    return len(text) // 4 + 1
+
+
+def _store(session: dict):
+    chat_sessions.pop(session["id"], None)
+    chat_sessions[session["id"]] = session
+    while len(chat_sessions) > SESSION_STORE_SIZE:
+        chat_sessions.pop(next(iter(chat_sessions)))
+        session_stats["evictions"] += 1
+
+
+def _lookup(session_id: str) -> Optional[dict]:
+    """Stored session, marked as recently used; sessions idle for SESSION_TTL are dropped."""
+    session = chat_sessions.pop(session_id, None)
+    if session is None:
+        return None
+    if time.time() - session["updated_at"] > SESSION_TTL:
+        session_stats["expired"] += 1
+        return None
+    chat_sessions[session_id] = session
+    return session
+
+
+def open_session(session_id: Optional[str], kind: str, subject: str, previous_messages: list = None) -> dict:
+    """
+    Get the session a chat turn belongs to, starting a new one if no ID is given.
+
+    Args:
+        session_id: ID returned by an earlier turn, or None to start a session
+        kind: "document" or "youtube"
+        subject: Document ID or video ID the session is about
+        previous_messages: History sent by the client; only used to seed a
+            new session, including one replacing a session that is gone
+
+    Returns:
+        Session dictionary
+    """
+    if session_id:
+        session = _lookup(session_id)
+        if session is None:
+            # Expired, evicted, lost in a restart or held by another worker: a client that sent
+            # its messages continues in a new session seeded from them
+            if not previous_messages:
+                raise HTTPException(status_code=404, detail="Session not found or expired. Start a new session.")
+            logger.info("Session not found, starting a new one from the client's messages", session_id=session_id, kind=kind)
+            session_stats["reseeded"] += 1
+        elif session["kind"] != kind or session["subject"] != subject:
+            raise HTTPException(status_code=400, detail=f"Session {session_id} belongs to a different {session['kind']}")
+        else:
+            return session
+
+    now = time.time()
+    session = {
+        "id": str(uuid.uuid4()),
+        "kind": kind,
+        "subject": subject,
+        "created_at": now,
+        "updated_at": now,
+        "turns": [],  # Append-only: {"role", "content", "at"}
+        "summary": "",
+        "summarized_turns": 0  # Leading turns covered by the summary
+    }
+    for msg in previous_messages or []:
+        if msg.get("role") in ("user", "assistant") and isinstance(msg.get("content"), str):
+            session["turns"].append({"role": msg["role"], "content": msg["content"], "at": now})
+    session_stats["created"] += 1
+    _store(session)
+    return session
+
+
+def session_history(session: dict) -> List[dict]:
+    """
+    Conversation history to put in the prompt, within SESSION_HISTORY_TOKENS.
+
+    The summary of older turns comes first, then the most recent turns that
+    fit the rest of the budget. Turns that no longer fit are left out until
+    the background summary covers them.
+
+    Args:
+        session: Session dictionary
+
+    Returns:
+        List of chat messages
+    """
+    messages = []
+    budget = SESSION_HISTORY_TOKENS
+    if session["summary"]:
+        messages.append({"role": "system", "content": f"Summary of the conversation so far:\n{session['summary']}"})
+        budget -= estimate_tokens(session["summary"])
+
+    recent = []
+    for turn in reversed(session["turns"][session["summarized_turns"]:]):
+        tokens = estimate_tokens(turn["content"])
+        if tokens > budget:
+            break
+        recent.append({"role": turn["role"], "content": turn["content"]})
+        budget -= tokens
+    # Don't open the history with an answer whose question was left out
+    if recent and recent[-1]["role"] == "assistant":
+        recent.pop()
+    messages.extend(reversed(recent))
+    return messages
+
+
+def record_turn(session: dict, message: str, response: str):
+    """
+    Append a question and its answer to the session, and start summarizing
+    older turns once the unsummarized ones outgrow the history budget.
+
+    Args:
+        session: Session dictionary
+        message: The student's message
+        response: The professor's answer
+    """
+    now = time.time()
+    session["turns"].append({"role": "user", "content": message, "at": now})
+    session["turns"].append({"role": "assistant", "content": response, "at": now})
+    session["updated_at"] = now
+    _store(session)
+
+    unsummarized = sum(estimate_tokens(turn["content"]) for turn in session["turns"][session["summarized_turns"]:])
+    if unsummarized > SESSION_HISTORY_TOKENS and session["id"] not in _summaries:
+        # Run outside the request's trace: the summary is written after the response is sent
+        task = asyncio.create_task(_summarize(session), context=contextvars.Context())
+        _summaries[session["id"]] = task
+
+
+async def _summarize(session: dict):
+    """Fold older turns into the summary, keeping recent turns worth half the budget verbatim."""
+    try:
+        turns = session["turns"]
+        keep_tokens = SESSION_HISTORY_TOKENS // 2
+        upto = len(turns)
+        while upto > session["summarized_turns"] and keep_tokens - estimate_tokens(turns[upto - 1]["content"]) >= 0:
+            keep_tokens -= estimate_tokens(turns[upto - 1]["content"])
+            upto -= 1
+        while upto < len(turns) and turns[upto]["role"] == "assistant":
+            upto += 1  # Summarize an answer along with its question
+        if upto <= session["summarized_turns"]:
+            return
+
+        new_turns = "\n\n".join(
+            f"{turn['role'].title()}: {turn['content']}" for turn in turns[session["summarized_turns"]:upto]
+        )
+        with track_stage("session_summary"):
+            async with llm_admission["openai"].slot(PRIORITY_BATCH), backend_health["openai"].guard():
+                with LLMTimer("openai"):
+                    response = await registry.openai.chat.completions.create(
+                        model="gpt-4o-mini",
+                        messages=[
+                            {"role": "system", "content": SUMMARY_PROMPT},
+                            {"role": "user", "content": f"Summary so far:\n{session['summary'] or '(none)'}\n\nNew turns:\n\n{new_turns}"}
+                        ],
+                        temperature=0.3,
+                        max_tokens=SESSION_SUMMARY_TOKENS
+                    )
+        record_tokens(response.model, None, response.usage)
+
+        # Turns are only ever appended, so the first `upto` are still the ones summarized
+        session["summary"] = response.choices[0].message.content.strip()
+        session["summarized_turns"] = upto
+        session_stats["summaries"] += 1
+        logger.info("Summarized chat session", session_id=session["id"], summarized_turns=upto, turns=len(turns))
+    except Exception as e:
+        # Recent turns still fit the budget without a summary; the next turn retries
+        session_stats["summary_errors"] += 1
+        logger.warning("Could not summarize chat session", session_id=session["id"], error=str(e))
+    finally:
+        _summaries.pop(session["id"], None)
+
+
+def get_session(session_id: str) -> dict:
+    """
+    Get a session's turn log and summary.
+
+    Args:
+        session_id: Session ID
+
+    Returns:
+        Session details
+    """
+    session = _lookup(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {
+        "session_id": session["id"],
+        "kind": session["kind"],
+        "subject": session["subject"],
+        "created_at": session["created_at"],
+        "updated_at": session["updated_at"],
+        "turns": session["turns"],
+        "summary": session["summary"],
+        "summarized_turns": session["summarized_turns"]
+    }
+
+
+def delete_session(session_id: str) -> dict:
+    """
+    Delete a session.
+
+    Args:
+        session_id: Session ID
+
+    Returns:
+        Status message
+    """
+    if chat_sessions.pop(session_id, None) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"message": "Session deleted"}
+
+
+def get_session_stats() -> dict:
+    """Store size, summaries in progress and counters."""
+    return {
+        "stored": len(chat_sessions),
+        "summarizing": len(_summaries),
+        **session_stats
+    }
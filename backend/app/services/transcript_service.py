@@ -0,0 +1,336 @@
+import asyncio
+import contextvars
+import math
+import operator
+import re
+import time
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from ..config.settings import (
+    youtube_transcripts,
+    TRANSCRIPT_STORE_SIZE,
+    TRANSCRIPT_ERROR_TTL,
+    TRANSCRIPT_WINDOW_SECONDS,
+    TRANSCRIPT_FULL_TEXT_CHARS,
+    TRANSCRIPT_CONTEXT_CHARS,
+    TRANSCRIPT_SEMANTIC_WEIGHT
+)
+from ..services.client_registry import registry
+from ..utils.helpers import extract_youtube_video_id, format_transcript, format_timestamp
+from ..utils.metrics import track_stage
+from ..utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# A transcript segment: (start seconds, duration seconds, text)
+Segment = Tuple[float, float, str]
+
+# Fetches in progress by video ID, so concurrent requests share one download
+_fetches: Dict[str, asyncio.Task] = {}
+
+transcript_stats = {"hits": 0, "waits": 0, "misses": 0, "fetches": 0, "errors": 0, "evictions": 0}
+
+TERM_PATTERN = re.compile(r"\w+")
+
+# Words too common in questions and speech to say which part of a video is meant
+STOPWORDS = {
+    "a", "about", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "does", "for", "from",
+    "he", "how", "i", "if", "in", "is", "it", "its", "me", "of", "on", "or", "so", "that", "the", "there",
+    "they", "this", "to", "um", "uh", "was", "we", "what", "when", "where", "which", "who", "why", "will",
+    "with", "you", "video", "explain", "talk", "say", "said"
+}
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def _download_segments(video_id: str) -> List[Segment]:
+    """Download a transcript (blocking) and convert it to compact segments."""
+    from youtube_transcript_api import YouTubeTranscriptApi
+
+    if hasattr(YouTubeTranscriptApi, "get_transcript"):
+        # youtube-transcript-api before 1.0
+        entries = YouTubeTranscriptApi.get_transcript(video_id)
+    else:
+        entries = YouTubeTranscriptApi().fetch(video_id).to_raw_data()
+    return [(float(entry["start"]), float(entry["duration"]), entry["text"]) for entry in entries]
+
+
+def _terms(text: str) -> List[str]:
+    return [term for term in TERM_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+def build_transcript_index(segments: List[Segment]) -> dict:
+    """
+    Group segments into windows of TRANSCRIPT_WINDOW_SECONDS and index their terms.
+
+    Returns:
+        Dict with the windows (start, end, text, terms, length), document
+        frequencies and average window length for BM25, and the length of
+        the whole formatted transcript
+    """
+    windows = []
+    current = []
+    for segment in segments:
+        if current and segment[0] >= current[0][0] + TRANSCRIPT_WINDOW_SECONDS:
+            windows.append(current)
+            current = []
+        current.append(segment)
+    if current:
+        windows.append(current)
+
+    indexed = []
+    document_frequency = Counter()
+    for window in windows:
+        text = " ".join(segment[2].strip() for segment in window)
+        terms = Counter(_terms(text))
+        document_frequency.update(terms.keys())
+        indexed.append({
+            "start": window[0][0],
+            "end": window[-1][0] + window[-1][1],
+            "text": text,
+            "terms": terms,
+            "length": sum(terms.values())
+        })
+
+    return {
+        "windows": indexed,
+        "document_frequency": document_frequency,
+        "average_length": sum(w["length"] for w in indexed) / len(indexed) if indexed else 0.0,
+        "full_text_chars": sum(len(segment[2]) + 9 for segment in segments),  # "[MM:SS] " and a newline per segment
+        "embeddings": None
+    }
+
+
+async def _embed_windows(index: dict, video_id: str):
+    """Embed the windows of a long transcript; retrieval falls back to lexical scores if this fails."""
+    if index["full_text_chars"] <= TRANSCRIPT_FULL_TEXT_CHARS:
+        return
+    try:
+        with track_stage("embedding"):
+            vectors = await registry.embedder.aembed_documents([w["text"] for w in index["windows"]])
+        # Single precision halves the memory of a stored video and is plenty for ranking
+        index["embeddings"] = [array("f", vector) for vector in vectors]
+    except Exception as e:
+        logger.warning("Could not embed transcript windows, using lexical retrieval", video_id=video_id, error=str(e))
+
+
+def _store(video_id: str, entry: dict):
+    youtube_transcripts.pop(video_id, None)
+    youtube_transcripts[video_id] = entry
+    while len(youtube_transcripts) > TRANSCRIPT_STORE_SIZE:
+        youtube_transcripts.pop(next(iter(youtube_transcripts)))
+        transcript_stats["evictions"] += 1
+
+
+def _lookup(video_id: str) -> Optional[dict]:
+    """Stored entry for a video, marked as recently used; failed fetches expire after TRANSCRIPT_ERROR_TTL."""
+    entry = youtube_transcripts.pop(video_id, None)
+    if entry is None:
+        return None
+    if entry["status"] == "error" and time.time() - entry["fetched_at"] > TRANSCRIPT_ERROR_TTL:
+        return None
+    youtube_transcripts[video_id] = entry
+    return entry
+
+
+async def _fetch(video_id: str):
+    transcript_stats["fetches"] += 1
+    try:
+        with track_stage("youtube_transcript"):
+            segments = await asyncio.to_thread(_download_segments, video_id)
+            index = await asyncio.to_thread(build_transcript_index, segments)
+        await _embed_windows(index, video_id)
+        _store(video_id, {"status": "ready", "segments": segments, "index": index, "fetched_at": time.time()})
+        logger.info("Fetched YouTube transcript", video_id=video_id, segments=len(segments), windows=len(index["windows"]))
+    except Exception as e:
+        transcript_stats["errors"] += 1
+        logger.warning("Could not fetch YouTube transcript", video_id=video_id, error=str(e))
+        _store(video_id, {"status": "error", "error": str(e), "fetched_at": time.time()})
+    finally:
+        _fetches.pop(video_id, None)
+
+
+def _start_fetch(video_id: str) -> asyncio.Task:
+    task = _fetches.get(video_id)
+    if task is None:
+        # Run outside the caller's trace: the fetch may outlive the request that started it
+        task = asyncio.create_task(_fetch(video_id), context=contextvars.Context())
+        _fetches[video_id] = task
+    return task
+
+
+def prefetch_transcript(youtube_url: str) -> Optional[str]:
+    """
+    Start fetching a video's transcript in the background, unless it is
+    already stored or on its way.
+
+    Args:
+        youtube_url: YouTube video URL
+
+    Returns:
+        The video ID, or None if it could not be read from the URL
+    """
+    video_id = extract_youtube_video_id(youtube_url)
+    if video_id and _lookup(video_id) is None:
+        _start_fetch(video_id)
+    return video_id
+
+
+async def _get_entry(video_id: str) -> Optional[dict]:
+    entry = _lookup(video_id)
+    if entry is None:
+        task = _fetches.get(video_id)
+        if task is not None:
+            transcript_stats["waits"] += 1
+        else:
+            transcript_stats["misses"] += 1
+            task = _start_fetch(video_id)
+        # Shielded so a cancelled request does not cancel a fetch others may be waiting on
+        await asyncio.shield(task)
+        entry = youtube_transcripts.get(video_id)
+    else:
+        transcript_stats["hits"] += 1
+
+    if entry is None or entry["status"] != "ready":
+        return None
+    return entry
+
+
+async def get_transcript_segments(video_id: str) -> Optional[List[Segment]]:
+    """
+    Get a video's transcript segments from the store.
+
+    Waits for a prefetch that is still running, and only downloads the
+    transcript if the video was never registered (or a failed fetch has
+    expired).
+
+    Args:
+        video_id: YouTube video ID
+
+    Returns:
+        List of (start, duration, text) segments, or None if the video has no transcript
+    """
+    entry = await _get_entry(video_id)
+    return entry["segments"] if entry else None
+
+
+def _bm25_scores(index: dict, question: str) -> List[float]:
+    query_terms = set(_terms(question))
+    count = len(index["windows"])
+    scores = []
+    for window in index["windows"]:
+        score = 0.0
+        for term in query_terms:
+            frequency = window["terms"].get(term)
+            if not frequency:
+                continue
+            idf = math.log(1 + (count - index["document_frequency"][term] + 0.5) / (index["document_frequency"][term] + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * window["length"] / (index["average_length"] or 1))
+            score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        scores.append(score)
+    return scores
+
+
+def _normalize(scores: List[float]) -> List[float]:
+    low, high = min(scores), max(scores)
+    if high <= low:
+        return [0.0] * len(scores)
+    return [(score - low) / (high - low) for score in scores]
+
+
+async def _semantic_scores(index: dict, question: str) -> Optional[List[float]]:
+    if not index["embeddings"]:
+        return None
+    try:
+        with track_stage("embedding"):
+            query = await registry.embedder.aembed_query(question)
+    except Exception as e:
+        logger.warning("Could not embed question, using lexical retrieval", error=str(e))
+        return None
+    # OpenAI embeddings are unit length, so the dot product is the cosine similarity
+    return [sum(map(operator.mul, vector, query)) for vector in index["embeddings"]]
+
+
+async def get_transcript_context(video_id: str, question: str) -> Optional[dict]:
+    """
+    Get the part of a video's transcript to send with a question.
+
+    Transcripts up to TRANSCRIPT_FULL_TEXT_CHARS are sent whole. Longer ones
+    are ranked window by window against the question (embedding similarity
+    blended with BM25), and the best windows that fit in
+    TRANSCRIPT_CONTEXT_CHARS are sent in time order, each under its
+    [MM:SS-MM:SS] range, with adjacent windows merged.
+
+    Args:
+        video_id: YouTube video ID
+        question: The student's question
+
+    Returns:
+        Dict with the transcript "text", the "windows" sent as
+        {"start", "end"} seconds, and "complete" (whether that is the whole
+        transcript), or None if the video has no transcript
+    """
+    entry = await _get_entry(video_id)
+    if entry is None:
+        return None
+    index = entry["index"]
+
+    if index["full_text_chars"] <= TRANSCRIPT_FULL_TEXT_CHARS:
+        return {
+            "text": format_transcript(entry["segments"]),
+            "windows": [{"start": w["start"], "end": w["end"]} for w in index["windows"]],
+            "complete": True
+        }
+
+    lexical = _normalize(_bm25_scores(index, question))
+    semantic = await _semantic_scores(index, question)
+    if semantic is not None:
+        semantic = _normalize(semantic)
+        scores = [TRANSCRIPT_SEMANTIC_WEIGHT * s + (1 - TRANSCRIPT_SEMANTIC_WEIGHT) * l for s, l in zip(semantic, lexical)]
+    else:
+        scores = lexical
+
+    # Best windows first, until the budget is spent; ties keep the earlier window
+    chosen = []
+    budget = TRANSCRIPT_CONTEXT_CHARS
+    for position in sorted(range(len(scores)), key=lambda i: (-scores[i], i)):
+        size = len(index["windows"][position]["text"]) + 16
+        if size > budget:
+            continue
+        chosen.append(position)
+        budget -= size
+        if budget < 200:
+            break
+
+    # Send in time order, merging runs of adjacent windows into one range
+    ranges = []
+    for position in sorted(chosen):
+        window = index["windows"][position]
+        if ranges and ranges[-1]["last"] == position - 1:
+            ranges[-1]["end"] = window["end"]
+            ranges[-1]["texts"].append(window["text"])
+            ranges[-1]["last"] = position
+        else:
+            ranges.append({"start": window["start"], "end": window["end"], "texts": [window["text"]], "last": position})
+
+    text = "\n\n".join(
+        f"[{format_timestamp(r['start'])}-{format_timestamp(r['end'])}] {' '.join(r['texts'])}"
+        for r in ranges
+    )
+    return {
+        "text": text,
+        "windows": [{"start": r["start"], "end": r["end"]} for r in ranges],
+        "complete": False
+    }
+
+
+def get_transcript_stats() -> dict:
+    """Store size, fetches in progress and hit/miss counters."""
+    return {
+        "stored": len(youtube_transcripts),
+        "in_flight": len(_fetches),
+        **transcript_stats
+    }
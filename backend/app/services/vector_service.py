@@ -0,0 +1,231 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
+from ..config.settings import RAG_NAMESPACE, RAG_MANIFEST_PATH, RAG_DELETE_BATCH_SIZE
+from ..services.ingest_service import ingest_pdf, batched
+from ..utils.metrics import track_stage
+from ..utils.tracing import span
+from ..utils.log import get_logger
+
+logger = get_logger(__name__)
+
+MANIFEST_VERSION = 1
+
+# Per-document manifest, loaded from RAG_MANIFEST_PATH on first use:
+# {"version": 1, "documents": {document_id: {"index", "namespace", "source", "vector_ids", "status", "updated_at"}}}
+_manifest: Optional[dict] = None
+
+# Snapshots are numbered as they are taken and written by worker threads;
+# one that is older than the file on disk is dropped instead of written
+_write_lock = threading.Lock()
+_snapshots = 0
+_written = 0
+
+# Adds and removals of one document run one at a time: a removal waits for an
+# ingestion in flight, and two adds of one ID do not share a manifest entry.
+# Each lock is kept with the number of callers holding or waiting for it.
+_document_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+
+@asynccontextmanager
+async def _document_lock(document_id: str):
+    lock, users = _document_locks.get(document_id, (None, 0))
+    lock = lock or asyncio.Lock()
+    _document_locks[document_id] = (lock, users + 1)
+    try:
+        async with lock:
+            yield
+    finally:
+        lock, users = _document_locks[document_id]
+        if users == 1:
+            del _document_locks[document_id]
+        else:
+            _document_locks[document_id] = (lock, users - 1)
+
+
+def load_manifest(path: str = RAG_MANIFEST_PATH) -> dict:
+    """Read a per-document manifest, or start an empty one if the file does not exist."""
+    if os.path.exists(path):
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+        logger.warning("Ignoring RAG manifest with another version", path=path, version=manifest.get("version"))
+    return {"version": MANIFEST_VERSION, "documents": {}}
+
+
+def get_manifest() -> dict:
+    """The app's per-document manifest."""
+    global _manifest
+    if _manifest is None:
+        _manifest = load_manifest()
+    return _manifest
+
+
+async def save_manifest():
+    """Write the manifest atomically, without blocking the event loop on the file."""
+    global _snapshots
+    _snapshots += 1
+    # Serialized here, on the event loop, so the snapshot is consistent
+    await asyncio.to_thread(_write_manifest, json.dumps(get_manifest()), _snapshots)
+
+
+def _write_manifest(data: str, snapshot: int):
+    global _written
+    with _write_lock:
+        if snapshot <= _written:
+            return
+        temp_path = f"{RAG_MANIFEST_PATH}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(data)
+        os.replace(temp_path, RAG_MANIFEST_PATH)
+        _written = snapshot
+
+
+def delete_vectors(index, ids: Iterable[str], namespace: str, batch_size: int = RAG_DELETE_BATCH_SIZE) -> int:
+    """
+    Delete vectors by ID, in batches of up to batch_size IDs.
+
+    Args:
+        index: Pinecone index handle
+        ids: Vector IDs; IDs that do not exist are ignored by the index
+        namespace: Namespace the vectors are in
+        batch_size: IDs per delete call
+
+    Returns:
+        Number of IDs sent
+    """
+    deleted = 0
+    for batch in batched(ids, batch_size):
+        index.delete(ids=batch, namespace=namespace)
+        deleted += len(batch)
+    return deleted
+
+
+async def add_document(stream: BinaryIO, source: str, document_id: str, index_name: str,
+                       get_index: Callable, embedder) -> dict:
+    """
+    Ingest a PDF into RAG_NAMESPACE and record its vectors under document_id.
+
+    Each batch's vector IDs are saved to the manifest before the batch is
+    upserted, so every vector in the namespace can be found from its
+    document even if ingestion stops part way. A document that was added
+    before is removed first. Adds and removals of the same document wait
+    for each other.
+
+    Args:
+        stream: Seekable binary file object with the PDF
+        source: Name stored with each chunk
+        document_id: ID the document is removed by
+        index_name: Pinecone index to write to
+        get_index: Returns the index handle for an index name
+        embedder: Embeddings client with aembed_documents
+
+    Returns:
+        Dict with the document ID and the number of chunks and batches
+    """
+    async with _document_lock(document_id):
+        return await _add_document(stream, source, document_id, index_name, get_index, embedder)
+
+
+async def _add_document(stream: BinaryIO, source: str, document_id: str, index_name: str,
+                        get_index: Callable, embedder) -> dict:
+    documents = get_manifest()["documents"]
+    if document_id in documents:
+        await _remove_document(document_id, get_index)
+
+    entry = {
+        "index": index_name,
+        "namespace": RAG_NAMESPACE,
+        "source": source,
+        "vector_ids": [],
+        "status": "ingesting",
+        "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    }
+    documents[document_id] = entry
+
+    async def record(ids: List[str]):
+        entry["vector_ids"].extend(ids)
+        await save_manifest()
+
+    try:
+        result = await ingest_pdf(stream, source, get_index(index_name), embedder,
+                                  document_id=document_id, namespace=RAG_NAMESPACE, on_batch=record)
+    except BaseException:
+        # Vectors already recorded stay in the manifest, so removing the document still finds them
+        if not entry["vector_ids"] and documents.get(document_id) is entry:
+            del documents[document_id]
+        raise
+
+    entry["status"] = "indexed"
+    entry["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    await save_manifest()
+    return result
+
+
+async def remove_document(document_id: str, get_index: Callable) -> dict:
+    """
+    Delete a document's vectors and drop it from the manifest.
+
+    The document stays in the manifest until all its vectors are deleted,
+    so a failed removal can be retried. A removal of a document that is
+    still being ingested waits for the ingestion to finish.
+
+    Args:
+        document_id: ID the document was added with
+        get_index: Returns the index handle for an index name
+
+    Returns:
+        Dict with the document ID and the number of vectors deleted (0 for
+        a document that is not in the manifest)
+    """
+    async with _document_lock(document_id):
+        return await _remove_document(document_id, get_index)
+
+
+async def _remove_document(document_id: str, get_index: Callable) -> dict:
+    documents = get_manifest()["documents"]
+    entry = documents.get(document_id)
+    if entry is None:
+        logger.info("Document has no vectors to remove", document_id=document_id)
+        return {"document_id": document_id, "vectors": 0}
+
+    ids = entry["vector_ids"]
+    with span("vector_delete", vectors=len(ids)), track_stage("vector_delete"):
+        deleted = await asyncio.to_thread(delete_vectors, get_index(entry["index"]), ids, entry["namespace"])
+    if documents.get(document_id) is entry:
+        del documents[document_id]
+    await save_manifest()
+    logger.info("Removed document vectors", document_id=document_id, vectors=deleted, namespace=entry["namespace"])
+    return {"document_id": document_id, "vectors": deleted}
+
+
+def find_orphans(index, index_name: str, namespace: str, manifest_path: str = RAG_MANIFEST_PATH) -> dict:
+    """
+    Find vectors in a namespace that no document in the manifest owns.
+
+    The namespace is listed before the manifest is read: IDs are saved to
+    the manifest before they are upserted, so a vector being written
+    while this runs is never reported.
+
+    Args:
+        index: Pinecone index handle (a serverless index; pod indexes cannot list IDs)
+        index_name: Name of the index, to match manifest entries
+        namespace: Namespace to scan
+        manifest_path: Manifest of the app writing to the namespace
+
+    Returns:
+        Dict with the number of vectors listed and the orphaned IDs
+    """
+    listed = [vector.id for page in index.list(namespace=namespace) for vector in page.vectors]
+    owned = {
+        vector_id
+        for entry in load_manifest(manifest_path)["documents"].values()
+        if entry["index"] == index_name and entry["namespace"] == namespace
+        for vector_id in entry["vector_ids"]
+    }
+    return {"listed": len(listed), "orphans": [vector_id for vector_id in listed if vector_id not in owned]}
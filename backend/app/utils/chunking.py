@@ -0,0 +1,245 @@
+import re
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Tuple
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# Encoding of OpenAI's embedding models (text-embedding-ada-002 and text-embedding-3-*)
+EMBEDDING_ENCODING = "cl100k_base"
+
+
+# Sentence ends: terminal punctuation (and closing quotes or brackets) followed by a space,
+# in text whose whitespace has been collapsed
+SENTENCE_END = re.compile(r"[.!?][\"')\]]* ")
+
+# Lines that open a section: numbered ("2.1 Gradient descent", "Lecture 3") or markdown
+NUMBERED_HEADING = re.compile(r"(?:#{1,6} |(?:\d+(?:\.\d+)*\.?|[IVX]+\.|(?:Chapter|Section|Part|Lecture) \d+)\s+\S)")
+# Other headings are all caps or title case, made of words only
+PLAIN_HEADING = re.compile(r"[A-Za-z0-9][\w&'/-]*(?:\s+[\w&'/-]+)*")
+MAX_HEADING_CHARS = 80
+# Lines short enough to be headings that follow a blank line or the end of a sentence. Matching
+# from the character before the line break keeps the scan cheap, unlike a lookbehind at every position
+HEADING_CANDIDATE = re.compile(r"[.!?\"')\]\n][^\S\n]*\n[^\S\n]*([^\n]{0,%d}[^\s.,;:!?])[^\S\n]*(?=\n|\Z)" % (MAX_HEADING_CHARS - 1))
+MAX_TITLE_WORDS = 8
+
+# A page (1-based page number, text) as extracted from a document
+Page = Tuple[int, str]
+
+
+class TokenCounter:
+    """
+    Counts tokens with the tiktoken encoding of the embedding model, or
+    estimates them if the encoding is not available (e.g. offline).
+    """
+
+    def __init__(self, encoding_name: str = EMBEDDING_ENCODING):
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(encoding_name)
+            self.name = encoding_name
+        except Exception as e:
+            logger.warning("Could not load tokenizer, estimating token counts", encoding=encoding_name, error=str(e))
+            self._encoding = None
+            self.name = "estimate"
+
+    def count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode_ordinary(text))
+        # Without the encoding (tiktoken downloads it on first use): about four tokens per three English words
+        return -(-len(text.split()) * 4 // 3)
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        # encode_ordinary_batch starts a thread pool per call, which costs more than it saves on short texts
+        if self._encoding is not None:
+            encode = self._encoding.encode_ordinary
+            return [len(encode(text)) for text in texts]
+        return [self.count(text) for text in texts]
+
+    def split(self, text: str, max_tokens: int) -> List[str]:
+        """Cut a text with more than max_tokens tokens into pieces of at most max_tokens, at word breaks where possible."""
+        if self._encoding is not None:
+            tokens = self._encoding.encode_ordinary(text)
+            return [self._encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+        pieces = []
+        current = ""
+        for word in re.findall(r"\s*\S+", text):
+            if current and self.count(current + word) > max_tokens:
+                pieces.append(current)
+                current = word.lstrip()
+            else:
+                current += word
+        if current:
+            pieces.append(current)
+        return pieces
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(encoding_name: str = EMBEDDING_ENCODING) -> TokenCounter:
+    """Shared token counter for an encoding, loaded once per process."""
+    return TokenCounter(encoding_name)
+
+
+def _is_heading(line: str) -> bool:
+    if NUMBERED_HEADING.match(line):
+        return True
+    if not PLAIN_HEADING.fullmatch(line):
+        return False
+    if line.isupper():
+        return True
+    words = line.split()
+    return len(words) <= MAX_TITLE_WORDS and all(word[0].isupper() for word in words if len(word) > 3 and word[0].isalpha())
+
+
+def page_units(text: str) -> Iterator[Tuple[str, str]]:
+    """
+    Break a page's text into headings and sentences.
+
+    Lines wrapped by the PDF are joined with spaces, and runs of whitespace
+    are collapsed. A short line is a heading when it follows a blank line
+    or the end of a sentence (or starts the page) and looks like one:
+    numbered, or all caps or title case words without punctuation.
+
+    Yields:
+        Tuples of ("heading" or "sentence", text)
+    """
+    # The blank line in front lets the first line of the page be a heading
+    text = "\n\n" + text
+    start = 0
+    for candidate in HEADING_CANDIDATE.finditer(text):
+        line = candidate.group(1)
+        if _is_heading(line):
+            yield from _sentences(text[start:candidate.start(1)])
+            yield "heading", " ".join(line.split())
+            start = candidate.end()
+    yield from _sentences(text[start:])
+
+
+def _sentences(text: str) -> Iterator[Tuple[str, str]]:
+    text = " ".join(text.split())
+    start = 0
+    for end in SENTENCE_END.finditer(text):
+        yield "sentence", text[start:end.end() - 1]
+        start = end.end()
+    if start < len(text):
+        yield "sentence", text[start:]
+
+
+def chunk_pages(pages: Iterable[Page], max_tokens: int, overlap_tokens: int = 0,
+                counter: Optional[TokenCounter] = None) -> Iterator[dict]:
+    """
+    Split pages into chunks of at most max_tokens tokens, as they arrive.
+
+    Chunks are made of whole sentences. A heading always starts a new
+    chunk, and a chunk at least half full ends at the end of its page, so
+    chunks rarely straddle sections or pages. Consecutive chunks within a
+    section and page share up to overlap_tokens tokens of whole sentences.
+    Sentences longer than max_tokens are cut into pieces.
+
+    Token counts are what the chunk text encodes to when the encoding is
+    available: sentences and headings are counted once, with the separators
+    that join them placed so they encode the same alone as in the chunk.
+
+    Args:
+        pages: Tuples of (page number, text)
+        max_tokens: Most tokens in a chunk
+        overlap_tokens: Most tokens repeated from the end of the previous chunk
+        counter: Token counter (default: the embedding model's)
+
+    Yields:
+        Dicts with "text", "tokens", "page_start", "page_end" and, when the
+        chunk is under a heading, "section"
+    """
+    counter = counter or get_token_counter()
+    current = []  # Units of the chunk being built: [page, kind, text with separators, tokens]
+    current_tokens = 0
+    fresh = 0  # Units added since the last chunk, so overlap alone is never emitted
+    section = None
+
+    def emit():
+        text = "".join(unit[2] for unit in current)
+        tokens = current_tokens
+        # Separators at the ends of the chunk are dropped. They only change how the word
+        # next to them encodes, so that word is counted with and without them
+        if len(current) == 1:
+            if text.strip() != text:
+                tokens = counter.count(text.strip())
+        else:
+            first, last = current[0][2], current[-1][2]
+            if first[0].isspace():
+                word = first.split(None, 1)[0]
+                tokens -= counter.count(first[:first.index(word)] + word) - counter.count(word)
+            if last[-1].isspace():
+                word = last.rsplit(None, 1)[-1]
+                tokens -= counter.count(word + last[last.rindex(word) + len(word):]) - counter.count(word)
+        chunk = {
+            "text": text.strip(),
+            "tokens": tokens,
+            "page_start": current[0][0],
+            "page_end": current[-1][0]
+        }
+        if section:
+            chunk["section"] = section
+        return chunk
+
+    def overlap():
+        """Units from the end of the chunk worth up to overlap_tokens, without headings."""
+        kept = []
+        tokens = 0
+        for unit in reversed(current):
+            if unit[1] == "heading" or tokens + unit[3] > overlap_tokens:
+                break
+            kept.append(unit)
+            tokens += unit[3]
+        kept.reverse()
+        return kept, tokens
+
+    for page_number, text in pages:
+        if not text:
+            continue
+        units = list(page_units(text))
+        if not units:
+            continue
+
+        # Sentences are joined by spaces, and headings and page ends by line breaks. A space
+        # goes with the sentence after it and a line break with the unit before it, the way
+        # the encoder splits text into pieces, so units encode the same alone as joined
+        texts = []
+        for i, (kind, unit_text) in enumerate(units):
+            follows_sentence = i > 0 and kind == "sentence" and units[i - 1][0] == "sentence"
+            ends_line = kind == "heading" or i == len(units) - 1 or units[i + 1][0] == "heading"
+            texts.append((" " if follows_sentence else "") + unit_text + ("\n" if ends_line else ""))
+        counts = counter.count_many(texts)
+
+        # Prefer ending a well-filled chunk at the page break
+        if current and fresh and current_tokens >= max_tokens // 2:
+            yield emit()
+            current, current_tokens, fresh = [], 0, 0
+
+        for (kind, unit_text), separated, tokens in zip(units, texts, counts):
+            if kind == "heading":
+                if current and fresh:
+                    yield emit()
+                current, current_tokens, fresh = [], 0, 0
+                section = unit_text
+
+            pieces = [(separated, tokens)]
+            if tokens > max_tokens:
+                split = counter.split(separated, max_tokens)
+                pieces = list(zip(split, counter.count_many(split)))
+
+            for piece, piece_tokens in pieces:
+                if current and current_tokens + piece_tokens > max_tokens:
+                    if fresh:
+                        yield emit()
+                    current, current_tokens = overlap()
+                    fresh = 0
+                    # Overlap that no longer fits with the new unit is dropped
+                    while current and current_tokens + piece_tokens > max_tokens:
+                        current_tokens -= current.pop(0)[3]
+                current.append([page_number, kind, piece, piece_tokens])
+                current_tokens += piece_tokens
+                fresh += 1
+
+    if current and fresh:
+        yield emit()
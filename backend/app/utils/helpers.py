@@ -1,16 +1,18 @@
 import re
 import random
 import string
-import uuid
 import io
-import requests
 import tempfile
-import PyPDF2
-import pdfplumber
-from bs4 import BeautifulSoup
-from duckduckgo_search import DDGS
 from urllib.parse import urlparse, parse_qs
-from youtube_transcript_api import YouTubeTranscriptApi
+from .metrics import track_stage
+from .tracing import span
+from .log import get_logger
+from .lecture_components import detect_lecture_components
+
+logger = get_logger(__name__)
+
+# PDF, HTTP and YouTube libraries are imported inside the functions that use
+# them, so importing the app does not pay for them until they are needed
 
 
 def process_thinking_content(content: str) -> dict:
@@ -59,54 +61,64 @@ def process_thinking_content(content: str) -> dict:
         }
 
 
+class ThinkingSplitter:
+    """
+    Route a streamed response to the "thinking" or "final" channel as
+    <think> tags open and close, dropping the tags. A chunk ending in what
+    may be the start of a tag is held back until the next chunk decides it.
+    """
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self.channel = "final"
+        self._pending = ""
+
+    def feed(self, delta: str) -> list:
+        """Split the next chunk; returns (channel, text) pairs."""
+        text = self._pending + delta
+        self._pending = ""
+        parts = []
+        while text:
+            tag = self.CLOSE_TAG if self.channel == "thinking" else self.OPEN_TAG
+            index = text.find(tag)
+            if index >= 0:
+                if index:
+                    parts.append((self.channel, text[:index]))
+                self.channel = "final" if self.channel == "thinking" else "thinking"
+                text = text[index + len(tag):]
+                continue
+            held = next((size for size in range(min(len(tag) - 1, len(text)), 0, -1) if tag.startswith(text[-size:])), 0)
+            if len(text) > held:
+                parts.append((self.channel, text[:len(text) - held]))
+            self._pending = text[len(text) - held:]
+            break
+        return parts
+
+    def finish(self) -> list:
+        """Release text held back at the end of the response."""
+        parts = [(self.channel, self._pending)] if self._pending else []
+        self._pending = ""
+        return parts
+
+
+@track_stage("lecture_formatting")
 def process_lecture_formatting(response_text: str) -> dict:
     """
     Process lecture-style responses to enhance the classroom experience
     by detecting and formatting special lecture components.
-    """
-    # Initialize lecture components
-    lecture_components = {
-        "has_whiteboard": False,
-        "has_equation": False,
-        "has_example": False,
-        "has_diagram": False,
-        "has_references": False
-    }
-    
-    formatted_text = response_text
-    
-    # Detect whiteboard content (code blocks)
-    if "```" in formatted_text:
-        lecture_components["has_whiteboard"] = True
-    
-    # Detect equations (using LaTeX-style delimiters)
-    if "$" in formatted_text or "\\begin{equation}" in formatted_text:
-        lecture_components["has_equation"] = True
-    
-    # Detect examples 
-    example_patterns = [
-        r"(?i)example[s]?:", r"(?i)for example,", 
-        r"(?i)let's consider", r"(?i)consider this example"
-    ]
-    for pattern in example_patterns:
-        if re.search(pattern, formatted_text):
-            lecture_components["has_example"] = True
-            break
-    
-    # Detect diagrams
-    diagram_patterns = [r"(?i)diagram", r"(?i)figure", r"(?i)illustration"]
-    for pattern in diagram_patterns:
-        if re.search(pattern, formatted_text):
-            lecture_components["has_diagram"] = True
-            break
     
-    # Detect references/citations
-    if re.search(r"\[\d+\]|\[Source \d+\]", formatted_text) or "according to" in formatted_text.lower():
-        lecture_components["has_references"] = True
+    Components are found in a single pass; their positions are returned
+    alongside the flags so whiteboard and equation blocks can be rendered
+    without parsing the text again.
+    """
+    lecture_components, component_positions = detect_lecture_components(response_text)
     
     return {
-        "formatted_text": formatted_text,
-        "lecture_components": lecture_components
+        "formatted_text": response_text,
+        "lecture_components": lecture_components,
+        "component_positions": component_positions
     }
 
 
@@ -117,16 +129,22 @@ def generate_google_meet_link():
     return f"https://meet.google.com/{meeting_id}-{random.randint(100, 999)}-{random.randint(100, 999)}"
 
 
+@track_stage("pdf_extraction")
 async def extract_text_from_pdf_url(pdf_url):
     """Extract text from a PDF at the given URL"""
+    import PyPDF2
+    import pdfplumber
+    
     try:
-        print(f"Downloading PDF from URL: {pdf_url}")
-        response = requests.get(pdf_url)
-        response.raise_for_status()  # Check if download was successful
+        logger.debug("Downloading PDF", url=pdf_url)
+        from ..services.client_registry import registry
+        with span("pdf_download", url=pdf_url) as download:
+            response = await registry.http.get(pdf_url)
+            response.raise_for_status()  # Check if download was successful
+            download.set(bytes=len(response.content))
         
         # Method 1: Try with PyPDF2 first
         try:
-            print("Extracting text using PyPDF2...")
             pdf_content = io.BytesIO(response.content)
             pdf_reader = PyPDF2.PdfReader(pdf_content)
             
@@ -138,10 +156,9 @@ async def extract_text_from_pdf_url(pdf_url):
             if text.strip():
                 return text
         except Exception as e:
-            print(f"PyPDF2 extraction failed: {e}")
+            logger.warning("PyPDF2 extraction failed, trying pdfplumber", url=pdf_url, error=str(e))
         
         # Method 2: Try with pdfplumber if PyPDF2 fails or returns empty text
-        print("Extracting text using pdfplumber...")
         with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
             temp_file.write(response.content)
             temp_file_path = temp_file.name
@@ -155,43 +172,29 @@ async def extract_text_from_pdf_url(pdf_url):
         
         return text
     except Exception as e:
-        print(f"Error extracting text from PDF: {e}")
+        logger.error("Error extracting text from PDF", url=pdf_url, error=str(e))
         return f"Error extracting text from PDF: {str(e)}"
 
 
-def get_youtube_transcript(youtube_url: str) -> str:
-    """
-    Extract transcript from a YouTube video URL.
-    """
-    try:
-        # Extract video ID from URL
-        parsed_url = urlparse(youtube_url)
-        
-        if parsed_url.netloc == 'youtu.be':
-            video_id = parsed_url.path.lstrip('/')
-        else:
-            # For youtube.com URLs
-            if 'v' in parse_qs(parsed_url.query):
-                video_id = parse_qs(parsed_url.query)['v'][0]
-            else:
-                return "Error: Could not extract video ID from URL"
-        
-        # Get transcript
-        transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
-        
-        # Format transcript with timestamps
-        formatted_transcript = ""
-        for entry in transcript_list:
-            # Convert seconds to MM:SS format
-            minutes = int(entry['start'] / 60)
-            seconds = int(entry['start'] % 60)
-            timestamp = f"[{minutes:02d}:{seconds:02d}]"
-            
-            # Add entry with timestamp
-            formatted_transcript += f"{timestamp} {entry['text']}\n"
-        
-        return formatted_transcript
-        
-    except Exception as e:
-        print(f"Error extracting YouTube transcript: {str(e)}")
-        return f"Error: {str(e)}" 
\ No newline at end of file
+def extract_youtube_video_id(youtube_url: str):
+    """Get the video ID from a youtube.com/watch?v= or youtu.be URL, or None."""
+    parsed_url = urlparse(youtube_url)
+    
+    if parsed_url.netloc == 'youtu.be':
+        return parsed_url.path.lstrip('/') or None
+    
+    # For youtube.com URLs
+    query = parse_qs(parsed_url.query)
+    if 'v' in query:
+        return query['v'][0]
+    return None
+
+
+def format_timestamp(seconds: float) -> str:
+    """Format a video position as MM:SS (minutes keep counting past an hour)."""
+    return f"{int(seconds // 60):02d}:{int(seconds % 60):02d}"
+
+
+def format_transcript(segments: list) -> str:
+    """Format (start, duration, text) transcript segments as "[MM:SS] text" lines."""
+    return "".join(f"[{format_timestamp(start)}] {text}\n" for start, _, text in segments)
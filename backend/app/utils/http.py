@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import json
+import uuid
+from typing import Any, Awaitable, Callable
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from .log import get_logger
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the standard library encoder
+    orjson = None
+
+logger = get_logger(__name__)
+
+# Non-standard status (from nginx) for requests the client abandoned
+CLIENT_CLOSED_REQUEST = 499
+
+# How often to check whether the client of a long-running request is still there
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# Distinguishes ETags issued by different processes, since the in-memory
+# store versions start from zero again after every restart
+BOOT_ID = uuid.uuid4().hex[:8]
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when available, compact stdlib JSON otherwise."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(
+            content,
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":")
+        ).encode("utf-8")
+
+
+def make_etag(request: Request, *versions: int) -> str:
+    """Build a weak ETag from store versions and the request's path and query."""
+    key = f"{BOOT_ID}:{':'.join(str(v) for v in versions)}:{request.url.path}?{request.url.query}"
+    return f'W/"{hashlib.blake2b(key.encode("utf-8"), digest_size=12).hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the request's If-None-Match header against an ETag."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def conditional_json(request: Request, versions: tuple, build: Callable[[], Any]) -> Response:
+    """
+    Return a JSON response with an ETag, or an empty 304 if the client's copy is current.
+
+    The body is only built and serialized when the client does not already
+    have the current version, so repeat polls skip both the query and the
+    encoding work.
+
+    Args:
+        request: Incoming request
+        versions: Versions of every store the response depends on
+        build: Function producing the response content
+
+    Returns:
+        304 response or JSON response with an ETag header
+    """
+    etag = make_etag(request, *versions)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(build(), headers=headers)
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable) -> Any:
+    """
+    Await a long-running operation, cancelling it if the client disconnects first.
+
+    Cancellation propagates into the upstream call, which closes its connection
+    so the model stops generating and the request's resources are released.
+
+    Args:
+        request: Incoming request
+        awaitable: Operation to run (e.g. a chat service coroutine)
+
+    Returns:
+        The operation's result, or an empty 499 response if the client went away
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info("Client disconnected, cancelling request", path=request.url.path)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                return Response(status_code=CLIENT_CLOSED_REQUEST)
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def sse_event(event: dict) -> str:
+    """Format an event dict as a server-sent event."""
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
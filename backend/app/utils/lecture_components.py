@@ -0,0 +1,183 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Phrases that mark examples, diagrams and references (case-insensitive, as regexes)
+PHRASES = [
+    "examples?:", "for example,", "let's consider", "consider this example",
+    "diagram", "figure", "illustration",
+    "according to",
+]
+
+
+def _marker_pattern() -> re.Pattern:
+    # Every marker in one alternation, so a response is scanned once. Each
+    # alternative starts with a literal character, which lets re skip ahead
+    # to candidate characters in C instead of trying every alternative at
+    # every position; phrases are spelled out once per case of their first letter.
+    alternatives = [
+        r"```(?=([\w+#.-]{0,20}))",  # Fence, with the language in group 1
+        r"\$\$",
+        r"\$",
+        r"\\begin\{equation\}",
+        r"\\end\{equation\}",
+        r"\[\d{1,6}\]",
+        r"\[Source \d{1,6}\]",
+    ]
+    for phrase in PHRASES:
+        for first in (phrase[0].lower(), phrase[0].upper()):
+            alternatives.append(f"{re.escape(first)}(?i:{phrase[1:]})")
+    return re.compile("|".join(alternatives))
+
+
+MARKER_PATTERN = _marker_pattern()
+
+# Kind of component a phrase marks, by its first letter ("f" is either)
+PHRASE_KINDS = {"e": "example", "l": "example", "c": "example", "d": "diagram", "i": "diagram", "a": "reference"}
+
+# Longest stretch a marker match looks at ("```" plus a 20-character language).
+# A marker further than this from the end of the text seen so far is final.
+MAX_MARKER_LENGTH = 23
+
+FLAG_NAMES = {
+    "whiteboard": "has_whiteboard",
+    "equation": "has_equation",
+    "example": "has_example",
+    "diagram": "has_diagram",
+    "reference": "has_references",
+}
+
+
+class LectureComponentDetector:
+    """
+    Find lecture components (whiteboard code blocks, equations, examples,
+    diagrams and references) and their character positions in one pass.
+
+    Feed the response in chunks as it streams and call finish() at the end;
+    feed() returns the components completed so far, so blocks can be
+    rendered before the response is done. Positions are offsets into the
+    full response. Whiteboard blocks and equations span from the opening to
+    the closing delimiter; examples, diagrams and references span the phrase
+    that marked them. Flags match the old per-feature checks: any "$" sets
+    has_equation, even inside a code block.
+    """
+
+    def __init__(self):
+        self.flags = {name: False for name in FLAG_NAMES.values()}
+        self.components: List[Dict[str, Any]] = []
+        self._buffer = ""  # Text not yet scanned, or scanned but too close to the end to be final
+        self._offset = 0  # Position of the buffer in the full response
+        self._fence: Optional[Dict[str, Any]] = None  # Open whiteboard block
+        self._math: Optional[Tuple[str, int]] = None  # Open equation: (opening marker, start)
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Scan the next chunk; returns the components it completed."""
+        self._buffer += chunk
+        return self._scan(final=False)
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Scan what is left; an unclosed whiteboard block runs to the end of the text."""
+        found = self._scan(final=True)
+        if self._fence is not None:
+            found.append(self._emit("whiteboard", self._fence["start"], self._offset, language=self._fence["language"]))
+            self._fence = None
+        self._math = None
+        return found
+
+    def _scan(self, final: bool) -> List[Dict[str, Any]]:
+        found = []
+        buffer = self._buffer
+        # A marker starting here or earlier cannot grow with more text
+        settled = len(buffer) if final else len(buffer) - MAX_MARKER_LENGTH
+        resume = 0
+        for match in MARKER_PATTERN.finditer(buffer):
+            if match.start() > settled:
+                break
+            self._handle(match, buffer, found)
+            resume = match.end()
+        keep_from = len(buffer) if final else max(resume, settled + 1, 0)
+
+        # An inline $...$ may not cross a line break, including in text about to be dropped
+        if self._math and self._math[0] == "$" and "\n" in buffer[max(0, self._math[1] - self._offset):keep_from]:
+            self._math = None
+
+        self._buffer = buffer[keep_from:]
+        self._offset += keep_from
+        return found
+
+    def _handle(self, match, buffer: str, found: list):
+        kind = self._classify(match.group())
+        start = self._offset + match.start()
+        end = self._offset + match.end()
+
+        if kind == "fence":
+            self.flags["has_whiteboard"] = True
+            if self._fence is None:
+                self._fence = {"start": start, "language": match.group(1) or None}
+                self._math = None
+            else:
+                found.append(self._emit("whiteboard", self._fence["start"], end, language=self._fence["language"]))
+                self._fence = None
+            return
+
+        if kind in ("display", "dollar", "begin_equation", "end_equation"):
+            if kind != "end_equation":
+                self.flags["has_equation"] = True
+            if self._fence is not None:
+                return
+            self._handle_math(kind, match, buffer, start, end, found)
+            return
+
+        self.flags[FLAG_NAMES[kind]] = True
+        if self._fence is None:
+            found.append(self._emit(kind, start, end))
+
+    @staticmethod
+    def _classify(marker: str) -> str:
+        first = marker[0]
+        if first == "`":
+            return "fence"
+        if first == "$":
+            return "display" if len(marker) == 2 else "dollar"
+        if first == "\\":
+            return "begin_equation" if marker[1] == "b" else "end_equation"
+        if first == "[":
+            return "reference"
+        first = first.lower()
+        if first == "f":
+            return "example" if len(marker) > len("figure") else "diagram"
+        return PHRASE_KINDS[first]
+
+    def _handle_math(self, kind: str, match, buffer: str, start: int, end: int, found: list):
+        closers = {"$$": "display", "\\begin{equation}": "end_equation", "$": "dollar"}
+        if self._math and self._math[0] == "$" and "\n" in buffer[max(0, self._math[1] - self._offset):match.start()]:
+            # A $ left open at a line break was not an equation
+            self._math = None
+        if self._math is None:
+            if kind != "end_equation":
+                self._math = (match.group(), start)
+            return
+
+        opener, opened_at = self._math
+        if closers[opener] != kind:
+            # Stray delimiters inside an open equation are part of it
+            return
+        found.append(self._emit("equation", opened_at, end, display=opener != "$"))
+        self._math = None
+
+    def _emit(self, kind: str, start: int, end: int, **extra) -> Dict[str, Any]:
+        component = {"type": kind, "start": start, "end": end, **extra}
+        self.components.append(component)
+        return component
+
+
+def detect_lecture_components(text: str) -> Tuple[Dict[str, bool], List[Dict[str, Any]]]:
+    """
+    Detect lecture components in a complete response.
+
+    Returns:
+        Tuple of (flags such as has_whiteboard, components with type/start/end)
+    """
+    detector = LectureComponentDetector()
+    detector.feed(text)
+    detector.finish()
+    return detector.flags, detector.components
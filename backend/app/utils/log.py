@@ -0,0 +1,205 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from ..config.settings import LOG_LEVEL, LOG_FORMAT, LOG_MAX_FIELD_LENGTH, LOG_QUEUE_SIZE, LOG_DEBUG_SAMPLE_RATE
+from .tracing import current_trace_id
+
+# Field names whose values are never written out
+REDACTED_KEYS = {"api_key", "authorization", "password", "secret", "openai_api_key", "pinecone_api_key"}
+
+# Longest list written out before the rest is summarized
+MAX_LIST_ITEMS = 10
+
+_listener = None
+_queue_handler = None
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}...(+{len(text) - limit} chars)"
+
+
+def sanitize(value, depth: int = 0):
+    """
+    Make a field value safe and cheap to log.
+
+    Secrets are redacted, long strings truncated to LOG_MAX_FIELD_LENGTH,
+    chat message lists summarized by count and size, and long or deeply
+    nested containers cut short.
+    """
+    if isinstance(value, str):
+        return _truncate(value, LOG_MAX_FIELD_LENGTH)
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    if depth >= 3:
+        return _truncate(repr(value), 100)
+    if isinstance(value, dict):
+        clean = {}
+        for key, item in value.items():
+            if str(key).lower() in REDACTED_KEYS:
+                clean[key] = "[redacted]"
+            elif key == "messages" and isinstance(item, list):
+                # Prompts carry whole documents and transcripts; log their shape only
+                clean[key] = f"[{len(item)} messages, {sum(len(str(m.get('content', ''))) for m in item if isinstance(m, dict))} chars]"
+            else:
+                clean[key] = sanitize(item, depth + 1)
+        return clean
+    if isinstance(value, (list, tuple, set)):
+        items = list(value)
+        clean = [sanitize(item, depth + 1) for item in items[:MAX_LIST_ITEMS]]
+        if len(items) > MAX_LIST_ITEMS:
+            clean.append(f"...(+{len(items) - MAX_LIST_ITEMS} items)")
+        return clean
+    return _truncate(str(value), LOG_MAX_FIELD_LENGTH)
+
+
+class StructuredFormatter(logging.Formatter):
+    """Render a record and its fields as one text line (key=value) or one JSON object."""
+
+    def __init__(self, output: str = "text"):
+        super().__init__()
+        self.output = output
+
+    def format(self, record):
+        fields = getattr(record, "fields", {})
+        if self.output == "json":
+            entry = {
+                "time": self.formatTime(record),
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+                **fields
+            }
+            if record.exc_text:
+                entry["exception"] = record.exc_text
+            return json.dumps(entry, default=str, ensure_ascii=False)
+
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(
+                f"{key}={value if isinstance(value, str) and ' ' not in value else json.dumps(value, default=str, ensure_ascii=False)}"
+                for key, value in fields.items()
+            )
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records when the queue is full instead of blocking the caller."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolve the message and traceback now, since exc_info does not survive
+        # the queue, but leave the fields for the formatter on the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging():
+    """
+    Route app logs through a bounded in-memory queue to a background writer thread.
+
+    Request handlers only enqueue records; formatting and stdout I/O happen
+    on the listener thread. Safe to call more than once.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(StructuredFormatter(LOG_FORMAT))
+
+    _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    base = logging.getLogger("tutorai")
+    base.setLevel(LOG_LEVEL)
+    base.addHandler(_queue_handler)
+    base.propagate = False
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, output)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class StructuredLogger:
+    """
+    Leveled logger taking a message plus keyword fields.
+
+    Fields are sanitized before they are queued and the current trace id is
+    added, so a log line can be matched to its /api/debug/traces waterfall.
+    Pass sample=0.1 to keep a random 10% of a noisy call; debug records are
+    sampled at LOG_DEBUG_SAMPLE_RATE by default.
+    """
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(f"tutorai.{name}")
+
+    def _log(self, level: int, message: str, fields: dict, sample: float = None, exc_info: bool = False):
+        if not self._logger.isEnabledFor(level):
+            return
+        rate = sample if sample is not None else (LOG_DEBUG_SAMPLE_RATE if level == logging.DEBUG else 1.0)
+        if rate < 1.0:
+            if random.random() >= rate:
+                return
+            fields["sample_rate"] = rate
+        trace_id = current_trace_id()
+        if trace_id:
+            fields["trace_id"] = trace_id
+        self._logger.log(level, message, exc_info=exc_info, extra={"fields": sanitize(fields)})
+
+    def debug(self, message: str, sample: float = None, **fields):
+        self._log(logging.DEBUG, message, fields, sample)
+
+    def info(self, message: str, sample: float = None, **fields):
+        self._log(logging.INFO, message, fields, sample)
+
+    def warning(self, message: str, sample: float = None, **fields):
+        self._log(logging.WARNING, message, fields, sample)
+
+    def error(self, message: str, sample: float = None, exc_info: bool = False, **fields):
+        self._log(logging.ERROR, message, fields, sample, exc_info)
+
+    def exception(self, message: str, **fields):
+        """Log an error with the current exception's traceback."""
+        self._log(logging.ERROR, message, fields, exc_info=True)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    """Get a structured logger for a module (usually get_logger(__name__))."""
+    configure_logging()
+    return StructuredLogger(name)
+
+
+def get_logging_stats() -> dict:
+    """Queue depth and dropped-record count of the logging pipeline."""
+    if _queue_handler is None:
+        return {"queued": 0, "dropped": 0}
+    return {"queued": _queue_handler.queue.qsize(), "dropped": _queue_handler.dropped}
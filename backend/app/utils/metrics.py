@@ -0,0 +1,165 @@
+import asyncio
+import functools
+import inspect
+import time
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from .tracing import span
+
+# Stage buckets span fast CPU work (lecture formatting) to slow I/O (web search, uploads)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "tutorai_stage_seconds",
+    "Time spent in each stage of the request path",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+STAGE_ERRORS = Counter(
+    "tutorai_stage_errors_total",
+    "Stages that ended with an exception",
+    ["stage"]
+)
+LLM_STREAM_TTFB_SECONDS = Histogram(
+    "tutorai_llm_stream_ttfb_seconds",
+    "Time from sending a streaming LLM request to its first token (streams only)",
+    ["backend"],
+    buckets=LLM_BUCKETS
+)
+LLM_SECONDS = Histogram(
+    "tutorai_llm_seconds",
+    "Total LLM call time, excluding time queued for a slot",
+    ["backend", "streaming"],
+    buckets=LLM_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "tutorai_llm_tokens_total",
+    "LLM tokens by model, professor and direction (in = prompt, out = completion)",
+    ["model", "professor", "direction"]
+)
+LLM_CACHED_TOKENS = Counter(
+    "tutorai_llm_cached_tokens_total",
+    "Prompt tokens served from the provider's prompt cache (a subset of direction=\"in\")",
+    ["model", "professor"]
+)
+
+# Prompt and cached tokens by model since startup, for the health endpoint
+prompt_cache_stats = {}
+
+
+class track_stage:
+    """
+    Time a stage of the request path into the stage histogram.
+
+    Works as a context manager or as a decorator for sync and async functions.
+    Exceptions are counted as stage errors; cancellations are not. The stage
+    is also recorded as a span in the current request's trace.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._started = None
+        self._span = span(stage)
+
+    def __enter__(self):
+        self._span.__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._span.__exit__(exc_type, exc, tb)
+        STAGE_SECONDS.labels(self.stage).observe(time.perf_counter() - self._started)
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            STAGE_ERRORS.labels(self.stage).inc()
+        return False
+
+    def __call__(self, func):
+        # A fresh instance per call, so concurrent calls don't share a start time
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with track_stage(self.stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track_stage(self.stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class LLMTimer:
+    """
+    Measure one LLM call, also recorded as an "llm_call" span.
+
+    Use as a context manager around the call; for streams, call
+    mark_first_token() on the first delta. Time to first token is only
+    recorded for streams: a non-streaming call returns the whole answer at
+    once, so its total time (streaming="false") is all there is. Only
+    successful calls are observed in the total-time histogram.
+    """
+
+    def __init__(self, backend: str, streaming: bool = False):
+        self.backend = backend
+        self.streaming = streaming
+        self._started = None
+        self._first_token = None
+        self._span = span("llm_call", backend=backend, streaming=streaming)
+
+    def __enter__(self):
+        self._span.__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def mark_first_token(self):
+        if self._first_token is None:
+            self._first_token = time.perf_counter()
+            LLM_STREAM_TTFB_SECONDS.labels(self.backend).observe(self._first_token - self._started)
+            self._span.set(ttfb_ms=round((self._first_token - self._started) * 1000, 2))
+
+    def __exit__(self, exc_type, exc, tb):
+        self._span.__exit__(exc_type, exc, tb)
+        if exc_type is None:
+            LLM_SECONDS.labels(self.backend, str(self.streaming).lower()).observe(time.perf_counter() - self._started)
+        return False
+
+
+def record_tokens(model: str, professor: str, usage):
+    """
+    Count prompt, cached prompt and completion tokens from a response's usage block.
+
+    Args:
+        model: Model name reported by the backend
+        professor: Professor name, or "none" for document and video chats
+        usage: Usage object or dict with prompt_tokens/completion_tokens and
+            optionally prompt_tokens_details.cached_tokens (may be None)
+    """
+    if not usage:
+        return
+    if not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, "model_dump") else {
+            "prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens
+        }
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    LLM_TOKENS.labels(model or "unknown", professor or "none", "in").inc(prompt_tokens)
+    LLM_TOKENS.labels(model or "unknown", professor or "none", "out").inc(usage.get("completion_tokens") or 0)
+    LLM_CACHED_TOKENS.labels(model or "unknown", professor or "none").inc(cached_tokens)
+
+    totals = prompt_cache_stats.setdefault(model or "unknown", {"prompt_tokens": 0, "cached_tokens": 0})
+    totals["prompt_tokens"] += prompt_tokens
+    totals["cached_tokens"] += cached_tokens
+
+
+def get_prompt_cache_stats() -> dict:
+    """Prompt tokens, cached prompt tokens and the cached share by model."""
+    return {
+        model: {**totals, "cached_ratio": round(totals["cached_tokens"] / totals["prompt_tokens"], 4) if totals["prompt_tokens"] else 0.0}
+        for model, totals in prompt_cache_stats.items()
+    }
+
+
+def render_metrics():
+    """Current metrics in the Prometheus text format, as (body, content type)."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,116 @@
+import base64
+import json
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+
+
+def encode_cursor(key: tuple) -> str:
+    """Encode a sort key into an opaque, URL-safe cursor string."""
+    raw = json.dumps(list(key), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, like: tuple = None) -> tuple:
+    """
+    Decode a cursor produced by encode_cursor back into a sort key.
+
+    Args:
+        cursor: Cursor string from a previous page
+        like: Optional sort key the cursor must match in length and element types
+
+    Returns:
+        The sort key as a tuple
+
+    Raises:
+        ValueError: If the cursor is not a valid sort key
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or not all(_kind(value) for value in key):
+        raise ValueError("Invalid cursor")
+    # Keys of another shape cannot be compared with the items' keys
+    if like is not None and [_kind(value) for value in key] != [_kind(value) for value in like]:
+        raise ValueError("Invalid cursor")
+    return tuple(key)
+
+
+def _kind(value):
+    """The comparable kind of a sort key element: str, number, or None for anything else."""
+    if isinstance(value, str):
+        return str
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float
+    return None
+
+
+def parse_fields(fields: str, allowed: set) -> list:
+    """Parse a comma-separated fields= parameter, rejecting unknown names."""
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed fields: {', '.join(sorted(allowed))}")
+    return requested
+
+
+def insert_sorted(index: dict, item: dict, sort_keys: dict):
+    """
+    Add an item to a sorted index, which maps each sort order to its items in ascending key order.
+
+    Args:
+        index: Sorted index to update
+        item: Item to add
+        sort_keys: Sort orders of the index, by name
+    """
+    for order, sort_key in sort_keys.items():
+        insort(index.setdefault(order, []), item, key=sort_key)
+
+
+def paginate(items: list, sort_key, descending: bool = False, cursor: str = None, limit: int = 100,
+             fields: list = None, lo: int = 0, hi: int = None, where=None) -> dict:
+    """
+    Return one page of items in a stable sort order using keyset pagination.
+
+    The cursor encodes the sort key of the last item on the previous page, so
+    pages stay consistent while new items are being added. The page is found
+    by bisecting into the items, which must already be in ascending order of
+    sort_key (see insert_sorted), and only the items on it are read.
+
+    Args:
+        items: Items to paginate, in ascending order of sort_key
+        sort_key: Function returning a unique, JSON-serializable tuple per item
+        descending: Whether to return items in descending key order
+        cursor: Cursor returned with the previous page, if any
+        limit: Maximum number of items in the page
+        fields: Optional list of fields to project each item onto
+        lo: Start of the range of items to paginate
+        hi: End of the range of items to paginate (default: the end of items)
+        where: Optional filter; items it returns False for are skipped
+
+    Returns:
+        Dict with the page items and the cursor for the next page (or None)
+    """
+    hi = len(items) if hi is None else hi
+    after = decode_cursor(cursor, like=sort_key(items[0]) if items else None) if cursor else None
+
+    if descending:
+        end = bisect_left(items, after, lo, hi, key=sort_key) if cursor else hi
+        positions = range(end - 1, lo - 1, -1)
+    else:
+        start = bisect_right(items, after, lo, hi, key=sort_key) if cursor else lo
+        positions = range(start, hi)
+
+    # One item past the page tells whether there is a next page
+    matches = (items[i] for i in positions if where is None or where(items[i]))
+    page = list(islice(matches, limit + 1))
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    next_cursor = encode_cursor(sort_key(page[-1])) if page and has_more else None
+
+    if fields:
+        page = [{field: item.get(field) for field in fields} for item in page]
+
+    return {"items": page, "next_cursor": next_cursor}
@@ -0,0 +1,184 @@
+import contextvars
+import itertools
+import time
+import uuid
+from collections import deque
+from ..config.settings import TRACING_ENABLED, TRACE_BUFFER_SIZE
+
+# Finished traces, newest last; the oldest drop off once the buffer is full
+trace_buffer = deque(maxlen=TRACE_BUFFER_SIZE)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    """All spans recorded while serving one request."""
+
+    def __init__(self, name: str, **attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._span_ids = itertools.count(1)
+        self.spans = []
+        self.duration_ms = None
+        self.status = None
+
+    def offset_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def finish(self, status=None):
+        self.duration_ms = self.offset_ms()
+        self.status = status
+        trace_buffer.append(self)
+
+    def summary(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 2) if self.duration_ms is not None else None,
+            "status": self.status,
+            "span_count": len(self.spans),
+            **self.attrs
+        }
+
+    def waterfall(self) -> dict:
+        """The trace with its spans in start order, each with its nesting depth."""
+        depths = {None: -1}
+        rows = []
+        for span in sorted(self.spans, key=lambda s: (s["start_ms"], s["span_id"])):
+            depth = depths.get(span["parent_id"], -1) + 1
+            depths[span["span_id"]] = depth
+            rows.append({**span, "depth": depth})
+        return {**self.summary(), "spans": rows}
+
+
+class span:
+    """
+    Record a span in the current request's trace.
+
+    Use as a (sync) context manager around an external call or a CPU stage;
+    spans opened inside it, including in tasks and threads started from it,
+    become its children. Does nothing outside a traced request.
+    """
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self._trace = None
+
+    def __enter__(self):
+        self._trace = _current_trace.get()
+        if self._trace is None:
+            return self
+        self.span_id = next(self._trace._span_ids)
+        self.parent_id = _current_span.get()
+        self._start_ms = self._trace.offset_ms()
+        self._token = _current_span.set(self.span_id)
+        return self
+
+    def set(self, **attrs):
+        """Attach attributes known only once the work is under way (sizes, status codes)."""
+        self.attrs.update(attrs)
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._trace is None:
+            return False
+        _current_span.reset(self._token)
+        record = {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": round(self._start_ms, 2),
+            "duration_ms": round(self._trace.offset_ms() - self._start_ms, 2),
+            "attrs": self.attrs
+        }
+        if exc_type is not None:
+            record["error"] = f"{exc_type.__name__}: {str(exc)[:200]}"
+        self._trace.spans.append(record)
+        return False
+
+
+def start_trace(name: str, **attrs):
+    """Start a trace for the current request; returns it, or None when tracing is off."""
+    if not TRACING_ENABLED:
+        return None
+    trace = Trace(name, **attrs)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def current_trace_id():
+    """Id of the trace of the request being served, if any."""
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+def list_traces(min_duration_ms: float = 0, path: str = None, limit: int = 50) -> list:
+    """Summaries of buffered traces, newest first."""
+    traces = [
+        t.summary() for t in reversed(trace_buffer)
+        if t.duration_ms >= min_duration_ms and (path is None or t.attrs.get("path") == path)
+    ]
+    return traces[:limit]
+
+
+def get_trace(trace_id: str):
+    """Waterfall for one buffered trace, or None if it has been evicted."""
+    for trace in trace_buffer:
+        if trace.trace_id == trace_id:
+            return trace.waterfall()
+    return None
+
+
+def export_traces(min_duration_ms: float = 0) -> list:
+    """
+    Get every buffered trace as a waterfall, for download.
+
+    Args:
+        min_duration_ms: Only export traces at least this slow
+
+    Returns:
+        List of trace waterfalls, oldest first
+    """
+    return [t.waterfall() for t in list(trace_buffer) if t.duration_ms >= min_duration_ms]
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that traces each API request and adds an X-Trace-Id header.
+
+    The trace ends when the last body chunk is sent, so streamed responses
+    include their whole generation.
+    """
+
+    def __init__(self, app, exclude_prefixes: tuple = ()):
+        self.app = app
+        self.exclude_prefixes = exclude_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/") or scope["path"].startswith(self.exclude_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        trace = start_trace(f"{scope['method']} {scope['path']}", method=scope["method"], path=scope["path"])
+        if trace is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = {}
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-trace-id", trace.trace_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            trace.finish(status.get("code", 500))
@@ -0,0 +1,326 @@
+"""
+Microbenchmarks for the text-processing code that runs on every request:
+lecture formatting, thinking-tag extraction, search result parsing and
+ranking, transcript formatting and text chunking. Chunking is also run
+through langchain's splitter counting tokens with the same counter, for
+reference.
+
+Inputs are the bundled Andrew Ng lecture PDFs (data/andrewng/ml) and
+synthetic model responses, search pages and transcripts generated from a
+fixed seed, so runs on the same machine are comparable. Each benchmark is
+timed with the garbage collector off, over enough loops to last
+--min-time seconds, repeated --repeat times; allocations are measured
+separately with tracemalloc.
+
+Usage (from the backend directory):
+    python -m benchmarks.hotpaths
+    python -m benchmarks.hotpaths --filter chunking --repeat 10
+    python -m benchmarks.hotpaths --json > before.json
+    python -m benchmarks.hotpaths --compare before.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PDF_DIR = os.path.join(BACKEND_DIR, "data", "andrewng", "ml")
+
+SEED = 1234
+
+SENTENCES = [
+    "Let's consider the problem of predicting housing prices from living area.",
+    "The hypothesis is h(x) = theta_0 + theta_1 x, and we choose theta to minimize the cost.",
+    "For example, a house of 2104 square feet sold for 400 thousand dollars.",
+    "The cost function is $J(\\theta) = \\frac{1}{2}\\sum_i (h_\\theta(x^{(i)}) - y^{(i)})^2$.",
+    "Gradient descent repeatedly takes a step in the direction of steepest decrease of J.",
+    "According to the normal equations, theta can also be found in closed form.",
+    "The diagram below shows the contours of the quadratic cost function.",
+    "As noted in [1], feature scaling helps gradient descent converge faster.",
+    "**Key Concept:** the learning rate alpha controls the size of each update.",
+    "What happens if alpha is too large? The algorithm may overshoot and diverge.",
+]
+
+CODE_BLOCK = "```python\ntheta = theta - alpha * X.T @ (X @ theta - y) / m\n```"
+
+
+def synthetic_response(chars: int, thinking: bool = False, rng: random.Random = None) -> str:
+    """A markdown lecture-style answer of about `chars` characters."""
+    rng = rng or random.Random(SEED)
+    parts = []
+    size = 0
+    while size < chars:
+        paragraph = " ".join(rng.choice(SENTENCES) for _ in range(rng.randint(3, 6)))
+        if rng.random() < 0.1:
+            paragraph += "\n\n" + CODE_BLOCK
+        parts.append(paragraph)
+        size += len(paragraph) + 2
+    text = "\n\n".join(parts)
+    if thinking:
+        reasoning = " ".join(rng.choice(SENTENCES) for _ in range(12))
+        text = f"<think>\n{reasoning}\n</think>\n\n{text}"
+    return text
+
+
+def synthetic_search_results(count: int, rng: random.Random = None) -> list:
+    """(DDGS result, page HTML) pairs shaped like typical academic pages."""
+    rng = rng or random.Random(SEED)
+    pairs = []
+    for i in range(count):
+        domain = ["arxiv.org/abs", "example.com/blog", "cs.stanford.edu/notes", "medium.com/p"][i % 4]
+        result = {
+            "href": f"https://{domain}/{i}",
+            "title": f"Gradient descent for linear regression, part {i}",
+            "body": "An overview of gradient descent and the normal equations.",
+        }
+        paragraphs = "".join(
+            f"<p>{' '.join(rng.choice(SENTENCES) for _ in range(5))}</p>"
+            for _ in range(40)
+        )
+        links = "".join(f"<li><a href=\"/page/{j}\">Related {j}</a></li>" for j in range(60))
+        html = (
+            f"<html><head><title>Gradient descent notes {i}</title>"
+            f"<meta name=\"description\" content=\"Lecture notes on gradient descent and linear regression, part {i}\">"
+            f"<script>var config = {{\"id\": {i}}};</script></head>"
+            f"<body><nav><ul>{links}</ul></nav><main><h1>Notes {i}</h1>{paragraphs}</main>"
+            f"<footer>Copyright</footer></body></html>"
+        )
+        pairs.append((result, html))
+    return pairs
+
+
+def synthetic_transcript(segments: int, rng: random.Random = None) -> list:
+    """Transcript segments as kept by the transcript store: (start, duration, text)."""
+    rng = rng or random.Random(SEED)
+    start = 0.0
+    entries = []
+    for _ in range(segments):
+        duration = round(rng.uniform(2.0, 6.0), 2)
+        entries.append((round(start, 2), duration, rng.choice(SENTENCES)))
+        start += duration
+    return entries
+
+
+def extract_pdf_pages(path: str) -> list:
+    """Extract the text of each page with PyPDF2, as the ingestion paths do."""
+    import PyPDF2
+
+    with open(path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        return [page.extract_text() or "" for page in reader.pages]
+
+
+def load_lectures(count: int) -> list:
+    """Page texts of the first `count` lectures, one list per lecture."""
+    names = sorted(name for name in os.listdir(PDF_DIR) if name.startswith("MachineLearning-Lecture"))[:count]
+    return [extract_pdf_pages(os.path.join(PDF_DIR, name)) for name in names]
+
+
+def build_benchmarks(lectures: list) -> dict:
+    """Map of benchmark name to a zero-argument callable."""
+    from app.utils.helpers import process_lecture_formatting, process_thinking_content, format_transcript
+    from app.services.search_service import parse_result_page, rank_search_results
+    from app.utils.chunking import chunk_pages, get_token_counter
+    from app.config.settings import RAG_CHUNK_TOKENS, RAG_CHUNK_OVERLAP_TOKENS
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    except ImportError:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    # Pages joined by blank lines, the way extract_text_from_pdf_url returns a document
+    texts = ["".join(page + "\n\n" for page in pages) for pages in lectures]
+    responses = {
+        "response_2k": synthetic_response(2_000),
+        "response_think_8k": synthetic_response(8_000, thinking=True),
+        "response_64k": synthetic_response(64_000),
+        "lecture01": texts[0],
+    }
+    search_pairs = synthetic_search_results(20)
+    query = "gradient descent linear regression"
+    transcripts = {"600seg": synthetic_transcript(600), "6000seg": synthetic_transcript(6_000)}
+    # Same settings as add_to_rag and precompute_embeddings. The reference is langchain's
+    # splitter counting tokens with the same counter, the way it would be made token-aware
+    counter = get_token_counter()
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=RAG_CHUNK_TOKENS, chunk_overlap=RAG_CHUNK_OVERLAP_TOKENS, length_function=counter.count
+    )
+    corpus = f"lectures01-{len(lectures):02d}"
+    chunk_inputs = {
+        "lecture01": (list(enumerate(lectures[0], start=1)), texts[0]),
+        corpus: ([(number, page) for pages in lectures for number, page in enumerate(pages, start=1)], "".join(texts)),
+    }
+
+    benchmarks = {}
+    for name, text in responses.items():
+        benchmarks[f"lecture_formatting[{name}]"] = lambda text=text: process_lecture_formatting(text)
+    for name, text in responses.items():
+        benchmarks[f"thinking_content[{name}]"] = lambda text=text: process_thinking_content(text)
+    benchmarks["search_ranking[20 pages]"] = lambda: rank_search_results(
+        [parse_result_page(result, html, query) for result, html in search_pairs], 5
+    )
+    for name, entries in transcripts.items():
+        benchmarks[f"transcript_formatting[{name}]"] = lambda entries=entries: format_transcript(entries)
+    for name, (pages, text) in chunk_inputs.items():
+        benchmarks[f"chunking[{name}]"] = lambda pages=pages: list(
+            chunk_pages(pages, RAG_CHUNK_TOKENS, RAG_CHUNK_OVERLAP_TOKENS, counter)
+        )
+        benchmarks[f"chunking_langchain[{name}]"] = lambda text=text: splitter.split_text(text)
+    return benchmarks
+
+
+def _time_loops(func, loops: int) -> float:
+    started = time.perf_counter()
+    for _ in range(loops):
+        func()
+    return time.perf_counter() - started
+
+
+def time_benchmark(func, min_time: float, repeat: int) -> dict:
+    """
+    Time a callable like timeit: pick a loop count that runs for at least
+    min_time, then take `repeat` samples of the per-call time.
+    """
+    func()  # Warm up caches (compiled regexes, lazy imports)
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        loops = 1
+        while True:
+            elapsed = _time_loops(func, loops)
+            if elapsed >= min_time:
+                break
+            loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9) * 1.1))
+        samples = [_time_loops(func, loops) / loops for _ in range(repeat)]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    median = statistics.median(samples)
+    return {
+        "loops": loops,
+        "repeat": repeat,
+        "min_us": min(samples) * 1e6,
+        "median_us": median * 1e6,
+        "stdev_us": statistics.stdev(samples) * 1e6 if len(samples) > 1 else 0.0,
+        "ops_per_s": 1 / median if median else None,
+    }
+
+
+def measure_allocations(func) -> dict:
+    """Peak and retained traced memory for one call, and the number of blocks it leaves allocated."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = func()
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    return {
+        "peak_kib": (peak - baseline) / 1024,
+        "retained_kib": (current - baseline) / 1024,
+        "retained_blocks": blocks,
+    }
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=BACKEND_DIR
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or None,
+    }
+
+
+def print_report(report: dict, baseline: dict = None):
+    previous = {r["name"]: r for r in baseline["results"]} if baseline else {}
+    header = f"{'benchmark':<42} {'median':>11} {'stdev':>9} {'loops':>7} {'peak KiB':>10} {'kept KiB':>9}"
+    if previous:
+        header += f" {'vs base':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in report["results"]:
+        line = (
+            f"{r['name']:<42} {_format_us(r['median_us']):>11} {_format_us(r['stdev_us']):>9} {r['loops']:>7}"
+            f" {r['peak_kib']:>10.1f} {r['retained_kib']:>9.1f}"
+        )
+        if r["name"] in previous:
+            line += f" {r['median_us'] / previous[r['name']]['median_us']:>7.2f}x"
+        print(line)
+    env = report["environment"]
+    print(f"\ncommit {env['commit']}, Python {env['python']} on {env['machine']}")
+    if baseline:
+        print(f"baseline commit {baseline['environment'].get('commit')} (ratio < 1 is faster)")
+
+
+def _format_us(us: float) -> str:
+    if us >= 1e6:
+        return f"{us / 1e6:.2f} s"
+    if us >= 1e3:
+        return f"{us / 1e3:.2f} ms"
+    return f"{us:.1f} us"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark text-processing hot paths")
+    parser.add_argument("--filter", default=None, help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=7, help="Timing samples per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per timing sample")
+    parser.add_argument("--lectures", type=int, default=7, help="Number of lecture PDFs in the chunking corpus")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--compare", default=None, help="JSON report from an earlier run to compare against")
+    args = parser.parse_args()
+
+    from app.utils.chunking import get_token_counter
+
+    lectures = load_lectures(args.lectures)
+    benchmarks = build_benchmarks(lectures)
+    if args.filter:
+        benchmarks = {name: func for name, func in benchmarks.items() if args.filter in name}
+
+    results = []
+    for name, func in benchmarks.items():
+        if not args.json:
+            print(f"Running {name}...", file=sys.stderr)
+        results.append({"name": name, **time_benchmark(func, args.min_time, args.repeat), **measure_allocations(func)})
+
+    report = {
+        "environment": environment(),
+        "settings": {
+            "repeat": args.repeat, "min_time": args.min_time, "lectures": len(lectures), "seed": SEED,
+            # Chunking timings depend on whether the encoding could be loaded or token counts are estimated
+            "tokenizer": get_token_counter().name,
+        },
+        "results": results,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        baseline = None
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+        print_report(report, baseline)
+
+
+if __name__ == "__main__":
+    main()
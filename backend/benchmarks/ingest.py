@@ -0,0 +1,160 @@
+"""
+Peak memory and time of RAG ingestion (add_to_rag) by document size.
+
+Builds PDFs of increasing length from the bundled lecture PDFs
+(data/andrewng/ml, repeated as needed) and ingests each one twice against an
+in-process embedder and index that do no network I/O:
+
+- "whole": the pre-streaming add_to_rag, which joined every page into one
+  string and built all embeddings and upsert tuples before one upsert
+- "streaming": app.services.ingest_service.ingest_pdf, page by page and
+  batch by batch
+
+Peak memory is traced with tracemalloc from the open PDF file to the last
+upsert, so it covers extraction, splitting, embeddings and upsert payloads.
+The streaming peak should stay flat as documents grow.
+
+Usage (from the backend directory):
+    python -m benchmarks.ingest
+    python -m benchmarks.ingest --pages 100,1000 --batch-size 50
+    python -m benchmarks.ingest --json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from .hotpaths import PDF_DIR, environment
+
+EMBEDDING_DIMENSION = 1536
+
+
+class FakeEmbedder:
+    """Embeds without I/O; returns fresh float lists, as a parsed API response would."""
+
+    def __init__(self):
+        self.rng = random.Random(0)
+
+    def embed_documents(self, texts):
+        return [[self.rng.random() for _ in range(EMBEDDING_DIMENSION)] for _ in texts]
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+
+class FakeIndex:
+    """Counts upserted vectors and drops them."""
+
+    def __init__(self):
+        self.vectors = 0
+
+    def upsert(self, vectors, namespace=""):
+        self.vectors += len(vectors)
+
+
+def build_pdf(pages: int, folder: str) -> str:
+    """A PDF of `pages` pages made from the lecture PDFs, cached in `folder`."""
+    import PyPDF2
+
+    path = os.path.join(folder, f"lectures-{pages}p.pdf")
+    if os.path.exists(path):
+        return path
+    names = sorted(name for name in os.listdir(PDF_DIR) if name.endswith(".pdf"))
+    writer = PyPDF2.PdfWriter()
+    while len(writer.pages) < pages:
+        for name in names:
+            # A new reader per copy, so repeated pages are separate objects in the output
+            for page in PyPDF2.PdfReader(os.path.join(PDF_DIR, name)).pages:
+                if len(writer.pages) == pages:
+                    break
+                writer.add_page(page)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+
+async def ingest_whole(stream, source, index, embedder, batch_size):
+    """The add_to_rag pipeline before streaming, for comparison."""
+    import PyPDF2
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    except ImportError:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    contents = stream.read()
+    pdf_reader = PyPDF2.PdfReader(stream)
+    text = "\n".join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
+    # It split by characters, before the token-aware chunker
+    chunks = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50).split_text(text)
+    embeddings = await embedder.aembed_documents(chunks)
+    upsert_data = [
+        (str(uuid.uuid4()), embedding, {"text": chunk, "source": source})
+        for chunk, embedding in zip(chunks, embeddings)
+    ]
+    index.upsert(vectors=upsert_data)
+    del contents
+    return {"chunks": len(chunks)}
+
+
+def measure(ingest, path: str, batch_size: int) -> dict:
+    """Peak traced memory and wall time of one ingestion."""
+    index = FakeIndex()
+    embedder = FakeEmbedder()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        started = time.perf_counter()
+        with open(path, "rb") as stream:
+            result = asyncio.run(ingest(stream, os.path.basename(path), index, embedder, batch_size=batch_size))
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"chunks": result["chunks"], "vectors": index.vectors, "peak_mib": (peak - baseline) / 2**20, "seconds": elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure peak memory of RAG ingestion by document size")
+    parser.add_argument("--pages", default="50,400", help="Comma-separated document lengths in pages")
+    parser.add_argument("--batch-size", type=int, default=None, help="Chunks per batch (default: RAG_BATCH_SIZE)")
+    parser.add_argument("--modes", default="whole,streaming", help="Comma-separated pipelines to run")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    from app.config.settings import RAG_BATCH_SIZE
+    from app.services.ingest_service import ingest_pdf
+
+    batch_size = args.batch_size or RAG_BATCH_SIZE
+    pipelines = {"whole": ingest_whole, "streaming": ingest_pdf}
+    folder = os.path.join(tempfile.gettempdir(), "tutorai-ingest-bench")
+    os.makedirs(folder, exist_ok=True)
+
+    results = []
+    for pages in [int(p) for p in args.pages.split(",")]:
+        path = build_pdf(pages, folder)
+        for mode in args.modes.split(","):
+            if not args.json:
+                print(f"Ingesting {pages} pages ({mode})...", file=sys.stderr)
+            results.append({"pages": pages, "mode": mode, **measure(pipelines[mode], path, batch_size)})
+
+    report = {"environment": environment(), "settings": {"batch_size": batch_size}, "results": results}
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    header = f"{'pages':>6} {'mode':<10} {'chunks':>7} {'peak MiB':>9} {'seconds':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['pages']:>6} {r['mode']:<10} {r['chunks']:>7} {r['peak_mib']:>9.1f} {r['seconds']:>8.2f}")
+    print(f"\ncommit {report['environment']['commit']}, batch size {batch_size}")
+
+
+if __name__ == "__main__":
+    main()
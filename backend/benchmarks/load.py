@@ -0,0 +1,269 @@
+"""
+End-to-end load test: starts the stub backends and the app in their own
+processes, drives API endpoints at a target concurrency and reports latency
+percentiles, throughput, errors and the app's event-loop lag per scenario.
+
+Usage (from the backend directory):
+    python -m benchmarks.load
+    python -m benchmarks.load --scenarios chat_openai,document_chat --concurrency 20 --duration 30
+    python -m benchmarks.load --local-tps 20 --openai-ttfb 1.0 --json > load.json
+
+Stub latencies and token rates are set with the same flags as
+benchmarks.stubs (see --help). Extra app settings can be passed through the
+environment, e.g. LM_STUDIO_MAX_CONCURRENCY=4.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+import httpx
+from .stubs import PDF_DIR, add_config_arguments, config_from_args
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFESSOR = {"name": "Andrew Ng", "field": "Machine Learning", "teachingMode": "Virtual", "adviceType": "Academic Guidance"}
+PDF_NAME = "MachineLearning-Lecture01.pdf"
+
+_sequence = itertools.count()
+
+
+# Each scenario makes one request and returns the response
+
+
+async def chat_openai(client, stub_url):
+    return await client.post("/api/chat", json={"message": "Explain gradient descent", "model_type": "openai", "professor": PROFESSOR})
+
+
+async def chat_local(client, stub_url):
+    return await client.post("/api/chat", json={"message": "Explain gradient descent", "model_type": "local", "professor": PROFESSOR})
+
+
+async def chat_search(client, stub_url):
+    return await client.post("/api/chat", json={"message": "Explain gradient descent", "model_type": "openai", "professor": PROFESSOR, "enable_search": True})
+
+
+async def chat_stream(client, stub_url):
+    async with client.stream("POST", "/api/chat/stream", json={"message": "Explain gradient descent", "model_type": "openai", "professor": PROFESSOR}) as response:
+        async for _ in response.aiter_bytes():
+            pass
+    return response
+
+
+async def document_chat(client, stub_url):
+    return await client.post("/api/document-chat", json={
+        "document_id": "bench",
+        "document_url": f"{stub_url}/pdf/{PDF_NAME}",
+        "document_title": "Machine Learning Lecture 1",
+        "message": "Summarize the main topics"
+    })
+
+
+async def youtube_chat(client, stub_url):
+    return await client.post("/api/youtube-chat", json={
+        "youtube_url": f"https://www.youtube.com/watch?v=bench{next(_sequence) % 5}",
+        "video_title": "Lecture 1",
+        "message": "What is covered in the first ten minutes?"
+    })
+
+
+async def upload(client, stub_url):
+    with open(os.path.join(PDF_DIR, PDF_NAME), "rb") as f:
+        content = f.read()
+    return await client.post("/api/upload", files={"file": (PDF_NAME, content, "application/pdf")}, data={"title": "Lecture 1"})
+
+
+async def meetings(client, stub_url):
+    # One professor posting a slot, a student finding and booking it, both listing bookings
+    n = next(_sequence)
+    professor = f"Professor {n % 20}"
+    created = await client.post("/api/professor/availability", json={
+        "professor_name": professor,
+        "date": f"2030-01-{n % 28 + 1:02d}",
+        "start_time": f"{n % 12 + 8:02d}:00",
+        "end_time": f"{n % 12 + 8:02d}:30"
+    })
+    if created.status_code != 200:
+        return created
+    listed = await client.get("/api/professor/availability", params={"professor_name": professor, "is_booked": "false", "limit": 20})
+    if listed.status_code != 200:
+        return listed
+    booked = await client.post("/api/student/book-meeting", json={
+        "availability_id": created.json()["id"],
+        "student_name": f"Student {n}",
+        "student_email": f"student{n}@example.edu",
+        "topic": "Office hours"
+    })
+    if booked.status_code != 200:
+        return booked
+    return await client.get("/api/student/bookings", params={"student_email": f"student{n}@example.edu"})
+
+
+SCENARIOS = {
+    "chat_openai": chat_openai,
+    "chat_local": chat_local,
+    "chat_search": chat_search,
+    "chat_stream": chat_stream,
+    "document_chat": document_chat,
+    "youtube_chat": youtube_chat,
+    "upload": upload,
+    "meetings": meetings,
+}
+
+
+def percentile(ordered: list, q: float):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_scenario(name: str, base_url: str, stub_url: str, concurrency: int, duration: float, max_requests: int = None) -> dict:
+    """Run one scenario with `concurrency` workers until the duration or request budget runs out."""
+    scenario = SCENARIOS[name]
+    latencies = []
+    statuses = {}
+    errors = []
+    issued = itertools.count()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        await client.get("/__bench/loop-lag", params={"reset": True})
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < deadline and (max_requests is None or next(issued) < max_requests):
+                started = time.perf_counter()
+                try:
+                    response = await scenario(client, stub_url)
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                    errors.append(str(e))
+                latencies.append(time.perf_counter() - started)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        loop_lag = (await client.get("/__bench/loop-lag")).json()
+
+    ordered = sorted(latencies)
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "ok": ok,
+        "statuses": statuses,
+        "elapsed_s": elapsed,
+        "throughput_rps": ok / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(ordered, 0.50) * 1000 if ordered else None,
+        "p95_ms": percentile(ordered, 0.95) * 1000 if ordered else None,
+        "p99_ms": percentile(ordered, 0.99) * 1000 if ordered else None,
+        "max_ms": ordered[-1] * 1000 if ordered else None,
+        "loop_lag": loop_lag,
+        "sample_errors": errors[:3],
+    }
+
+
+def start_process(args: list, log_path: str, env: dict = None) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen([sys.executable, "-m", *args], cwd=BACKEND_DIR, stdout=log, stderr=subprocess.STDOUT, env=env)
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, log_path: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            with open(log_path) as f:
+                raise RuntimeError(f"Process exited while starting:\n{f.read()[-3000:]}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def format_table(results: list) -> str:
+    header = f"{'scenario':<14} {'conc':>4} {'reqs':>6} {'ok':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'lag p99':>8} {'lag max':>8}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lag = r["loop_lag"]
+
+        def ms(value):
+            return f"{value:9.1f}" if value is not None else f"{'-':>9}"
+
+        lines.append(
+            f"{r['scenario']:<14} {r['concurrency']:>4} {r['requests']:>6} {r['ok']:>6} {r['throughput_rps']:>8.2f}"
+            f"{ms(r['p50_ms'])}{ms(r['p95_ms'])}{ms(r['p99_ms'])}{ms(r['max_ms'])}"
+            f" {lag.get('p99_ms', 0):>8.1f} {lag.get('max_ms', 0):>8.1f}"
+        )
+        failed = {status: count for status, count in r["statuses"].items() if not status.startswith("2")}
+        if failed:
+            lines.append(f"{'':<14} non-2xx: {failed}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test against stub backends")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per scenario")
+    parser.add_argument("--requests", type=int, default=None, help="Stop a scenario after this many requests")
+    parser.add_argument("--app-port", type=int, default=8800)
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--log-dir", default=os.path.join(BACKEND_DIR, "benchmarks", "logs"))
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    os.makedirs(args.log_dir, exist_ok=True)
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    stub_log = os.path.join(args.log_dir, "stubs.log")
+    app_log = os.path.join(args.log_dir, "app.log")
+
+    stub_args = ["benchmarks.stubs", "--port", str(args.stub_port)]
+    for key, value in config_from_args(args).items():
+        stub_args += [f"--{key.replace('_', '-')}", str(value)]
+
+    processes = []
+    try:
+        processes.append(start_process(stub_args, stub_log))
+        wait_until_ready(f"{stub_url}/__stats", processes[-1], stub_log)
+        processes.append(start_process(["benchmarks.serve", "--stub-url", stub_url, "--port", str(args.app_port)], app_log, env=dict(os.environ)))
+        wait_until_ready(f"{app_url}/api/health", processes[-1], app_log)
+
+        results = []
+        for name in names:
+            if not args.json:
+                print(f"Running {name} ({args.concurrency} concurrent, {args.duration:.0f}s)...", file=sys.stderr)
+            results.append(asyncio.run(run_scenario(name, app_url, stub_url, args.concurrency, args.duration, args.requests)))
+
+        if args.json:
+            print(json.dumps({"config": config_from_args(args), "results": results}, indent=2))
+        else:
+            print(format_table(results))
+            print(f"\nLogs: {stub_log}, {app_log}")
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Run the TutorAI app against the stand-in backends of benchmarks.stubs.
+
+OpenAI, LM Studio and Pinecone are redirected through their normal
+configuration (OPENAI_BASE_URL, LM_STUDIO_BASE_URL, PINECONE_HOST). The
+DuckDuckGo and YouTube transcript clients have no such setting, so they are
+replaced in this process only by versions that call the stub server with
+the same blocking behaviour. An event-loop lag probe is added and reported
+at /__bench/loop-lag.
+
+Usage (from the backend directory):
+    python -m benchmarks.serve --stub-url http://127.0.0.1:8900 --port 8800
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+# How often the lag probe wakes up; lag is how late it wakes
+LAG_PROBE_INTERVAL = 0.01
+
+
+def configure_environment(stub_url: str):
+    """Point every backend the app talks to at the stub server."""
+    os.environ.update({
+        "OPENAI_API_KEY": "stub-key",
+        "OPENAI_BASE_URL": f"{stub_url}/openai/v1",
+        "OPENAI_API_BASE": f"{stub_url}/openai/v1",
+        "LM_STUDIO_BASE_URL": f"{stub_url}/lmstudio/v1",
+        "PINECONE_API_KEY": "stub-key",
+        "PINECONE_HOST": stub_url,
+        "INDEX_NAME": "bench",
+        "HEALTH_MONITOR": "false",
+        # The upload scenario's files go to a scratch directory, not backend/uploads
+        "UPLOAD_DIR": tempfile.mkdtemp(prefix="tutorai-bench-uploads-"),
+    })
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def patch_clients(stub_url: str):
+    """Replace the search and transcript clients with blocking calls to the stub server."""
+    import httpx
+    import duckduckgo_search
+    import youtube_transcript_api
+
+    class StubDDGS:
+        def text(self, query, max_results=10, **kwargs):
+            return httpx.get(f"{stub_url}/search", params={"q": query, "max_results": max_results}, timeout=30).json()
+
+    def get_transcript(video_id, *args, **kwargs):
+        return httpx.get(f"{stub_url}/youtube/{video_id}", timeout=30).json()
+
+    duckduckgo_search.DDGS = StubDDGS
+    youtube_transcript_api.YouTubeTranscriptApi.get_transcript = staticmethod(get_transcript)
+
+
+def add_loop_lag_probe(app):
+    """Measure event-loop lag for the life of the app and serve it at /__bench/loop-lag."""
+    samples = []
+
+    async def probe():
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            samples.append(max(0.0, time.perf_counter() - started - LAG_PROBE_INTERVAL))
+
+    original_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app_):
+        async with original_lifespan(app_):
+            task = asyncio.create_task(probe())
+            yield
+            task.cancel()
+
+    app.router.lifespan_context = lifespan
+
+    @app.get("/__bench/loop-lag", include_in_schema=False)
+    async def loop_lag(reset: bool = False):
+        current = sorted(samples)
+        if reset:
+            samples.clear()
+        if not current:
+            return {"samples": 0}
+        return {
+            "samples": len(current),
+            "p50_ms": current[len(current) // 2] * 1000,
+            "p99_ms": current[min(len(current) - 1, int(len(current) * 0.99))] * 1000,
+            "max_ms": current[-1] * 1000,
+        }
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the app against stub backends")
+    parser.add_argument("--stub-url", default="http://127.0.0.1:8900")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    args = parser.parse_args()
+
+    configure_environment(args.stub_url)
+    patch_clients(args.stub_url)
+
+    from app.main import app
+    add_loop_lag_probe(app)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
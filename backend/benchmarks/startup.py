@@ -0,0 +1,108 @@
+"""
+Startup benchmark: measures how long it takes a fresh interpreter to import
+the application, and which modules that time is spent in.
+
+Usage (from the backend directory):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --module main --runs 10 --top 30 --json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def run_import(module: str) -> dict:
+    """Import a module in a fresh interpreter with -X importtime and parse the report."""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    self_us = {}
+    cumulative_us = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        own, cumulative, _, name = match.groups()
+        self_us[name] = int(own)
+        cumulative_us[name] = int(cumulative)
+
+    # Group self time by top-level package so heavy dependencies stand out
+    packages_us = {}
+    for name, own in self_us.items():
+        package = name.split(".")[0]
+        packages_us[package] = packages_us.get(package, 0) + own
+
+    return {
+        "wall_ms": wall_ms,
+        "import_ms": cumulative_us.get(module, 0) / 1000,
+        "modules_ms": {name: us / 1000 for name, us in cumulative_us.items()},
+        "packages_ms": {name: us / 1000 for name, us in packages_us.items()},
+    }
+
+
+def median_by_key(runs: list, field: str) -> dict:
+    """Take the per-key median of a dict-valued field across runs."""
+    keys = set().union(*(run[field] for run in runs))
+    return {key: statistics.median(run[field].get(key, 0.0) for run in runs) for key in keys}
+
+
+def benchmark(module: str, runs: int, top: int) -> dict:
+    """Run the import benchmark several times and summarize with medians."""
+    results = [run_import(module) for _ in range(runs)]
+    modules = median_by_key(results, "modules_ms")
+    packages = median_by_key(results, "packages_ms")
+    return {
+        "module": module,
+        "runs": runs,
+        "wall_ms": statistics.median(r["wall_ms"] for r in results),
+        "import_ms": statistics.median(r["import_ms"] for r in results),
+        "top_modules_ms": dict(sorted(modules.items(), key=lambda kv: kv[1], reverse=True)[:top]),
+        "top_packages_ms": dict(sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[:top]),
+    }
+
+
+def print_report(report: dict):
+    print(f"\n{report['module']}: import {report['import_ms']:.1f} ms, "
+          f"interpreter wall {report['wall_ms']:.1f} ms (median of {report['runs']} runs)")
+    print("\n  Top packages (self time):")
+    for name, ms in report["top_packages_ms"].items():
+        print(f"    {ms:9.1f} ms  {name}")
+    print("\n  Top modules (cumulative):")
+    for name, ms in report["top_modules_ms"].items():
+        print(f"    {ms:9.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure application import time per module")
+    parser.add_argument("--module", action="append", help="Module to import (default: app.main and main)")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=20, help="Number of modules/packages to report")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    reports = [benchmark(module, args.runs, args.top) for module in (args.module or ["app.main", "main"])]
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        for report in reports:
+            print_report(report)
+
+
+if __name__ == "__main__":
+    main()
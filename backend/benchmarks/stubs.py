@@ -0,0 +1,287 @@
+"""
+Stand-in backends for load testing: an OpenAI-compatible API, LM Studio,
+web search with result pages, a Pinecone data plane, YouTube transcripts and
+the bundled lecture PDFs, all from one local server with configurable latency
+and token rates. Nothing here calls a paid API.
+
+Routes:
+    /openai/v1/...          chat completions (streaming or not, with prompt caching), embeddings, models
+    /lmstudio/v1/...        chat completions (with <think> blocks), models
+    /search, /page/{n}      search results (DDGS format) and the pages they link to
+    /vectors/upsert, /query, /vectors/delete, /describe_index_stats   Pinecone data plane
+    /youtube/{video_id}     transcript segments
+    /pdf/{name}             PDFs from data/andrewng/ml
+
+Usage (from the backend directory):
+    python -m benchmarks.stubs --port 8900 --local-tps 30 --openai-ttfb 0.4
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+PDF_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "andrewng", "ml")
+
+EMBEDDING_DIMENSION = 1536
+
+# OpenAI caches prompt prefixes of at least 1024 tokens, in steps of 128 tokens
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_BLOCK_TOKENS = 128
+
+DEFAULT_CONFIG = {
+    "local_ttfb": 0.5,  # Seconds before the first token
+    "local_tps": 40.0,  # Tokens per second after the first
+    "openai_ttfb": 0.3,
+    "openai_tps": 80.0,
+    "completion_tokens": 200,
+    "embed_latency": 0.05,  # Seconds per embeddings request
+    "search_latency": 0.3,  # Seconds per search query
+    "page_latency": 0.1,  # Seconds per result page
+    "vector_latency": 0.02,  # Seconds per Pinecone call
+    "youtube_latency": 0.3,  # Seconds per transcript fetch
+    "transcript_segments": 600,
+}
+
+LECTURE_SENTENCES = [
+    "Let's start with the intuition behind gradient descent.",
+    "**Key Concept:** the learning rate controls the size of each step.",
+    "Consider the cost function $J(\\theta) = \\frac{1}{2m}\\sum_i (h_\\theta(x^{(i)}) - y^{(i)})^2$.",
+    "## Linear Regression",
+    "> **Note:** feature scaling often speeds up convergence.",
+    "What would happen if we doubled the learning rate?",
+    "In practice, we monitor the cost on a validation set.",
+    "**Example:** predicting house prices from their size in square feet.",
+]
+
+
+def _completion_words(count: int, local: bool) -> list:
+    """Deterministic pseudo-lecture text, one word per token."""
+    words = []
+    if local:
+        words += "<think> The student is asking about optimization, so I will build up from the cost function. </think>".split()
+    sentence = 0
+    while len(words) < count:
+        words += LECTURE_SENTENCES[sentence % len(LECTURE_SENTENCES)].split() + ["\n"]
+        sentence += 1
+    return words[:count]
+
+
+def _prompt_tokens(body: dict) -> int:
+    # Roughly four characters per token, which is close enough for sizing
+    return sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+
+
+def _cached_tokens(body: dict, cache: set) -> int:
+    """Emulate OpenAI prompt caching: the longest prefix of the messages seen in an earlier request."""
+    text = json.dumps(body.get("messages", []))
+    block = PROMPT_CACHE_BLOCK_TOKENS * 4
+    digest = hashlib.blake2b()
+    cached = 0
+    hit = True
+    for end in range(block, len(text) + 1, block):
+        digest.update(text[end - block:end].encode())
+        key = digest.hexdigest()
+        hit = hit and key in cache
+        if hit:
+            cached = end // 4
+        cache.add(key)
+    return cached if cached >= PROMPT_CACHE_MIN_TOKENS else 0
+
+
+def create_stub_app(config: dict) -> Starlette:
+    """Build the stub server; config keys are those of DEFAULT_CONFIG."""
+    stats = {"requests": 0, "by_route": {}, "prompt_tokens": 0, "cached_tokens": 0}
+    prompt_cache = set()
+
+    def count(name: str):
+        stats["requests"] += 1
+        stats["by_route"][name] = stats["by_route"].get(name, 0) + 1
+
+    async def chat_completions(request: Request, backend: str):
+        count(f"{backend}.chat")
+        body = await request.json()
+        ttfb = config[f"{backend}_ttfb"]
+        tps = config[f"{backend}_tps"]
+        limit = min(body.get("max_tokens") or config["completion_tokens"], config["completion_tokens"])
+        words = _completion_words(limit, backend == "local")
+        usage = {"prompt_tokens": _prompt_tokens(body), "completion_tokens": len(words), "total_tokens": _prompt_tokens(body) + len(words)}
+        if backend == "openai":
+            usage["prompt_tokens_details"] = {"cached_tokens": min(_cached_tokens(body, prompt_cache), usage["prompt_tokens"])}
+            stats["prompt_tokens"] += usage["prompt_tokens"]
+            stats["cached_tokens"] += usage["prompt_tokens_details"]["cached_tokens"]
+        model = "stub-local-model" if backend == "local" else "gpt-4o-mini-stub"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(ttfb + len(words) / tps)
+            return JSONResponse({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+        async def events():
+            await asyncio.sleep(ttfb)
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(1 / tps)
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield f"data: {json.dumps({'id': 'chatcmpl-stub', 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def openai_chat(request: Request):
+        return await chat_completions(request, "openai")
+
+    async def local_chat(request: Request):
+        return await chat_completions(request, "local")
+
+    async def models(request: Request):
+        count("models")
+        return JSONResponse({"object": "list", "data": [{"id": "stub-model", "object": "model", "owned_by": "stub"}]})
+
+    async def embeddings(request: Request):
+        count("embeddings")
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(config["embed_latency"])
+        rng = random.Random(len(inputs))
+        vector = [rng.uniform(-1, 1) for _ in range(EMBEDDING_DIMENSION)]
+        return JSONResponse({
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": vector} for i in range(len(inputs))],
+            "model": body.get("model", "text-embedding-ada-002"),
+            "usage": {"prompt_tokens": 10 * len(inputs), "total_tokens": 10 * len(inputs)}
+        })
+
+    async def search(request: Request):
+        count("search")
+        await asyncio.sleep(config["search_latency"])
+        query = request.query_params.get("q", "")
+        max_results = int(request.query_params.get("max_results", 4))
+        base = str(request.base_url).rstrip("/")
+        offset = abs(hash(query)) % 1000
+        return JSONResponse([
+            {
+                "title": f"{query} - result {i}",
+                "href": f"{base}/page/{offset + i}" + ("?site=arxiv.org" if i % 2 == 0 else ""),
+                "body": f"An overview of {query} covering definitions, examples and recent work."
+            }
+            for i in range(max_results)
+        ])
+
+    async def page(request: Request):
+        count("page")
+        await asyncio.sleep(config["page_latency"])
+        n = request.path_params["n"]
+        paragraphs = "".join(f"<p>Paragraph {i} of page {n}: {' '.join(LECTURE_SENTENCES)}</p>" for i in range(8))
+        return HTMLResponse(
+            f"<html><head><title>Research page {n}</title>"
+            f"<meta name=\"description\" content=\"Research notes number {n}\"></head>"
+            f"<body><nav>menu</nav><main>{paragraphs}</main></body></html>"
+        )
+
+    async def vectors_upsert(request: Request):
+        count("pinecone.upsert")
+        body = await request.json()
+        await asyncio.sleep(config["vector_latency"])
+        return JSONResponse({"upsertedCount": len(body.get("vectors", []))})
+
+    async def vectors_query(request: Request):
+        count("pinecone.query")
+        body = await request.json()
+        await asyncio.sleep(config["vector_latency"])
+        matches = [
+            {"id": f"chunk-{i}", "score": 0.9 - i * 0.05, "metadata": {"text": LECTURE_SENTENCES[i % len(LECTURE_SENTENCES)]}}
+            for i in range(body.get("topK", 3))
+        ]
+        return JSONResponse({"matches": matches, "namespace": body.get("namespace", "")})
+
+    async def vectors_delete(request: Request):
+        count("pinecone.delete")
+        await asyncio.sleep(config["vector_latency"])
+        return JSONResponse({})
+
+    async def describe_index_stats(request: Request):
+        count("pinecone.stats")
+        return JSONResponse({"dimension": EMBEDDING_DIMENSION, "indexFullness": 0.0, "totalVectorCount": 0, "namespaces": {}})
+
+    async def youtube(request: Request):
+        count("youtube")
+        await asyncio.sleep(config["youtube_latency"])
+        segments = [
+            {"text": LECTURE_SENTENCES[i % len(LECTURE_SENTENCES)], "start": i * 4.2, "duration": 4.0}
+            for i in range(config["transcript_segments"])
+        ]
+        return JSONResponse(segments)
+
+    async def pdf(request: Request):
+        count("pdf")
+        path = os.path.join(PDF_DIR, os.path.basename(request.path_params["name"]))
+        if not os.path.exists(path):
+            return Response(status_code=404)
+        return FileResponse(path, media_type="application/pdf")
+
+    async def stub_stats(request: Request):
+        return JSONResponse(stats)
+
+    return Starlette(routes=[
+        Route("/openai/v1/chat/completions", openai_chat, methods=["POST"]),
+        Route("/openai/v1/embeddings", embeddings, methods=["POST"]),
+        Route("/openai/v1/models", models),
+        Route("/lmstudio/v1/chat/completions", local_chat, methods=["POST"]),
+        Route("/lmstudio/v1/models", models),
+        Route("/search", search),
+        Route("/page/{n}", page),
+        Route("/vectors/upsert", vectors_upsert, methods=["POST"]),
+        Route("/query", vectors_query, methods=["POST"]),
+        Route("/vectors/delete", vectors_delete, methods=["POST"]),
+        Route("/describe_index_stats", describe_index_stats, methods=["GET", "POST"]),
+        Route("/youtube/{video_id}", youtube),
+        Route("/pdf/{name}", pdf),
+        Route("/__stats", stub_stats),
+    ])
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    """Add a --flag for every stub setting (e.g. --local-tps)."""
+    for key, default in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(default), default=default)
+
+
+def config_from_args(args: argparse.Namespace) -> dict:
+    return {key: getattr(args, key) for key in DEFAULT_CONFIG}
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run stand-in LLM, search, vector-store and YouTube backends")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_stub_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Delete vectors in the uploaded-documents namespace that no document owns.
+
+add_to_rag records every vector ID it writes in the per-document manifest
+(RAG_MANIFEST_PATH) before upserting it, and remove_from_rag deletes a
+document's vectors by those IDs. Vectors can still be orphaned: by a
+manifest that was lost or reset, or by another app instance writing to the
+same namespace with its own manifest. This lists every ID in the namespace,
+compares it with the manifest and deletes the ones nobody owns.
+
+Listing IDs needs a serverless index. Run it with the manifest of the app
+that writes to the namespace.
+
+Usage (from the backend directory):
+    python gc_vectors.py --dry-run
+    python gc_vectors.py
+    python gc_vectors.py --manifest /srv/tutorai/rag_manifest.json --namespace documents
+"""
+import argparse
+import os
+import time
+from app.config.settings import RAG_NAMESPACE, RAG_MANIFEST_PATH, INDEX_NAME
+from app.services.client_registry import registry
+from app.services.vector_service import delete_vectors, find_orphans
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete orphaned vectors from the uploaded-documents namespace")
+    parser.add_argument("--manifest", default=RAG_MANIFEST_PATH, help="Per-document manifest of the app")
+    parser.add_argument("--index", default=INDEX_NAME, help="Pinecone index (default: INDEX_NAME)")
+    parser.add_argument("--namespace", default=RAG_NAMESPACE, help="Namespace to scan (default: RAG_NAMESPACE)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the orphaned vectors")
+    args = parser.parse_args()
+
+    if not args.namespace:
+        # The default namespace holds the lecture corpus, which the manifest does not cover
+        parser.error("refusing to scan the default namespace; pass the namespace uploaded documents are written to")
+    if not os.path.exists(args.manifest):
+        parser.error(f"no manifest at {args.manifest}; every vector would look orphaned")
+
+    index = registry.get_index(args.index)
+    started = time.perf_counter()
+    result = find_orphans(index, args.index, args.namespace, args.manifest)
+    orphans = result["orphans"]
+    print(f"{result['listed']} vectors in {args.index}/{args.namespace}, {len(orphans)} orphaned")
+    for vector_id in orphans[:20]:
+        print(f"  {vector_id}")
+    if len(orphans) > 20:
+        print(f"  ... and {len(orphans) - 20} more")
+
+    if args.dry_run or not orphans:
+        return
+    deleted = delete_vectors(index, orphans, args.namespace)
+    print(f"Deleted {deleted} vectors in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
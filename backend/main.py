@@ -1,42 +1,81 @@
-from openai import OpenAI
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import requests
 import os
 from dotenv import load_dotenv
 from typing import Optional, AsyncGenerator, Dict, Any
-from bs4 import BeautifulSoup
-from duckduckgo_search import DDGS
 from urllib.parse import urlparse, parse_qs
 import re
 import json
-from fastapi.responses import StreamingResponse
-import httpx
-import PyPDF2
+from fastapi.responses import StreamingResponse, Response
 import io
 import tempfile
-import pdfplumber
 import uuid
-import io
-import json
-import tempfile
 import random
 import string
 import time
-from youtube_transcript_api import YouTubeTranscriptApi
 import asyncio
-import re
+from app.utils.log import get_logger
+from app.utils.metrics import track_stage, LLMTimer, record_tokens, render_metrics
 
-from pinecone import Pinecone
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from openai import OpenAI
+# OpenAI, Pinecone, LangChain, PDF, search and YouTube libraries are imported
+# lazily where they are used, so a new instance can start serving quickly
 
 
 load_dotenv()
 
-app = FastAPI()
+logger = get_logger("legacy")
+
+# API clients, built by the lifespan hook at startup (or on first use)
+client = None
+pc = None
+indexes = {}
+embedder = None
+
+def get_openai_client():
+    """Get the shared OpenAI client, creating it on first use."""
+    global client
+    if client is None:
+        from openai import OpenAI
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return client
+
+def get_pinecone():
+    """Get the shared Pinecone client, creating it on first use."""
+    global pc
+    if pc is None:
+        from pinecone import Pinecone
+        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    return pc
+
+def get_index(name: Optional[str] = None):
+    """Get a cached Pinecone index handle (the default index if no name is given)."""
+    name = name or os.getenv("INDEX_NAME")
+    if name not in indexes:
+        indexes[name] = get_pinecone().Index(name)
+    return indexes[name]
+
+def get_embedder():
+    """Get the shared OpenAI embeddings client, creating it on first use."""
+    global embedder
+    if embedder is None:
+        from langchain_openai import OpenAIEmbeddings
+        embedder = OpenAIEmbeddings()
+    return embedder
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build API clients at startup rather than at import time"""
+    if os.getenv("PRELOAD_CLIENTS", "true").lower() == "true":
+        if os.getenv("OPENAI_API_KEY"):
+            get_openai_client()
+            get_embedder()
+        if os.getenv("PINECONE_API_KEY") and os.getenv("INDEX_NAME"):
+            get_index()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/")
 async def root():
@@ -97,23 +136,21 @@ class YoutubeChatRequest(BaseModel):
     message: str
     previous_messages: list = []
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 # LM Studio typically runs on localhost:1234
 LM_STUDIO_URL = "http://127.0.0.1:1234/v1/chat/completions"
 LM_STUDIO_HEADERS = {
     "Content-Type": "application/json"
 }
 
-# Initialize pinecone
-pc = Pinecone(
-    api_key=os.getenv("PINECONE_API_KEY")
-)
-index = pc.Index(os.getenv("INDEX_NAME"))
-embedder = OpenAIEmbeddings()
+# Uploaded documents are written to this namespace, apart from the lecture corpus in the default one
+RAG_NAMESPACE = os.getenv("RAG_NAMESPACE", "documents")
 
+@track_stage("web_search")
 async def get_web_search_results(query: str, professor: dict, num_results: int = 5):
+    import requests
+    from bs4 import BeautifulSoup
+    from duckduckgo_search import DDGS
+    
     try:
         ddgs = DDGS()
         
@@ -204,7 +241,7 @@ async def get_web_search_results(query: str, professor: dict, num_results: int =
                             # Skip this result if we can't fetch the page
                             continue
                 except Exception as e:
-                    print(f"Error processing search result: {e}")
+                    logger.warning("Error processing search result", url=result.get('href'), error=str(e), sample=0.1)
                     continue
             
             if len(formatted_results) >= num_results * 3:
@@ -232,7 +269,7 @@ async def get_web_search_results(query: str, professor: dict, num_results: int =
         return search_context, top_results
         
     except Exception as e:
-        print(f"Error in web search: {e}")
+        logger.error("Error in web search", query=query, error=str(e))
         return "", []
             
 # Add this function to ensure thinking tags are properly formatted
@@ -282,6 +319,7 @@ def process_thinking_content(content: str) -> Dict[str, Any]:
         }
 
 # Add this utility function for processing lecture responses
+@track_stage("lecture_formatting")
 def process_lecture_formatting(response_text: str) -> dict:
     """
     Process lecture-style responses to enhance the classroom experience
@@ -370,6 +408,7 @@ def process_lecture_formatting(response_text: str) -> dict:
         "lecture_components": lecture_components
     }
 
+@track_stage("retrieval")
 async def get_relevant_lecture_content(query: str, professor: Professor, top_k: int = 3):
     """Get relevant lecture content from professor-specific lectures."""
     try:
@@ -386,27 +425,35 @@ async def get_relevant_lecture_content(query: str, professor: Professor, top_k:
             return ""
             
         # Get the correct index for this professor
-        professor_index = pc.Index(professor_indices[professor.name])
+        professor_index = get_index(professor_indices[professor.name])
         
         # Create embedding for the query
-        query_embedding = embedder.embed_query(query)
+        query_embedding = get_embedder().embed_query(query)
+        
+        # Search Pinecone: the lecture corpus in the default namespace and documents added with /add_to_rag/ in RAG_NAMESPACE
+        def search(namespace: str):
+            return professor_index.query(
+                vector=query_embedding,
+                top_k=top_k,
+                include_metadata=True,
+                namespace=namespace
+            )['matches']
         
-        # Search Pinecone
-        search_results = professor_index.query(
-            vector=query_embedding,
-            top_k=top_k,
-            include_metadata=True
+        corpus_matches, document_matches = await asyncio.gather(
+            asyncio.to_thread(search, ""),
+            asyncio.to_thread(search, RAG_NAMESPACE)
         )
+        matches = sorted(corpus_matches + document_matches, key=lambda match: match['score'], reverse=True)[:top_k]
         
         # Format results
         context = f"Relevant content from Professor {professor.name}'s lectures:\n\n"
-        for i, match in enumerate(search_results['matches'], 1):
+        for i, match in enumerate(matches, 1):
             if match['score'] > 0.7:  # Only include highly relevant matches
                 context += f"[Lecture Extract {i}]: {match['metadata']['text']}\n\n"
         
         return context
     except Exception as e:
-        print(f"Error getting lecture content: {str(e)}")
+        logger.error("Error getting lecture content", professor=professor.name, error=str(e))
         return ""
 
 @app.post("/api/chat")
@@ -507,7 +554,7 @@ You specialize in providing {request.professor.adviceType} to students.
         citations = []
         
         if request.enable_search:
-            print(f"Web search enabled for query: '{request.message}'")
+            logger.info("Web search enabled", query=request.message)
             search_context, search_results = await get_web_search_results(
                 query=request.message,
                 professor={
@@ -545,9 +592,9 @@ You specialize in providing {request.professor.adviceType} to students.
         
 
         if request.model_type == "local":
+            import requests
+            
             try:
-                print("Attempting LM Studio request...")
-                
                 payload = {
                     "messages": [
                         {"role": "system", "content": base_system_message},
@@ -558,20 +605,22 @@ You specialize in providing {request.professor.adviceType} to students.
                     "stream": False
                 }
                 
-                print(f"Sending payload to LM Studio: {payload}")
+                logger.debug("Sending request to LM Studio", payload=payload)
                 
                 # Increased timeout to 120 seconds
-                response = requests.post(
-                    LM_STUDIO_URL, 
-                    json=payload,
-                    headers=LM_STUDIO_HEADERS,
-                    timeout=120  # Increased from 30 to 120 seconds
-                )
+                with LLMTimer("local"):
+                    response = requests.post(
+                        LM_STUDIO_URL, 
+                        json=payload,
+                        headers=LM_STUDIO_HEADERS,
+                        timeout=120  # Increased from 30 to 120 seconds
+                    )
                 
-                print(f"LM Studio response status: {response.status_code}")
+                logger.debug("LM Studio responded", status_code=response.status_code)
                 
                 if response.status_code == 200:
                     response_json = response.json()
+                    record_tokens(response_json.get("model", "local"), request.professor.name, response_json.get("usage"))
                     raw_response = response_json["choices"][0]["message"]["content"]
                     
                     # Process thinking content for local models
@@ -584,19 +633,19 @@ You specialize in providing {request.professor.adviceType} to students.
                     }
                 else:
                     error_msg = f"LM Studio error: Status {response.status_code}, Response: {response.text}"
-                    print(error_msg)
+                    logger.error("LM Studio error", status_code=response.status_code, response=response.text)
                     raise HTTPException(status_code=500, detail=error_msg)
                     
             except requests.exceptions.Timeout:
                 error_msg = "LM Studio request timed out. The model might be taking too long to generate a response."
-                print(error_msg)
+                logger.error("LM Studio request timed out")
                 raise HTTPException(status_code=504, detail=error_msg)
             except requests.exceptions.ConnectionError as e:
                 error_msg = "Could not connect to LM Studio. Please ensure it's running and the model is loaded."
-                print(f"Connection error: {str(e)}")
+                logger.error("Could not connect to LM Studio", error=str(e))
                 raise HTTPException(status_code=500, detail=error_msg)
             except Exception as e:
-                print(f"Unexpected LM Studio error: {str(e)}")
+                logger.exception("Unexpected LM Studio error", error=str(e))
                 raise HTTPException(status_code=500, detail=f"LM Studio error: {str(e)}")
                 
         elif request.model_type == "openai":
@@ -606,11 +655,13 @@ You specialize in providing {request.professor.adviceType} to students.
                     {"role": "user", "content": request.message}
                 ]
                 
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",  # Using a more capable model
-                    messages=messages,
-                    temperature=0.85
-                )
+                with LLMTimer("openai"):
+                    response = get_openai_client().chat.completions.create(
+                        model="gpt-4o-mini",  # Using a more capable model
+                        messages=messages,
+                        temperature=0.85
+                    )
+                record_tokens(response.model, request.professor.name, response.usage)
                 
                 # Format citations in a more readable way for the frontend
                 if search_results:
@@ -635,13 +686,19 @@ You specialize in providing {request.professor.adviceType} to students.
                         "lecture_components": lecture_processed["lecture_components"]
                     }
             except Exception as e:
-                print(f"OpenAI error: {str(e)}")
+                logger.error("OpenAI error", error=str(e))
                 raise HTTPException(status_code=500, detail=f"OpenAI error: {str(e)}")
             
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
+        logger.exception("Unexpected error in chat", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Expose metrics in the Prometheus text format"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # Add knowledge graph endpoint
 @app.get("/api/knowledge-graph")
 async def get_knowledge_graph(concept: Optional[str] = None):
@@ -656,18 +713,23 @@ class DocumentChatRequest(BaseModel):
     document_url: str
     document_title: str
     message: str
-    previous_messages: list = []
+    session_id: Optional[str] = None
+    previous_messages: list = []  # Deprecated: seeds a new session when there is no session_id
 
 # Add this function to extract text from PDF URLs
+@track_stage("pdf_extraction")
 async def extract_text_from_pdf_url(pdf_url):
+    import requests
+    import PyPDF2
+    import pdfplumber
+    
     try:
-        print(f"Downloading PDF from URL: {pdf_url}")
+        logger.debug("Downloading PDF", url=pdf_url)
         response = requests.get(pdf_url)
         response.raise_for_status()  # Check if download was successful
         
         # Method 1: Try with PyPDF2 first
         try:
-            print("Extracting text using PyPDF2...")
             pdf_content = io.BytesIO(response.content)
             pdf_reader = PyPDF2.PdfReader(pdf_content)
             
@@ -679,10 +741,9 @@ async def extract_text_from_pdf_url(pdf_url):
             if text.strip():
                 return text
         except Exception as e:
-            print(f"PyPDF2 extraction failed: {e}")
+            logger.warning("PyPDF2 extraction failed, trying pdfplumber", url=pdf_url, error=str(e))
         
         # Method 2: Try with pdfplumber if PyPDF2 fails or returns empty text
-        print("Extracting text using pdfplumber...")
         with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
             temp_file.write(response.content)
             temp_file_path = temp_file.name
@@ -696,20 +757,26 @@ async def extract_text_from_pdf_url(pdf_url):
         
         return text
     except Exception as e:
-        print(f"Error extracting text from PDF: {e}")
+        logger.error("Error extracting text from PDF", url=pdf_url, error=str(e))
         return f"Error extracting text from PDF: {str(e)}"
 
 # Update the document_chat endpoint
 @app.post("/api/document-chat")
 async def document_chat(request: DocumentChatRequest):
+    from app.services.session_service import open_session, session_history, record_turn
+
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # The conversation is kept on the server; previous_messages only seeds a new session
+        session = open_session(request.session_id, "document", request.document_id, request.previous_messages)
         
         # Download and extract text from the PDF
         document_text = await extract_text_from_pdf_url(request.document_url)
         
         if not document_text or document_text.startswith("Error"):
-            return {"response": "I couldn't extract text from this document. The PDF might be scanned, password-protected, or in an unsupported format."}
+            return {
+                "response": "I couldn't extract text from this document. The PDF might be scanned, password-protected, or in an unsupported format.",
+                "session_id": session["id"]
+            }
         
         # Truncate text if too long
         max_chars = 100000  # Adjust based on token limits
@@ -747,9 +814,8 @@ RESPONSE FORMAT:
             {"role": "system", "content": classroom_system_prompt}
         ]
         
-        # Add previous conversation context
-        for msg in request.previous_messages:
-            messages.append({"role": msg["role"], "content": msg["content"]})
+        # Add the conversation so far: its summary and the most recent turns
+        messages.extend(session_history(session))
         
         # Add the document content and user's question
         messages.append({
@@ -758,25 +824,31 @@ RESPONSE FORMAT:
         })
         
         # Get response from OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Using a more capable model for document analysis
-            messages=messages,
-            temperature=0.7,
-            max_tokens=1000
-        )
+        with LLMTimer("openai"):
+            response = get_openai_client().chat.completions.create(
+                model="gpt-4o-mini",  # Using a more capable model for document analysis
+                messages=messages,
+                temperature=0.7,
+                max_tokens=1000
+            )
+        record_tokens(response.model, None, response.usage)
         
         response_text = response.choices[0].message.content
+        record_turn(session, request.message, response_text)
         
         # Process for lecture formatting
         lecture_processed = process_lecture_formatting(response_text)
         
         return {
+            "session_id": session["id"],
             "response": lecture_processed["formatted_text"],
             "lecture_components": lecture_processed["lecture_components"]
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in document_chat: {str(e)}")
+        logger.error("Error in document chat", error=str(e))
         raise HTTPException(status_code=500, detail=f"Error processing document chat: {str(e)}")
 
 # Initialize storage for availabilities and bookings (in-memory for demo purposes)
@@ -814,15 +886,16 @@ async def add_professor_availability(availability: ProfessorAvailability):
     }
 
 @app.get("/api/professor/availability")
-async def get_professor_availabilities(professor_name: Optional[str] = None):
-    if professor_name:
-        # Filter availabilities by professor name
-        filtered_availabilities = [a for a in professor_availabilities 
-                                  if a["professor_name"] == professor_name]
-        return {"availabilities": filtered_availabilities}
-    
-    # Return all availabilities if no professor name provided
-    return {"availabilities": professor_availabilities}
+async def get_professor_availabilities(professor_name: Optional[str] = None, date_from: Optional[str] = None,
+                                       is_booked: Optional[bool] = None):
+    # Filter by professor name, earliest date and booked status, as the modular app does; ISO dates compare correctly as strings
+    filtered_availabilities = [
+        a for a in professor_availabilities
+        if (not professor_name or a["professor_name"] == professor_name)
+        and (date_from is None or a["date"] >= date_from)
+        and (is_booked is None or a["is_booked"] == is_booked)
+    ]
+    return {"availabilities": filtered_availabilities}
 
 @app.post("/api/student/book-meeting")
 async def book_meeting(booking: MeetingBooking):
@@ -911,7 +984,7 @@ async def cancel_booking(booking_id: str):
     }
 
 # Create document storage directory if it doesn't exist
-UPLOAD_DIR = "uploads"
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # Document storage (would be a database in production)
@@ -936,6 +1009,8 @@ async def upload_document(
     Upload a document for classroom use or process a YouTube URL.
     Supports PDF, DOCX, TXT, and other educational materials.
     """
+    import pdfplumber
+    
     try:
         document_id = str(uuid.uuid4())
         
@@ -1042,7 +1117,7 @@ async def upload_document(
             raise HTTPException(status_code=400, detail="No file or YouTube URL provided")
     
     except Exception as e:
-        print(f"Error in document upload: {str(e)}")
+        logger.error("Error in document upload", error=str(e))
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 @app.get("/api/documents")
@@ -1062,8 +1137,6 @@ async def get_document(document_id: str):
 @app.post("/api/youtube-chat")
 async def youtube_chat(request: YoutubeChatRequest):
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
         # Fetch YouTube transcript (simplified here)
         transcript_text = get_youtube_transcript(request.youtube_url)
         
@@ -1117,12 +1190,14 @@ RESPONSE FORMAT:
         })
         
         # Get response from OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Using a more capable model for video analysis
-            messages=messages,
-            temperature=0.7,
-            max_tokens=1000
-        )
+        with LLMTimer("openai"):
+            response = get_openai_client().chat.completions.create(
+                model="gpt-4o-mini",  # Using a more capable model for video analysis
+                messages=messages,
+                temperature=0.7,
+                max_tokens=1000
+            )
+        record_tokens(response.model, None, response.usage)
         
         response_text = response.choices[0].message.content
         
@@ -1135,7 +1210,7 @@ RESPONSE FORMAT:
         }
     
     except Exception as e:
-        print(f"Error in youtube_chat: {str(e)}")
+        logger.error("Error in YouTube chat", error=str(e))
         raise HTTPException(status_code=500, detail=f"Error processing YouTube chat: {str(e)}")
 
 def get_youtube_transcript(youtube_url: str) -> str:
@@ -1148,6 +1223,8 @@ def get_youtube_transcript(youtube_url: str) -> str:
     Returns:
         Transcript text or error message
     """
+    from youtube_transcript_api import YouTubeTranscriptApi
+    
     try:
         # Extract video ID from URL
         parsed_url = urlparse(youtube_url)
@@ -1178,51 +1255,38 @@ def get_youtube_transcript(youtube_url: str) -> str:
         return formatted_transcript
         
     except Exception as e:
-        print(f"Error extracting YouTube transcript: {str(e)}")
+        logger.error("Error extracting YouTube transcript", youtube_url=youtube_url, error=str(e))
         return f"Error: {str(e)}"
 
 @app.post("/add_to_rag/")
-async def add_to_rag(file: UploadFile = File(...)):
-    contents = await file.read()
+async def add_to_rag(file: UploadFile = File(...), document_id: Optional[str] = Form(None)):
+    from app.services.vector_service import add_document
 
-    pdf_reader = PyPDF2.PdfReader(file.file)
-    text = "\n".join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
+    # The PDF is read page by page from the spooled upload and upserted in batches, so memory does not grow with its size.
+    # Its vector IDs are recorded under document_id, so /remove_from_rag/ can delete them
+    result = await add_document(file.file, file.filename, document_id or str(uuid.uuid4()), os.getenv("INDEX_NAME"),
+                                get_index, get_embedder())
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    chunks = text_splitter.split_text(text)
-
-    embeddings = embedder.embed_documents(chunks)
-
-    upsert_data = [
-        (str(uuid.uuid4()), embedding, {"text": chunk})
-        for chunk, embedding in zip(chunks, embeddings)
-    ]
-    index.upsert(upsert_data)
-
-    return {"message": f"Added {len(chunks)} chunks from {file.filename} to RAG"}
+    return {"message": f"Added {result['chunks']} chunks from {file.filename} to RAG", "document_id": result["document_id"]}
 
 class RemoveFromRAGRequest(BaseModel):
     document_id: str
-    file_path: str
+    file_path: Optional[str] = None
     title: Optional[str] = None
 
 @app.post("/remove_from_rag/")
 async def remove_from_rag(request: RemoveFromRAGRequest):
+    from app.services.vector_service import remove_document
+
     try:
-        # Print information about the request
-        print(f"Removing document from RAG: {request.document_id}, {request.file_path}")
-        
-        # For now, we'll just acknowledge the request
-        # In a real implementation, you would:
-        # 1. Use the document_id to fetch metadata from your vector store
-        # 2. Delete all vectors associated with this document
-        
-        # Placeholder for actual implementation
-        # index.delete(filter={"document_id": request.document_id})
-        
-        return {"message": f"Document {request.document_id} ({request.title or request.file_path}) removed from RAG system"}
+        logger.info("Removing document from RAG", document_id=request.document_id, file_path=request.file_path)
+        result = await remove_document(request.document_id, get_index)
+        return {
+            "message": f"Document {request.document_id} ({request.title or request.file_path}) removed from RAG system",
+            **result
+        }
     except Exception as e:
-        print(f"Error removing document from RAG: {str(e)}")
+        logger.error("Error removing document from RAG", document_id=request.document_id, error=str(e))
         raise HTTPException(status_code=500, detail=f"Failed to remove document: {str(e)}")
 
 if __name__ == "__main__":
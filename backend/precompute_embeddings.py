@@ -1,52 +1,487 @@
+"""
+Embed the lecture PDFs in data/andrewng/ml into the Pinecone index, incrementally.
+
+A manifest next to the PDFs records, for each file, its SHA-256, the IDs of
+the vectors made from it and the embedding model and chunking used. A run
+only embeds files that are new or changed (or were embedded with another
+model or chunking), and deletes the vectors of changed and removed files.
+Progress is checkpointed to the manifest as batches are upserted, so an
+interrupted run resumes where it stopped. Vector IDs are built from the file
+name, file hash and chunk number, so upserting a batch again overwrites it
+instead of adding duplicates.
+
+Files go through a pipeline: a process pool extracts and splits PDFs,
+embedding threads embed batches of chunks and upsert threads write them to
+the index. The stages are connected by bounded queues, so extraction never
+runs far ahead of the network while every core and several API calls stay
+busy.
+
+Usage (from the backend directory):
+    python precompute_embeddings.py
+    python precompute_embeddings.py --dry-run
+    python precompute_embeddings.py --rebuild
+    python precompute_embeddings.py --folder data/newprof --workers 8 --embed-concurrency 8
+"""
+import argparse
+import hashlib
+import json
 import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import quote
 from pinecone import Pinecone
-from langchain_community.embeddings import OpenAIEmbeddings 
+from langchain_openai import OpenAIEmbeddings
 import PyPDF2
 from dotenv import load_dotenv
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import uuid
+from app.config.settings import RAG_CHUNK_TOKENS, RAG_CHUNK_OVERLAP_TOKENS
+from app.utils.chunking import chunk_pages, get_token_counter
+from app.services.ingest_service import chunk_metadata
 
 load_dotenv()
 
-pc = Pinecone(
-    api_key=os.getenv("PINECONE_API_KEY")
-)
-
-index = pc.Index(os.getenv("INDEX_NAME"))
-embedder = OpenAIEmbeddings()
-
 # Path to the ML transcripts
 ML_TRANSCRIPTS_FOLDER = "data/andrewng/ml"
+MANIFEST_NAME = ".embeddings_manifest.json"
+
+# Same settings as add_to_rag; changing them (or the tokenizer counting them) re-embeds every file
+CHUNKING = {
+    "chunker": "chunk_pages",
+    "max_tokens": RAG_CHUNK_TOKENS,
+    "overlap_tokens": RAG_CHUNK_OVERLAP_TOKENS,
+    "tokenizer": get_token_counter().name
+}
+
+EMBED_BATCH_SIZE = 100  # Chunks per embedding call and upsert
+DELETE_BATCH_SIZE = 1000  # Pinecone's limit on IDs per delete call
+CHECKPOINT_SECONDS = 5  # Longest time between manifest checkpoints while a file is in progress
+PROGRESS_SECONDS = 2  # Time between progress lines
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path):
+    """SHA-256 of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(name, sha256, number):
+    """Deterministic vector ID for chunk `number` of one version of a file."""
+    return f"{quote(name, safe='')}#{sha256[:16]}#{number:05d}"
+
+
+def load_manifest(path, index_name):
+    """Read the manifest, or start an empty one if it is missing or belongs to another index."""
+    if os.path.exists(path):
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get("index") == index_name and manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+        print(f"Manifest {path} is for index {manifest.get('index')!r}, starting a new one for {index_name!r}")
+    return {"version": MANIFEST_VERSION, "index": index_name, "files": {}, "in_progress": {}, "pending_deletes": []}
+
+
+def save_manifest(manifest, path):
+    """Write the manifest atomically, so a crash never leaves it half written."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, path)
+
 
 def process_pdf(file_path):
-    """Extract text from a PDF file."""
+    """
+    Extract text from a PDF file.
+
+    Returns:
+        List of (page number, text) tuples
+    """
     reader = PyPDF2.PdfReader(file_path)
-    text = " ".join([page.extract_text() for page in reader.pages if page.extract_text()])
-    return text
+    return [(number, page.extract_text() or "") for number, page in enumerate(reader.pages, start=1)]
+
+
+def extract_chunks(pdf_path):
+    """
+    Extract and split one PDF. Runs in the extraction process pool.
+
+    Returns:
+        Tuple of (chunk dicts from chunk_pages, number of pages, seconds spent)
+    """
+    started = time.perf_counter()
+    pages = process_pdf(pdf_path)
+    chunks = list(chunk_pages(pages, CHUNKING["max_tokens"], CHUNKING["overlap_tokens"]))
+    return chunks, len(pages), time.perf_counter() - started
+
+
+def is_current(entry, sha256, model):
+    """Whether a manifest entry covers this version of the file with the current model and chunking."""
+    return (
+        entry is not None
+        and entry["sha256"] == sha256
+        and entry["embedding_model"] == model
+        and entry["chunking"] == CHUNKING
+    )
+
+
+def flush_deletes(index, manifest, manifest_path):
+    """Delete the vectors queued for deletion, checkpointing after each batch."""
+    deleted = 0
+    while manifest["pending_deletes"]:
+        batch = manifest["pending_deletes"][:DELETE_BATCH_SIZE]
+        index.delete(ids=batch)
+        del manifest["pending_deletes"][:len(batch)]
+        save_manifest(manifest, manifest_path)
+        deleted += len(batch)
+    return deleted
+
+
+class IngestionPipeline:
+    """
+    Extract, embed and upsert files concurrently, keeping the manifest up to date.
+
+    Extraction runs in a process pool; embedding and upserting run in
+    threads, since they wait on the network. Batches of a file may be
+    upserted out of order, so a file's checkpoint is the run of upserted
+    batches from its first chunk: resuming from it may upsert a few batches
+    again, which overwrites them.
+    """
+
+    _DONE = object()  # Tells a stage thread to stop
+
+    def __init__(self, index, embedder, manifest, manifest_path, workers, embed_concurrency, upsert_concurrency,
+                 batch_size, queue_size):
+        self.index = index
+        self.embedder = embedder
+        self.manifest = manifest
+        self.manifest_path = manifest_path
+        self.workers = workers
+        self.embed_concurrency = embed_concurrency
+        self.upsert_concurrency = upsert_concurrency
+        self.batch_size = batch_size
+        self.embed_queue = queue.Queue(maxsize=queue_size)
+        self.upsert_queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()  # Guards the manifest, file states and stats
+        self.failed = threading.Event()
+        self.errors = []
+        self.files = {}  # State of the files whose batches are in flight, by name
+        self.last_checkpoint = 0.0
+        self.stats = {
+            "files": 0, "files_done": 0, "pages": 0, "chunks": 0, "resumed": 0,
+            "embedded": 0, "upserted": 0,
+            "extract_seconds": 0.0, "embed_seconds": 0.0, "upsert_seconds": 0.0
+        }
+
+    def run(self, to_embed):
+        """
+        Run the pipeline over (name, path, sha256) tuples.
+
+        Returns:
+            The stats dictionary, with the total wall time under "wall_seconds"
+        """
+        started = time.perf_counter()
+        self.stats["files"] = len(to_embed)
+        embedders = [threading.Thread(target=self._embed_worker, daemon=True) for _ in range(self.embed_concurrency)]
+        upserters = [threading.Thread(target=self._upsert_worker, daemon=True) for _ in range(self.upsert_concurrency)]
+        stop_progress = threading.Event()
+        reporter = threading.Thread(target=self._report_progress, args=(stop_progress, started), daemon=True)
+        for thread in embedders + upserters + [reporter]:
+            thread.start()
+
+        try:
+            self._extract(to_embed)
+        finally:
+            # Stop each stage once the one before it has drained
+            for _ in embedders:
+                self.embed_queue.put(self._DONE)
+            for thread in embedders:
+                thread.join()
+            for _ in upserters:
+                self.upsert_queue.put(self._DONE)
+            for thread in upserters:
+                thread.join()
+            stop_progress.set()
+            reporter.join()
+            with self.lock:
+                save_manifest(self.manifest, self.manifest_path)
+
+        if self.errors:
+            raise self.errors[0]
+        self.stats["wall_seconds"] = time.perf_counter() - started
+        return self.stats
+
+    def _extract(self, to_embed):
+        """Extract files in the process pool and queue their batches, keeping two files in flight per worker."""
+        pending = iter(to_embed)
+        in_flight = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                while not self.failed.is_set():
+                    while len(in_flight) < self.workers * 2:
+                        item = next(pending, None)
+                        if item is None:
+                            break
+                        in_flight[pool.submit(extract_chunks, item[1])] = item
+                    if not in_flight:
+                        break
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        name, _, sha256 = in_flight.pop(future)
+                        chunks, pages, seconds = future.result()
+                        self._queue_file(name, sha256, chunks, pages, seconds)
+            except BaseException as e:
+                self._fail(e)
+                for future in in_flight:
+                    future.cancel()
+                raise
+
+    def _queue_file(self, name, sha256, chunks, pages, seconds):
+        """Record a file's extraction and put its remaining batches on the embedding queue."""
+        ids = [chunk_id(name, sha256, i) for i in range(len(chunks))]
+        with self.lock:
+            self.stats["pages"] += pages
+            self.stats["chunks"] += len(chunks)
+            self.stats["extract_seconds"] += seconds
+
+            progress = self.manifest["in_progress"].get(name)
+            start = progress["done"] if is_current(progress, sha256, self.embedder.model) else 0
+            if progress and not start:
+                # Vectors upserted for another version of the file, or with other settings; those
+                # whose IDs are reused below are overwritten instead
+                current = set(ids)
+                stale = (chunk_id(name, progress["sha256"], i) for i in range(progress["done"]))
+                self.manifest["pending_deletes"].extend(i for i in stale if i not in current)
+            self.stats["resumed"] += start
+
+            self.files[name] = {"sha256": sha256, "ids": ids, "next": start, "upserted": {}}
+            if start >= len(chunks):
+                self._finish_file(name)
+                return
+
+        for batch_start in range(start, len(chunks), self.batch_size):
+            self._put(self.embed_queue, (name, batch_start, chunks[batch_start:batch_start + self.batch_size]))
+
+    def _put(self, stage_queue, item):
+        """Put an item on a bounded queue, giving up if another stage failed."""
+        while not self.failed.is_set():
+            try:
+                stage_queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _embed_worker(self):
+        while True:
+            item = self.embed_queue.get()
+            if item is self._DONE:
+                return
+            if self.failed.is_set():
+                continue  # Drain without working, so the extractor is never left blocked
+            name, batch_start, batch = item
+            try:
+                started = time.perf_counter()
+                embeddings = self.embedder.embed_documents([chunk["text"] for chunk in batch])
+                with self.lock:
+                    self.stats["embedded"] += len(batch)
+                    self.stats["embed_seconds"] += time.perf_counter() - started
+                self._put(self.upsert_queue, (name, batch_start, batch, embeddings))
+            except Exception as e:
+                self._fail(e)
+
+    def _upsert_worker(self):
+        while True:
+            item = self.upsert_queue.get()
+            if item is self._DONE:
+                return
+            if self.failed.is_set():
+                continue
+            name, batch_start, batch, embeddings = item
+            try:
+                ids = self.files[name]["ids"]
+                started = time.perf_counter()
+                self.index.upsert(vectors=[
+                    (ids[batch_start + i], embedding, {**chunk_metadata(chunk, name, CHUNKING["tokenizer"]), "chunk": batch_start + i})
+                    for i, (chunk, embedding) in enumerate(zip(batch, embeddings))
+                ])
+                with self.lock:
+                    self.stats["upserted"] += len(batch)
+                    self.stats["upsert_seconds"] += time.perf_counter() - started
+                    self._record_batch(name, batch_start, batch_start + len(batch))
+            except Exception as e:
+                self._fail(e)
+
+    def _record_batch(self, name, batch_start, batch_end):
+        """Advance a file's checkpoint past its upserted batches. Called with the lock held."""
+        state = self.files[name]
+        state["upserted"][batch_start] = batch_end
+        while state["next"] in state["upserted"]:
+            state["next"] = state["upserted"].pop(state["next"])
+
+        if state["next"] >= len(state["ids"]):
+            self._finish_file(name)
+            return
+        self.manifest["in_progress"][name] = {
+            "sha256": state["sha256"],
+            "embedding_model": self.embedder.model,
+            "chunking": CHUNKING,
+            "done": state["next"]
+        }
+        if time.monotonic() - self.last_checkpoint >= CHECKPOINT_SECONDS:
+            save_manifest(self.manifest, self.manifest_path)
+            self.last_checkpoint = time.monotonic()
+
+    def _finish_file(self, name):
+        """Move a fully upserted file into the manifest. Called with the lock held."""
+        state = self.files.pop(name)
+        ids = state["ids"]
+        # Vectors of the previous version are deleted once the new ones are in place
+        previous = self.manifest["files"].get(name)
+        if previous:
+            current = set(ids)
+            self.manifest["pending_deletes"].extend(i for i in previous["chunk_ids"] if i not in current)
+        self.manifest["files"][name] = {
+            "sha256": state["sha256"],
+            "embedding_model": self.embedder.model,
+            "chunking": CHUNKING,
+            "chunk_ids": ids,
+            "indexed_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        }
+        self.manifest["in_progress"].pop(name, None)
+        self.stats["files_done"] += 1
+        save_manifest(self.manifest, self.manifest_path)
+        self.last_checkpoint = time.monotonic()
+        print(f"Added {len(ids)} chunks from {name}", flush=True)
+
+    def _fail(self, error):
+        with self.lock:
+            self.errors.append(error)
+        self.failed.set()
+
+    def _report_progress(self, stop, started):
+        while not stop.wait(PROGRESS_SECONDS):
+            with self.lock:
+                stats = dict(self.stats)
+            elapsed = time.perf_counter() - started
+            print(
+                f"[{elapsed:6.1f}s] files {stats['files_done']}/{stats['files']}, "
+                f"chunks extracted {stats['chunks']}, embedded {stats['embedded']}, upserted {stats['upserted']} "
+                f"({stats['upserted'] / elapsed:.0f}/s); waiting: {self.embed_queue.qsize()} batches to embed, "
+                f"{self.upsert_queue.qsize()} to upsert",
+                flush=True
+            )
+
+
+def print_stats(stats):
+    """Per-stage totals and throughput of a finished run."""
+    wall = stats["wall_seconds"]
+
+    def rate(count):
+        return f"{count / wall:.1f}/s" if wall else "-"
+
+    print(f"Wall time {wall:.1f}s")
+    print(
+        f"  extract  {stats['files']} files, {stats['pages']} pages, {stats['chunks']} chunks, "
+        f"{rate(stats['pages'])} pages ({stats['extract_seconds']:.1f}s of worker time)"
+    )
+    print(f"  embed    {stats['embedded']} chunks, {rate(stats['embedded'])} ({stats['embed_seconds']:.1f}s in calls)")
+    print(f"  upsert   {stats['upserted']} vectors, {rate(stats['upserted'])} ({stats['upsert_seconds']:.1f}s in calls)")
+
+
+def plan(folder, manifest, model, rebuild=False):
+    """
+    Compare the folder with the manifest.
+
+    Returns:
+        Tuple of (files to embed as (name, path, sha256), unchanged names, removed names)
+    """
+    to_embed = []
+    unchanged = []
+    on_disk = set()
+    for name in sorted(os.listdir(folder)):
+        if not name.endswith(".pdf"):
+            continue
+        on_disk.add(name)
+        path = os.path.join(folder, name)
+        sha256 = file_sha256(path)
+        if not rebuild and is_current(manifest["files"].get(name), sha256, model):
+            unchanged.append(name)
+        else:
+            to_embed.append((name, path, sha256))
+    removed = sorted((set(manifest["files"]) | set(manifest["in_progress"])) - on_disk)
+    return to_embed, unchanged, removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed new and changed lecture PDFs into the Pinecone index")
+    parser.add_argument("--folder", default=ML_TRANSCRIPTS_FOLDER, help="Folder of PDFs to index")
+    parser.add_argument("--manifest", default=None, help=f"Manifest path (default: {MANIFEST_NAME} in the folder)")
+    parser.add_argument("--rebuild", action="store_true", help="Embed every file again, replacing its vectors")
+    parser.add_argument("--dry-run", action="store_true", help="Show what would be embedded and deleted, then stop")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Extraction processes")
+    parser.add_argument("--embed-concurrency", type=int, default=4, help="Embedding calls in flight")
+    parser.add_argument("--upsert-concurrency", type=int, default=2, help="Upsert calls in flight")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embedding call and upsert")
+    parser.add_argument("--queue-size", type=int, default=16, help="Batches waiting between stages")
+    args = parser.parse_args()
+
+    index_name = os.getenv("INDEX_NAME")
+    manifest_path = args.manifest or os.path.join(args.folder, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path, index_name)
+    embedder = OpenAIEmbeddings()
+
+    to_embed, unchanged, removed = plan(args.folder, manifest, embedder.model, args.rebuild)
+    print(f"{len(to_embed)} to embed, {len(unchanged)} unchanged, {len(removed)} removed")
+    for name, _, _ in to_embed:
+        print(f"  embed   {name}")
+    for name in removed:
+        print(f"  delete  {name}")
+    if args.dry_run:
+        return
+    if not to_embed and not removed and not manifest["pending_deletes"]:
+        print("Index is up to date")
+        return
+
+    pc = Pinecone(
+        api_key=os.getenv("PINECONE_API_KEY")
+    )
+    host = os.getenv("PINECONE_HOST")
+    index = pc.Index(index_name, host=host) if host else pc.Index(index_name)
 
-def store_embeddings(pdf_path):
-    pdf_reader = PyPDF2.PdfReader(pdf_path)
-    text = "\n".join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
+    # Finish deletions an earlier run queued but did not get to
+    deleted = flush_deletes(index, manifest, manifest_path)
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    chunks = text_splitter.split_text(text)
+    for name in removed:
+        entry = manifest["files"].pop(name, None)
+        if entry:
+            manifest["pending_deletes"].extend(entry["chunk_ids"])
+        progress = manifest["in_progress"].pop(name, None)
+        if progress:
+            manifest["pending_deletes"].extend(chunk_id(name, progress["sha256"], i) for i in range(progress["done"]))
+        save_manifest(manifest, manifest_path)
+    deleted += flush_deletes(index, manifest, manifest_path)
 
-    embeddings = embedder.embed_documents(chunks)
+    pipeline = IngestionPipeline(
+        index, embedder, manifest, manifest_path,
+        workers=max(1, args.workers),
+        embed_concurrency=max(1, args.embed_concurrency),
+        upsert_concurrency=max(1, args.upsert_concurrency),
+        batch_size=max(1, args.batch_size),
+        queue_size=max(1, args.queue_size)
+    )
+    stats = pipeline.run(to_embed)
+    deleted += flush_deletes(index, manifest, manifest_path)
 
-    upsert_data = [
-        (str(uuid.uuid4()), embedding, {"text": chunk})
-        for chunk, embedding in zip(chunks, embeddings)
-    ]
-    index.upsert(upsert_data)
+    resumed = f" (resumed after {stats['resumed']} chunks an earlier run upserted)" if stats["resumed"] else ""
+    print(
+        f"Done: {len(to_embed)} files ({stats['upserted']} chunks) embedded{resumed}, "
+        f"{len(unchanged)} unchanged, {deleted} vectors deleted"
+    )
+    print_stats(stats)
 
-    return {"message": f"Added {len(chunks)} chunks from {pdf_path} to RAG"}
 
 if __name__ == "__main__":
-    pdf_files = [os.path.join(ML_TRANSCRIPTS_FOLDER, f) for f in sorted(os.listdir(ML_TRANSCRIPTS_FOLDER)) if f.endswith(".pdf")]
-    
-    if not pdf_files:
-        print("No PDF files found in the ML transcripts folder!")
-    else:
-        for pdf in pdf_files:
-            store_embeddings(pdf)
-        print("All transcripts embedded successfully!")
+    main()
@@ -0,0 +1,120 @@
+"""
+Peak memory of ingest_pdf must not grow with the length of the document.
+
+Run from the backend directory:
+    python -m pytest tests
+"""
+import asyncio
+import random
+import tracemalloc
+
+import pytest
+
+from app.services.ingest_service import ingest_pdf
+
+EMBEDDING_DIMENSION = 1536
+BATCH_SIZE = 20
+
+WORDS = ("gradient descent learning rate loss function training set feature vector weight bias "
+         "regression classification overfitting regularization model parameter cost hypothesis").split()
+
+
+def write_pdf(path, pages: int):
+    """Write a PDF of `pages` pages of seeded random text, one object at a time."""
+    rng = random.Random(pages)
+    offsets = []
+
+    with open(path, "wb") as f:
+        def add(number: int, body: bytes):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        page_refs = b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(pages))
+        add(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        add(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (page_refs, pages))
+        add(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        for i in range(pages):
+            lines = [" ".join(rng.choice(WORDS) for _ in range(12)) + "." for _ in range(40)]
+            text = b"".join(b"(%s) Tj T* " % line.encode("ascii") for line in lines)
+            stream = b"BT /F1 10 Tf 12 TL 50 750 Td " + text + b"ET"
+            add(4 + 2 * i, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                           b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (5 + 2 * i))
+            add(5 + 2 * i, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1))
+        f.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, xref))
+
+
+class StubEmbedder:
+    """Returns fresh float lists per text, as a parsed API response would."""
+
+    async def aembed_documents(self, texts):
+        return [[0.5] * EMBEDDING_DIMENSION for _ in texts]
+
+
+class StubIndex:
+    """Counts upserted vectors and drops them."""
+
+    def __init__(self):
+        self.vectors = 0
+
+    def upsert(self, vectors, namespace=""):
+        self.vectors += len(vectors)
+
+
+def page_tree_size(path) -> int:
+    """Memory PyPDF2 takes to parse a PDF's page tree, which it does up front for any document."""
+    import PyPDF2
+
+    with open(path, "rb") as stream:
+        tracemalloc.start()
+        try:
+            baseline, _ = tracemalloc.get_traced_memory()
+            reader = PyPDF2.PdfReader(stream)
+            len(reader.pages)
+            size, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return size - baseline
+
+
+def ingest_peak(path) -> tuple:
+    """Peak traced memory of one ingestion, and the number of vectors upserted."""
+    index = StubIndex()
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        with open(path, "rb") as stream:
+            asyncio.run(ingest_pdf(stream, "synthetic.pdf", index, StubEmbedder(), batch_size=BATCH_SIZE))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - baseline, index.vectors
+
+
+@pytest.fixture(scope="module")
+def pdfs(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("pdfs")
+    paths = {}
+    for pages in (50, 400):
+        paths[pages] = folder / f"synthetic-{pages}p.pdf"
+        write_pdf(paths[pages], pages)
+    return paths
+
+
+def test_peak_memory_stays_flat_as_pages_grow(pdfs):
+    # Warm up once, so lazily loaded modules and the tokenizer are not counted in the first run
+    ingest_peak(pdfs[50])
+
+    small_peak, small_vectors = ingest_peak(pdfs[50])
+    large_peak, large_vectors = ingest_peak(pdfs[400])
+    assert large_vectors > 6 * small_vectors
+
+    # The page tree is a few KiB per page of PyPDF2 objects, not the document's text;
+    # everything else held at the peak must not grow with eight times the pages
+    small_peak -= page_tree_size(pdfs[50])
+    large_peak -= page_tree_size(pdfs[400])
+    assert large_peak < 1.5 * small_peak, f"peak {small_peak / 2**20:.2f} MiB at 50 pages, {large_peak / 2**20:.2f} MiB at 400"
@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react';
 import { Calendar, User, Mail, FileText } from 'lucide-react';
+import { fetchOpenAvailabilities } from '../lib/availability-api';
 
 interface Availability {
   id: string;
@@ -35,21 +36,8 @@ export default function BookMeetingForm({ professorName, onSuccess }: BookMeetin
   const fetchAvailabilities = async () => {
     try {
       setLoading(true);
-      const url = professorName 
-        ? `/api/professor/availability?professor_name=${encodeURIComponent(professorName)}`
-        : '/api/professor/availability';
-        
-      const response = await fetch(url);
-      
-      if (!response.ok) {
-        throw new Error('Failed to fetch availabilities');
-      }
-      
-      const data = await response.json();
-      // Filter out already booked slots
-      const availableSlots = data.availabilities.filter(
-        (slot: Availability) => !slot.is_booked
-      );
+      // Open slots from today on, every page of them
+      const availableSlots = await fetchOpenAvailabilities<Availability>(professorName);
       
       setAvailabilities(availableSlots);
     } catch (err) {
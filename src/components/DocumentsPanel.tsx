@@ -39,14 +39,24 @@ export default function DocumentsPanel({
     try {
       setLoading(true);
       setError(null);
-      const response = await fetch(API_ENDPOINTS.DOCUMENTS);
-      
-      if (!response.ok) {
-        throw new Error('Failed to fetch documents');
-      }
-      
-      const data = await response.json();
-      setDocuments(data.documents || []);
+      // The list is paged; follow next_cursor until every document is loaded
+      const allDocuments: Document[] = [];
+      let cursor: string | null = null;
+      do {
+        const url = cursor
+          ? `${API_ENDPOINTS.DOCUMENTS}?cursor=${encodeURIComponent(cursor)}`
+          : API_ENDPOINTS.DOCUMENTS;
+        const response = await fetch(url);
+        
+        if (!response.ok) {
+          throw new Error('Failed to fetch documents');
+        }
+        
+        const data = await response.json();
+        allDocuments.push(...(data.documents || []));
+        cursor = data.next_cursor || null;
+      } while (cursor);
+      setDocuments(allDocuments);
     } catch (err) {
       setError('Error loading documents. Please try again.');
       console.error('Error fetching documents:', err);
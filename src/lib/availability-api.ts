@@ -0,0 +1,39 @@
+/**
+ * Get a professor's (or every professor's) open time slots from today on.
+ *
+ * The list endpoint is paged, so next_cursor is followed until every slot is loaded.
+ * The server filters out booked and past slots.
+ */
+export async function fetchOpenAvailabilities<T>(professorName?: string): Promise<T[]> {
+  // Today's local date as YYYY-MM-DD; the server compares ISO dates as strings
+  const now = new Date();
+  const today = [
+    now.getFullYear(),
+    String(now.getMonth() + 1).padStart(2, '0'),
+    String(now.getDate()).padStart(2, '0'),
+  ].join('-');
+
+  const params = new URLSearchParams({ is_booked: 'false', date_from: today });
+  if (professorName) {
+    params.set('professor_name', professorName);
+  }
+
+  const slots: T[] = [];
+  let cursor: string | null = null;
+  do {
+    if (cursor) {
+      params.set('cursor', cursor);
+    }
+    const response = await fetch(`/api/professor/availability?${params}`);
+
+    if (!response.ok) {
+      throw new Error('Failed to fetch availabilities');
+    }
+
+    const data = await response.json();
+    slots.push(...(data.availabilities || []));
+    cursor = data.next_cursor || null;
+  } while (cursor);
+
+  return slots;
+}
@@ -3,6 +3,7 @@ import { Calendar, Clock, User, Mail, Phone, Plus, Trash } from 'lucide-react';
 import BookMeetingForm from '../components/BookMeetingForm';
 import ProfessorAvailabilityForm from '../components/ProfessorAvailabilityForm';
 import MeetingsList from '../components/MeetingsList';
+import { fetchOpenAvailabilities } from '../lib/availability-api';
 
 // Type definition for professor
 interface Professor {
@@ -81,13 +82,9 @@ export default function ProfessorsPage() {
       
       setProfessors(professorsList);
       
-      // Fetch availabilities from the API
+      // Fetch open availabilities from the API
       try {
-        const response = await fetch('/api/professor/availability');
-        if (response.ok) {
-          const data = await response.json();
-          setAvailabilities(data.availabilities);
-        }
+        setAvailabilities(await fetchOpenAvailabilities<Availability>());
       } catch (error) {
         console.error('Error fetching availabilities:', error);
       }
@@ -123,11 +120,7 @@ export default function ProfessorsPage() {
     // Refresh availabilities after setting new ones
     const fetchAvailabilities = async () => {
       try {
-        const response = await fetch('/api/professor/availability');
-        if (response.ok) {
-          const data = await response.json();
-          setAvailabilities(data.availabilities);
-        }
+        setAvailabilities(await fetchOpenAvailabilities<Availability>());
       } catch (error) {
         console.error('Error fetching availabilities:', error);
       }
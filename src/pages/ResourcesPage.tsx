@@ -16,6 +16,7 @@ interface Resource extends Document {
 interface DocumentChat {
   resourceId: string | null;
   isOpen: boolean;
+  sessionId?: string;
   messages: Array<{
     role: 'user' | 'assistant';
     content: string;
@@ -128,6 +129,8 @@ export default function ResourcesPage() {
       //once the file is uplaoded, append it to the RAG
       const formData = new FormData();
       formData.append('file', file);
+      // Vectors are recorded under the document's ID, so deleting the resource removes them from RAG
+      formData.append('document_id', uploadedDocument.id);
 
       //below api is to add the pdf to our RAG
       const response = await fetch("http://localhost:8000/add_to_rag/", {  // Explicit backend URL
@@ -354,7 +357,7 @@ export default function ResourcesPage() {
       console.log('Processing document chat for URL:', documentUrl);
 
       // Call backend API
-      const response = await fetch(API_ENDPOINTS.DOCUMENT_CHAT, {
+      const requestChat = (sessionId?: string) => fetch(API_ENDPOINTS.DOCUMENT_CHAT, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -364,10 +367,19 @@ export default function ResourcesPage() {
           document_url: documentUrl,
           document_title: selectedDocument.title,
           message: newUserMessage.content,
-          previous_messages: documentChat.messages.filter(msg => !msg.isLoading)
+          // The server keeps the conversation under the session ID; the messages only seed a new session
+          session_id: sessionId,
+          previous_messages: sessionId ? undefined : documentChat.messages.filter(msg => !msg.isLoading)
         }),
       });
 
+      let response = await requestChat(documentChat.sessionId);
+      if (response.status === 404 && documentChat.sessionId) {
+        // The session expired or was lost on the server: drop it and start a new one
+        setDocumentChat(prev => ({ ...prev, sessionId: undefined }));
+        response = await requestChat();
+      }
+
       const data = await response.json();
 
       if (!response.ok) {
@@ -392,6 +404,7 @@ export default function ResourcesPage() {
         
         return {
           ...prev,
+          sessionId: data.session_id,
           messages: updatedMessages
         };
       });